@@ -0,0 +1,151 @@
+"""Admission control: how much one bot process takes on at once.
+
+A game is admitted when its start button is pressed. While the process is
+at capacity (too many running games, too many sends queued in the effect
+executor or too many updates waiting for the dispatcher) a new game waits
+in a queue and starts by itself once there is room again, or is turned
+away with a retry hint when the queue is full or MAFIA_ADMISSION_MODE is
+'reject'. Games that already run are never slowed down to make room.
+Opening a lobby is cheap, but it is refused while sends or updates are
+backed up.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+MAX_ACTIVE_GAMES = int(os.getenv('MAFIA_MAX_ACTIVE_GAMES', 200))
+MAX_INFLIGHT_SENDS = int(os.getenv('MAFIA_MAX_INFLIGHT_SENDS', 2000))
+MAX_DISPATCHER_BACKLOG = int(os.getenv('MAFIA_MAX_DISPATCHER_BACKLOG', 500))
+WAIT_QUEUE_SIZE = int(os.getenv('MAFIA_WAIT_QUEUE_SIZE', 50))
+ADMISSION_MODE = os.getenv('MAFIA_ADMISSION_MODE', 'queue')  # queue | reject
+RETRY_AFTER = 30  # seconds suggested to turned away chats
+RECHECK_INTERVAL = 1.0  # seconds between capacity checks while games wait
+
+
+class AdmissionController:
+    def __init__(self, max_games=MAX_ACTIVE_GAMES, max_sends=MAX_INFLIGHT_SENDS,
+                 max_backlog=MAX_DISPATCHER_BACKLOG, queue_size=WAIT_QUEUE_SIZE, mode=ADMISSION_MODE):
+        self.max_games = max_games
+        self.max_sends = max_sends
+        self.max_backlog = max_backlog
+        self.queue_size = queue_size
+        self.mode = mode
+        # Load readings, wired up by the bot: sends queued in the effect
+        # executor and updates waiting in the dispatcher
+        self.sends = lambda: 0
+        self.backlog = lambda: 0
+        self.running = set()  # chat ids of admitted games
+        self.waiting = OrderedDict()  # chat_id -> start(), first come first served
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected': 0, 'shed_lobbies': 0}
+        self.limit_reached = None  # the limit in force when last checked, for the log
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def pressure(self):
+        # Name of the limit the process is at, None while there is room
+        if len(self.running) >= self.max_games:
+            reason = 'games'
+        elif self.sends() >= self.max_sends:
+            reason = 'sends'
+        elif self.backlog() >= self.max_backlog:
+            reason = 'backlog'
+        else:
+            reason = None
+        if reason != self.limit_reached:
+            print(f"Admission: at {reason} limit" if reason else "Admission: capacity available again")
+            self.limit_reached = reason
+        return reason
+
+    def open_lobby(self):
+        # Lobbies only add joins and DMs, refused only while the process is backed up
+        with self.lock:
+            if self.pressure() in ('sends', 'backlog') or len(self.waiting) >= self.queue_size:
+                self.stats['shed_lobbies'] += 1
+                return False
+            return True
+
+    def admit(self, chat_id, start):
+        # start() starts the game and returns whether it did; it runs now or
+        # later from the queue. Returns ('started', None), ('queued', position)
+        # or ('rejected', seconds to wait before trying again)
+        with self.lock:
+            if chat_id in self.waiting:
+                return 'queued', list(self.waiting).index(chat_id) + 1
+            # A game holding a slot already answers a second start by itself
+            holds_slot = chat_id in self.running
+            if holds_slot:
+                pass
+            elif not self.waiting and self.pressure() is None:
+                self.running.add(chat_id)
+                self.stats['admitted'] += 1
+            elif self.mode == 'queue' and len(self.waiting) < self.queue_size:
+                self.waiting[chat_id] = start
+                self.stats['queued'] += 1
+                self.schedule_recheck()
+                return 'queued', len(self.waiting)
+            else:
+                self.stats['rejected'] += 1
+                return 'rejected', RETRY_AFTER
+        if not start() and not holds_slot:
+            self.release(chat_id)
+        return 'started', None
+
+    def resume(self, chat_id):
+        # A running game taken over from a previous process, admitted whatever the limits
+        with self.lock:
+            self.running.add(chat_id)
+
+    def release(self, chat_id):
+        # The game ended (or never started): its slot goes to the next waiting game
+        with self.lock:
+            self.running.discard(chat_id)
+            self.waiting.pop(chat_id, None)
+            if not self.waiting:
+                return
+        # Games end on the phase timer thread, which every game shares;
+        # starting the next one sends messages, so it gets a thread of its own
+        threading.Thread(target=self.promote, name='admission', daemon=True).start()
+
+    def promote(self):
+        while True:
+            with self.lock:
+                self.timer = None
+                if not self.waiting or self.pressure() is not None:
+                    # Sends and backlog drain without telling us, look again later
+                    if self.waiting:
+                        self.schedule_recheck()
+                    return
+                chat_id, start = self.waiting.popitem(last=False)
+                self.running.add(chat_id)
+                self.stats['admitted'] += 1
+            try:
+                started = start()
+            except Exception as e:
+                print(f"Error starting queued game {chat_id}: {e}")
+                started = False
+            if not started:
+                with self.lock:
+                    self.running.discard(chat_id)
+
+    def schedule_recheck(self):
+        # Called with the lock held
+        if self.timer is None:
+            self.timer = threading.Timer(RECHECK_INTERVAL, self.promote)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'running_games': len(self.running),
+                'max_games': self.max_games,
+                'waiting_games': len(self.waiting),
+                'queue_size': self.queue_size,
+                'inflight_sends': self.sends(),
+                'max_sends': self.max_sends,
+                'dispatcher_backlog': self.backlog(),
+                'max_backlog': self.max_backlog,
+                'limit_reached': self.pressure(),
+                'threads': threading.active_count(),
+                **self.stats
+            }
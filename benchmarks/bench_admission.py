@@ -0,0 +1,139 @@
+"""Latency of running games while a burst of new games arrives, with and
+without admission limits. Sends go to a fake bot that takes a few
+milliseconds per call, effects run on a real EffectExecutor.
+
+    python benchmarks/bench_admission.py --running 20 --burst 400
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from common import FakeBot, use_temp_data_dir
+
+import mafia_bot
+from admission import AdmissionController
+from mafia_bot import EffectExecutor, MafiaGame
+
+PROBE_TEXT = "🕴 Don qurbanı seçdi.."
+
+
+class SlowBot(FakeBot):
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.probe_sends = {}  # chat_id -> times the don's announcement was sent
+
+    def send_message(self, chat_id, text, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            if text == PROBE_TEXT:
+                self.probe_sends.setdefault(chat_id, []).append(time.perf_counter())
+
+
+def open_lobby(chat_id, players, bot, executor):
+    game = MafiaGame(chat_id, executor=executor)
+    game.set_bot(bot)
+    for index in range(players):
+        game.add_player(chat_id * -1000 + index, f"Player {index}")
+    return game
+
+
+def run(label, controller, args):
+    executor = EffectExecutor()
+    mafia_bot.admission = controller
+    controller.sends = lambda: executor.in_flight
+    bot = SlowBot(args.send_latency)
+    games = []
+
+    def start_when_admitted(game):
+        games.append(game)
+        return controller.admit(game.chat_id, lambda: game.start_game(1)[0])[0]
+
+    # Games that were running before the burst hold their slots whatever the limits
+    running = []
+    for index in range(args.running):
+        game = open_lobby(-(index + 1), args.players, bot, executor)
+        game.start_game(1)
+        controller.resume(game.chat_id)
+        games.append(game)
+        running.append(game)
+    executor.flush()
+
+    # Running games: their dons keep choosing, each choice is announced in the group
+    dons = [(game, next(u for u, p in game.players.items() if p['role'] == 'don_mafia')) for game in running]
+    dispatched = {}
+    stop = threading.Event()
+
+    def probe():
+        rng = random.Random(1)
+        while not stop.is_set():
+            game, don = rng.choice(dons)
+            dispatched.setdefault(game.chat_id, []).append(time.perf_counter())
+            game.process_night_action(don, don)
+            time.sleep(0.005)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+
+    # The burst: lobbies open, fill up and press start at --rate per second
+    decisions = {'started': 0, 'queued': 0, 'rejected': 0, 'shed': 0}
+    peak_sends = 0
+    started = time.perf_counter()
+    for index in range(args.burst):
+        time.sleep(max(0, started + index / args.rate - time.perf_counter()))
+        if not controller.open_lobby():
+            decisions['shed'] += 1
+            continue
+        game = open_lobby(-(args.running + index + 1), args.players, bot, executor)
+        decisions[start_when_admitted(game)] += 1
+        peak_sends = max(peak_sends, executor.in_flight)
+    executor.flush()
+    burst_time = time.perf_counter() - started
+    stop.set()
+    prober.join()
+    executor.flush()
+
+    latencies = []
+    for chat_id, times in dispatched.items():
+        latencies.extend(sent - sent_at for sent_at, sent in zip(times, bot.probe_sends.get(chat_id, [])))
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{label:<22} running games p50 {quantiles[49] * 1000:7.1f} ms | p99 {quantiles[98] * 1000:7.1f} ms | "
+        f"max {max(latencies) * 1000:7.1f} ms | burst {burst_time:5.2f} s | peak sends {peak_sends:5} | {decisions}"
+    )
+    print(f"{'':<22} {controller.metrics()}")
+
+    with controller.lock:
+        controller.waiting.clear()
+        if controller.timer:
+            controller.timer.cancel()
+    for game in games:
+        game.cancel_phase_timer()
+    executor.pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--running', type=int, default=20)
+    parser.add_argument('--burst', type=int, default=400)
+    parser.add_argument('--rate', type=float, default=100, help="new games per second during the burst")
+    parser.add_argument('--players', type=int, default=12)
+    parser.add_argument('--send-latency', type=float, default=0.005)
+    parser.add_argument('--max-games', type=int, default=60)
+    parser.add_argument('--max-sends', type=int, default=200)
+    args = parser.parse_args()
+
+    use_temp_data_dir()
+    unlimited = AdmissionController(max_games=10 ** 9, max_sends=10 ** 9, queue_size=10 ** 9)
+    run("no limits", unlimited, args)
+    limited = AdmissionController(max_games=args.max_games, max_sends=args.max_sends, queue_size=100)
+    run("admission (queue)", limited, args)
+    rejecting = AdmissionController(max_games=args.max_games, max_sends=args.max_sends, mode='reject')
+    run("admission (reject)", rejecting, args)
+
+
+if __name__ == '__main__':
+    main()
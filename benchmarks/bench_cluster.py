@@ -0,0 +1,175 @@
+"""Several bot nodes sharing one store: how the chats spread over the nodes
+and what happens when a node dies. Every node is a real bot process; they
+talk to the local fake Bot API and share the fake Redis server (or one
+SQLite file with --store sqlite). Probe updates, stale buttons of the
+running games, keep arriving the whole time. The node polling Telegram is
+then killed with SIGKILL, so nothing is drained and its leases have to
+expire before the other nodes take its games and the polling over.
+
+    python benchmarks/bench_cluster.py --nodes 3 --games 30 --ttl 3
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import common
+
+from bench_handover import BotProcess, callback_update, command_update, percentile, wait_until
+from cluster import INGRESS
+from fake_api import FakeApiServer
+from fake_redis import FakeRedisServer
+from game_core import GameState, encode_callback
+from store import lease_name, open_store
+
+PROBE_INTERVAL = 0.02  # seconds between probe updates
+
+
+def game_state(store, chat_id):
+    data, events = store.load_game(chat_id)
+    state = GameState(chat_id)
+    if data:
+        state.restore_snapshot(data)
+    for event in events:
+        state.apply_event(event)
+    return state
+
+
+def start_games(server, store, games, players):
+    # Lobby, joins and the start button for every group, as Telegram would deliver them
+    chats = [-2000 - index for index in range(games)]
+    for index, chat_id in enumerate(chats):
+        admin_id = 100000 + index
+        server.push_update(command_update(chat_id, admin_id, '/startgame'))
+        for player in range(players):
+            user_id = (index + 1) * 1000 + player
+            server.push_update(command_update(user_id, user_id, f"/start join_{chat_id}"))
+        server.push_update(callback_update(f"start{chat_id}", chat_id, admin_id, encode_callback('start', chat_id, 0)))
+    wait_until(lambda: all(game_state(store, chat_id).game_started for chat_id in chats), 120, "games to start")
+    return chats
+
+
+def holders(store, chats):
+    return {chat_id: store.lease_holder(lease_name(chat_id)) for chat_id in chats}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--games', type=int, default=30)
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--ttl', type=float, default=3, help="lease TTL in seconds (MAFIA_LEASE_TTL)")
+    parser.add_argument('--store', choices=('redis', 'sqlite'), default='redis')
+    args = parser.parse_args()
+
+    server = FakeApiServer().start()
+    redis = None
+    workdir = tempfile.mkdtemp(prefix='mafia-cluster-')
+    if args.store == 'redis':
+        redis = FakeRedisServer().start()
+        url = redis.url
+    else:
+        url = f"sqlite:///{os.path.join(workdir, 'mafia.db')}"
+    store = open_store(url, node='bench')
+    env = dict(os.environ, TELEGRAM_API_URL=server.base_url, MAFIA_STORE=url, MAFIA_LEASE_TTL=str(args.ttl))
+    nodes = {}
+    try:
+        for index in range(args.nodes):
+            name = f"node{index + 1}"
+            node_dir = os.path.join(workdir, name)
+            os.makedirs(node_dir)
+            # Telegram sees one bot; the fake API tells the nodes apart by token
+            nodes[name] = BotProcess(name, node_dir, dict(env, MAFIA_NODE_ID=name, TELEGRAM_BOT_TOKEN=f"123:{name}"))
+        for process in nodes.values():
+            process.wait_for("Bot started as node")
+        # The poller learns about the other nodes on its next heartbeat round
+        wait_until(lambda: len(store.nodes()) == args.nodes, 10, "the heartbeats")
+        time.sleep(args.ttl / 3)
+
+        started = time.monotonic()
+        chats = start_games(server, store, args.games, args.players)
+        print(f"{args.nodes} nodes, {args.games} games x {args.players} players started in {time.monotonic() - started:.2f} s")
+        owners = holders(store, chats)
+        ingress = store.lease_holder(INGRESS)
+        for name in nodes:
+            sends = len([call for call in server.calls_to('sendMessage') if call[2] == f"123:{name}"])
+            role = " (polls Telegram)" if name == ingress else ""
+            print(f"  {name}: {list(owners.values()).count(name):3} games, {sends:5} messages sent{role}")
+
+        # Probes: stale buttons of random games, answered by whichever node drives the game
+        pushed = {}
+        probing = threading.Event()
+
+        def probe():
+            rng = random.Random(1)
+            query_id = 0
+            while not probing.is_set():
+                query_id += 1
+                chat_id = rng.choice(chats)
+                pushed[f"probe{query_id}"] = (time.monotonic(), chat_id)
+                server.push_update(callback_update(f"probe{query_id}", chat_id, 1, encode_callback('select', chat_id, 0, 1)))
+                time.sleep(PROBE_INTERVAL)
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        time.sleep(1.0)
+
+        victim = nodes[ingress]
+        victim_chats = [chat_id for chat_id, owner in owners.items() if owner == ingress]
+        nights = {chat_id: game_state(store, chat_id).phase_nonce for chat_id in victim_chats}
+        killed = time.monotonic()
+        victim.process.kill()
+        wait_until(lambda: store.lease_holder(INGRESS) not in (None, ingress), args.ttl * 5, "a new poller")
+        polling = time.monotonic() - killed
+        wait_until(lambda: all(owner not in (None, ingress) for owner in holders(store, victim_chats).values()),
+                   args.ttl * 5, "the takeover of the games")
+        taken = time.monotonic() - killed
+        time.sleep(2.0)
+        probing.set()
+        prober.join()
+        wait_until(lambda: set(pushed) <= {c[3].get('callback_query_id') for c in server.calls_to('answerCallbackQuery')},
+                   30, "probe answers")
+
+        answers = {}
+        duplicates = 0
+        for at, _, _, params in server.calls_to('answerCallbackQuery'):
+            query_id = params.get('callback_query_id')
+            if query_id in pushed:
+                duplicates += query_id in answers
+                answers.setdefault(query_id, at)
+        latencies = [answers[query_id] - pushed[query_id][0] for query_id in pushed if query_id in answers]
+        print(f"SIGKILL {ingress} with {len(victim_chats)} games (lease TTL {args.ttl:g} s)")
+        print(f"  new poller after                        {polling:6.2f} s")
+        print(f"  its games taken over after              {taken:6.2f} s")
+        print(f"  probe latency p50 / p99 / max           {percentile(latencies, 0.5):6.2f} / "
+              f"{percentile(latencies, 0.99):.2f} / {max(latencies):.2f} s")
+        print(f"  probes lost / answered twice            {len(pushed) - len(answers)} / {duplicates}")
+        print(f"  games now per node                      "
+              f"{ {name: list(holders(store, chats).values()).count(name) for name in nodes if name != ingress} }")
+
+        # The taken over games go on: their nights end on the timers of the
+        # new owners, at the deadlines the dead node had set
+        deadlines = {chat_id: store.load_game(chat_id)[0]['timer']['deadline'] for chat_id in nights}
+        ended = {}
+
+        def nights_ended():
+            for chat_id, nonce in nights.items():
+                if chat_id not in ended and game_state(store, chat_id).phase_nonce > nonce:
+                    ended[chat_id] = time.time()
+            return len(ended) == len(nights)
+
+        wait_until(nights_ended, 60, "the nights of the taken over games to end")
+        lateness = [ended[chat_id] - deadlines[chat_id] for chat_id in nights]
+        print(f"  night timers fired late by p50 / max    {percentile(lateness, 0.5):6.2f} / {max(lateness):.2f} s")
+    finally:
+        for process in nodes.values():
+            process.stop()
+        server.stop()
+        if redis:
+            redis.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Throughput of the pure game core: whole games played through
+game_core.transition with random choices and no bot, disk or timers.
+
+    python benchmarks/bench_core.py --games 200 --players 12
+"""
+import argparse
+import random
+import time
+
+import common  # noqa: F401
+
+from game_core import GameState, ROLES, transition
+
+
+def play_game(chat_id, player_count, rng):
+    # Returns (transitions, effects) needed to play one game to the end
+    state = GameState(chat_id)
+    transitions = 0
+    effects = 0
+
+    def step(event):
+        nonlocal transitions, effects
+        _, produced = transition(state, event)
+        transitions += 1
+        effects += len(produced)
+
+    for user_id in range(1, player_count + 1):
+        step({'type': 'join', 'user_id': user_id, 'name': f"Player {user_id}"})
+    step({'type': 'start', 'admin_id': 1, 'seed': rng.getrandbits(32)})
+
+    while state.game_started:
+        alive = [u for u, p in state.players.items() if 'is_dead' not in p]
+        if state.phase == 'night':
+            for user_id in alive:
+                if ROLES[state.players[user_id]['role']]['is_active']:
+                    action = rng.choice(('check', 'shoot')) if state.players[user_id]['role'] == 'detective' else None
+                    step({'type': 'night_action', 'user_id': user_id, 'target_id': rng.choice(alive), 'action': action})
+        elif state.phase == 'vote':
+            for voter_id in alive:
+                target_id = rng.choice(alive)
+                while target_id == voter_id:
+                    target_id = rng.choice(alive)
+                step({'type': 'vote', 'voter_id': voter_id, 'target_id': target_id})
+            continue
+        elif state.phase == 'hang_confirm':
+            target_id = max(state.vote_counts, key=state.vote_counts.get)
+            step({'type': 'hang', 'target_id': target_id} if rng.random() < 0.8 else {'type': 'no_hang'})
+            continue
+        step({'type': 'timeout', 'phase': state.phase, 'nonce': state.phase_nonce})
+    return transitions, effects
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--players', type=int, nargs='+', default=[6, 12, 50])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for player_count in args.players:
+        transitions = 0
+        effects = 0
+        started = time.perf_counter()
+        for game_index in range(args.games):
+            game_transitions, game_effects = play_game(-game_index - 1, player_count, rng)
+            transitions += game_transitions
+            effects += game_effects
+        elapsed = time.perf_counter() - started
+        print(
+            f"{player_count:>3} players | {args.games} games in {elapsed:6.2f} s | "
+            f"{transitions / elapsed:10,.0f} transitions/s | "
+            f"{elapsed / transitions * 1e6:6.1f} us/transition | {effects / transitions:5.1f} effects/transition"
+        )
+
+
+if __name__ == '__main__':
+    main()
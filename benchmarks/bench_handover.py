@@ -0,0 +1,198 @@
+"""Deploy handover under load. An old bot process with running games gets
+SIGTERM while a new one waits for the lock; both talk to the local fake
+Bot API. Measures how long updates go unanswered during the handover and
+checks that every game goes on in the new process with its night timer
+firing at the original deadline.
+
+    python benchmarks/bench_handover.py --games 50 --players 8
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import common
+
+from fake_api import FakeApiServer
+from game_core import encode_callback
+from journal import replay
+from serializer import load_file
+
+BOT_SCRIPT = os.path.join(common.ROOT, 'mafia_bot.py')
+PROBE_INTERVAL = 0.02  # seconds between probe updates during the handover
+
+
+class BotProcess:
+    def __init__(self, name, workdir, env):
+        self.name = name
+        self.lines = []
+        self.exited_at = None
+        self.process = subprocess.Popen(
+            [sys.executable, '-u', BOT_SCRIPT], cwd=workdir, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        threading.Thread(target=self.read_output, daemon=True).start()
+
+    def read_output(self):
+        for line in self.process.stdout:
+            self.lines.append((time.monotonic(), line.rstrip()))
+        self.process.wait()
+        self.exited_at = time.monotonic()
+
+    def wait_for(self, text, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for _, line in list(self.lines):
+                if text in line:
+                    return line
+            if self.exited_at is not None:
+                break
+            time.sleep(0.01)
+        raise RuntimeError(f"{self.name} process never printed {text!r}:\n" + '\n'.join(l for _, l in self.lines))
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f"Player {user_id}"}
+
+
+def command_update(chat_id, user_id, text):
+    chat_type = 'private' if chat_id > 0 else 'supergroup'
+    return {'message': {
+        'message_id': 1, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': chat_type},
+        'from': user(user_id), 'text': text,
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    }}
+
+
+def callback_update(query_id, chat_id, user_id, data):
+    return {'callback_query': {
+        'id': str(query_id), 'from': user(user_id), 'chat_instance': str(chat_id), 'data': data,
+        'message': {'message_id': 1, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'supergroup'}}
+    }}
+
+
+def wait_until(check, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for {what}")
+        time.sleep(0.05)
+
+
+def start_games(server, workdir, games, players):
+    # Lobby, joins and the start button for every group, as Telegram would deliver them
+    chats = [-1000 - index for index in range(games)]
+    for index, chat_id in enumerate(chats):
+        admin_id = 100000 + index
+        server.push_update(command_update(chat_id, admin_id, '/startgame'))
+        for player in range(players):
+            user_id = (index + 1) * 1000 + player
+            server.push_update(command_update(user_id, user_id, f"/start join_{chat_id}"))
+        server.push_update(callback_update(f"start{chat_id}", chat_id, admin_id, encode_callback('start', chat_id, 0)))
+
+    data_dir = os.path.join(workdir, 'data')
+    wait_until(lambda: all(replay(chat_id, data_dir)[0].game_started for chat_id in chats), 60, "games to start")
+    return chats
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=50)
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--skip-timers', action='store_true', help="don't wait for the resumed night timers")
+    args = parser.parse_args()
+
+    server = FakeApiServer().start()
+    workdir = tempfile.mkdtemp(prefix='mafia-handover-')
+    env = dict(os.environ, TELEGRAM_API_URL=server.base_url)
+    old = new = None
+    try:
+        # Telegram sees one bot; the fake API tells the processes apart by token
+        old = BotProcess('old', workdir, dict(env, TELEGRAM_BOT_TOKEN='123:old'))
+        old.wait_for("Bot started")
+        chats = start_games(server, workdir, args.games, args.players)
+        new = BotProcess('new', workdir, dict(env, TELEGRAM_BOT_TOKEN='123:new'))
+        new.wait_for("Waiting for process")
+
+        # Probe updates from before the signal until the new process answers them
+        pushed = {}
+        probing = threading.Event()
+
+        def probe():
+            query_id = 0
+            while not probing.is_set():
+                query_id += 1
+                pushed[f"probe{query_id}"] = time.monotonic()
+                server.push_update(callback_update(f"probe{query_id}", chats[0], 1, 'x'))
+                time.sleep(PROBE_INTERVAL)
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        time.sleep(0.5)
+        signalled = time.monotonic()
+        old.process.send_signal(signal.SIGTERM)
+        resumed_line = new.wait_for("games resumed", timeout=60)
+        time.sleep(1.0)
+        probing.set()
+        prober.join()
+        wait_until(lambda: set(pushed) <= {c[3].get('callback_query_id') for c in server.calls_to('answerCallbackQuery')},
+                   10, "probe answers")
+
+        answers = {}
+        duplicates = 0
+        for at, _, _, params in server.calls_to('answerCallbackQuery'):
+            query_id = params.get('callback_query_id')
+            if query_id in pushed:
+                duplicates += query_id in answers
+                answers.setdefault(query_id, at)
+        latencies = [answers[query_id] - pushed[query_id] for query_id in pushed if query_id in answers]
+        takeover = min(at for at, _, token, _ in server.calls_to('getUpdates', signalled) if token == '123:new')
+
+        print(f"{args.games} games x {args.players} players")
+        print(f"  drain (SIGTERM -> old process exit)     {old.exited_at - signalled:6.2f} s")
+        print(f"  takeover (SIGTERM -> new process polls) {takeover - signalled:6.2f} s")
+        print(f"  update latency p50 / max                {percentile(latencies, 0.5):6.2f} / {max(latencies):.2f} s")
+        print(f"  probes lost / answered twice            {len(pushed) - len(answers)} / {duplicates}")
+        print(f"  new process: {resumed_line}")
+
+        if not args.skip_timers:
+            # Night timers must fire in the new process at the deadline the old one set
+            now_wall, now = time.time(), time.monotonic()
+            deadlines = {}
+            for chat_id in chats:
+                timer = load_file(os.path.join(workdir, 'data', f'game_{chat_id}.json'), 'game')['timer']
+                deadlines[chat_id] = timer['deadline'] - now_wall + now
+            wait_until(lambda: all(replay(chat_id, os.path.join(workdir, 'data'))[0].phase == 'day' for chat_id in chats),
+                       max(deadlines.values()) - now + 10, "resumed night timers")
+            lateness = []
+            for chat_id in chats:
+                sends = [at for at, _, _, params in server.calls_to('sendMessage', old.exited_at)
+                         if str(params.get('chat_id')) == str(chat_id)]
+                lateness.append(min(sends) - deadlines[chat_id])
+            print(f"  night timers fired, lateness min / max  {min(lateness):6.2f} / {max(lateness):.2f} s")
+    finally:
+        for process in (old, new):
+            if process:
+                process.stop()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Journal append vs full snapshot cost, and replay throughput.
+
+    python benchmarks/bench_journal.py --players 150
+    python benchmarks/bench_journal.py --replay-chat -1001754537100 --data-dir /path/to/data [--until 42]
+"""
+import argparse
+import time
+
+from common import FakeBot, use_temp_data_dir, timed
+
+import journal
+from game_core import COMPACT_EVERY
+from mafia_bot import MafiaGame, InlineExecutor
+
+
+def bench_synthetic(player_count):
+    use_temp_data_dir()
+    game = MafiaGame(-100, executor=InlineExecutor())
+    game.set_bot(FakeBot())
+    for user_id in range(1, player_count + 1):
+        game.add_player(user_id, f"Player {user_id}")
+    game.start_game(1)
+    game.cancel_phase_timer()
+
+    # Fewer votes than COMPACT_EVERY, from an empty journal: a compaction
+    # would time a snapshot and leave nothing to replay
+    game.save_game_state()
+    voters = list(game.players)[:COMPACT_EVERY - 1]
+
+    def record_votes(target_id):
+        effects = []
+        for voter in voters:
+            game.record(effects, 'vote', voter_id=voter, target_id=target_id)
+        game.executor.submit(game, effects)
+    timed(f"journal append (vote) x{len(voters)}", lambda: record_votes(voters[0]))
+    timed("full snapshot (save_game_state)", game.save_game_state, repeat=20)
+    archived_seq = game.seq
+
+    record_votes(voters[1])
+    _, events = bench_replay(game.chat_id, journal.DATA_DIR)
+    assert events, "nothing journaled since the last snapshot"
+    # A point before the snapshot comes from the archived segments, from the first event on
+    _, events = bench_replay(game.chat_id, journal.DATA_DIR, archived_seq - 1)
+    assert len(events) == archived_seq - 1, "the archive lost events"
+
+
+def bench_replay(chat_id, data_dir, until_seq=None):
+    started = time.perf_counter()
+    game, events = journal.replay(chat_id, data_dir, until_seq)
+    elapsed = time.perf_counter() - started
+    rate = len(events) / elapsed if elapsed else 0
+    label = f"replay {len(events)} events" + (f" until {until_seq}" if until_seq is not None else "")
+    print(f"{label:<45} {elapsed * 1000:10.3f} ms ({rate:,.0f} events/s)")
+    return game, events
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--replay-chat', type=int, default=None)
+    parser.add_argument('--data-dir', default=journal.DATA_DIR)
+    parser.add_argument('--until', type=int, default=None)
+    args = parser.parse_args()
+    if args.replay_chat is not None:
+        bench_replay(args.replay_chat, args.data_dir, args.until)
+    else:
+        bench_synthetic(args.players)
+
+
+if __name__ == '__main__':
+    main()
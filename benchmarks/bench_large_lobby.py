@@ -0,0 +1,63 @@
+"""Phase transition timings for large lobbies.
+
+    python benchmarks/bench_large_lobby.py --players 50 100 150
+"""
+import argparse
+import random
+
+from common import FakeBot, use_temp_data_dir, timed
+
+import game_core
+from mafia_bot import MafiaGame, InlineExecutor
+
+
+def run(player_count):
+    print(f"--- {player_count} players ---")
+    # Effects run inline so the timings include sending and journaling
+    game = MafiaGame(-100, executor=InlineExecutor())
+    game.set_bot(FakeBot())
+
+    def join_all():
+        for user_id in range(1, player_count + 1):
+            game.add_player(user_id, f"Player {user_id}")
+    timed("add_player (all)", join_all)
+
+    timed("start_game", lambda: game.start_game(1))
+    game.cancel_phase_timer()
+
+    mafia = [u for u, p in game.players.items() if p['role'] == 'don_mafia']
+    timed("selection keyboard (page 0)", lambda: game.generate_player_selection_keyboard(mafia[0]), repeat=100)
+    timed("vote keyboard (last page)", lambda: game.generate_vote_keyboard(1, page=10), repeat=100)
+
+    timed("night -> day", game.expire_phase)
+    timed("day -> vote", game.expire_phase)
+    game.cancel_phase_timer()
+    if game.phase != 'vote':
+        print("game over before the vote")
+        return
+
+    alive = [u for u, p in game.players.items() if 'is_dead' not in p]
+    suspects = alive[:3]
+    votes = [(voter, random.choice([s for s in suspects if s != voter])) for voter in alive[:-1]]
+
+    def cast_votes():
+        for voter, target in votes:
+            game.process_vote(voter, target)
+    timed(f"process_vote x{len(votes)}", cast_votes)
+    timed("vote -> results", game.expire_phase)
+    timed("check_game_end", lambda: game_core.check_game_end(game, []), repeat=1000)
+
+    game.cancel_phase_timer()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, nargs='+', default=[10, 50, 100, game_core.MAX_PLAYERS])
+    args = parser.parse_args()
+    use_temp_data_dir()
+    for player_count in args.players:
+        run(player_count)
+
+
+if __name__ == '__main__':
+    main()
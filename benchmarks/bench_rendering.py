@@ -0,0 +1,118 @@
+"""Cached announcement rendering vs the previous f-string builders.
+
+    python benchmarks/bench_rendering.py --players 10 100 150
+"""
+import argparse
+import random
+
+from common import use_temp_data_dir, timed
+
+from game_core import GameState, transition, ROLES, ROLE_CATEGORIES
+
+
+def legacy_morning_message(game):
+    # The builder generate_morning_message used before the render cache,
+    # minus the night results part which both versions share
+    player_list = "\n".join([
+        f"{i+1}. <a href='tg://user?id={user_id}'>{player['name']}</a>"
+        for i, (user_id, player) in enumerate(game.players.items())
+    ])
+    role_counts = {'citizens': 0, 'mafia': 0}
+    for player in game.players.values():
+        if player['role'] in ROLE_CATEGORIES['citizens']:
+            role_counts['citizens'] += 1
+        elif player['role'] in ROLE_CATEGORIES['mafia']:
+            role_counts['mafia'] += 1
+    return (
+        f"{game.chat_id}, Sabahın Xeyir!!\n"
+        "Günəş, səkilərdə gecə tökülən qanı qurudaraq, çıxır........\n"
+        f"☀️Gün: {game.day_number}\n\n"
+        f"Sağ qalan oyunçular:\n{player_list}\n\n"
+        "Onlardan:\n\n"
+        f"👫Dinc Sakinlər - {role_counts['citizens']}\n"
+        "---------\n"
+        f"👥Mafiyalar - {role_counts['mafia']}\n\n"
+        f"🎪 Cəmi: {len(game.players)} nəfər\n\n"
+        "İndi gecənin nəticələrini müzakirə etmək, səbəb və təsirləri anlamaq vaxtıdır......"
+    )
+
+
+def legacy_game_start_message(game):
+    role_counts = {'citizens': 0, 'mafia': 0}
+    assigned_roles = {'citizens': set(), 'mafia': set()}
+    for player in game.players.values():
+        if player['role'] in ROLE_CATEGORIES['citizens']:
+            role_counts['citizens'] += 1
+            assigned_roles['citizens'].add(player['role'])
+        elif player['role'] in ROLE_CATEGORIES['mafia']:
+            role_counts['mafia'] += 1
+            assigned_roles['mafia'].add(player['role'])
+    player_list = "\n".join([
+        f"{i+1}. <a href='tg://user?id={user_id}'>{player['name']}</a>"
+        for i, (user_id, player) in enumerate(game.players.items())
+    ])
+    citizen_roles = [ROLES[role]['name'] for role in assigned_roles['citizens']]
+    mafia_roles = [ROLES[role]['name'] for role in assigned_roles['mafia']]
+    return (
+        "Mafia Combat Oyunu Başladı\n\n"
+        "Gecə düşür!\n"
+        "Yalnız cəsarətlilər və qorxmazlar şəhər küçələrinə çıxırlar. "
+        "Səhər başlarını saymağa çalışacağıq...\n\n"
+        f"Sağ qalan oyunçular:\n{player_list}\n\n"
+        "Onlardan:\n\n"
+        f"👫Dinc Sakinlər - {role_counts['citizens']}\n"
+        f" {' '.join(citizen_roles)}\n"
+        "---------\n"
+        f"👥Mafiyalar - {role_counts['mafia']}\n"
+        f" {' '.join(mafia_roles)}\n\n"
+        f"🎪 Cəmi: {len(game.players)} nəfər"
+    )
+
+
+def legacy_registration_message(game):
+    player_list = ", ".join([player['name'] for player in game.players.values()]) or "Hələ heç kim qatılmayıb"
+    return (
+        "Qeydiyyat başladı! Qatılmaq üçün tələs!\n\n"
+        f"<b>Qatılanlar:</b> {player_list}"
+    )
+
+
+def run(player_count, repeat):
+    print(f"--- {player_count} players ({repeat} renders) ---")
+    game = GameState(-100)
+    for user_id in range(1, player_count + 1):
+        transition(game, {'type': 'join', 'user_id': user_id, 'name': f"Player <{user_id}> & co"})
+
+    timed("registration  legacy", lambda: legacy_registration_message(game), repeat)
+    timed("registration  cached", game.generate_registration_message, repeat)
+
+    transition(game, {'type': 'start', 'admin_id': 1, 'seed': random.getrandbits(32)})
+    timed("game start    legacy", lambda: legacy_game_start_message(game), repeat)
+    timed("game start    cached", game.generate_game_start_message, repeat)
+
+    for user_id in random.sample(list(game.players), player_count // 5):
+        game.record([], 'kill', user_id=user_id)
+    timed("morning       legacy", lambda: legacy_morning_message(game), repeat)
+    timed("morning       cached", game.generate_morning_message, repeat)
+
+    # Worst case for the cache: a death right before every render
+    alive = [u for u, p in game.players.items() if 'is_dead' not in p]
+
+    def kill_then_render():
+        game.render_cache.remove_player(alive.pop())
+        return game.generate_morning_message()
+    timed("morning       cached, rebuilt each time", kill_then_render, min(repeat, len(alive) - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, nargs='+', default=[10, 100, 150])
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+    use_temp_data_dir()
+    for player_count in args.players:
+        run(player_count, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Encode/decode throughput and size on disk of the data/ serializers,
+against the old pretty-printed json.dump(indent=4) files.
+
+    python benchmarks/bench_serializer.py --players 150 --history 200
+    MAFIA_SERIALIZER=orjson python mafia_bot.py   # pick one for the bot
+"""
+import argparse
+import json
+import random
+import time
+
+import common  # noqa: F401
+
+import serializer
+from game_core import GameState, transition
+
+
+class LegacySerializer:
+    # What every persistence path used before serializer.py
+    name = 'legacy json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, indent=4).encode('utf-8')
+
+
+def sample_game(player_count):
+    state = GameState(-1001754537100)
+    for user_id in range(1, player_count + 1):
+        transition(state, {'type': 'join', 'user_id': 5000000000 + user_id, 'name': f"Oyunçu {user_id} ✨"})
+    transition(state, {'type': 'start', 'admin_id': 5000000001, 'seed': 7})
+    alive = list(state.players)
+    for user_id in random.Random(1).sample(alive, player_count // 5):
+        state.record([], 'kill', user_id=user_id)
+    return state.snapshot()
+
+
+def sample_payloads(player_count, history_games):
+    game = sample_game(player_count)
+    record = {'timestamp': '2024-01-01T20:00:00', 'players': game['players'], 'winners': ['mafia'], 'day_number': 4}
+    return {
+        'game': game,
+        'history': [record] * history_games,
+        'user': {'games_played': 120, 'games_won': 61, 'total_money': 1810},
+    }
+
+
+def measure(func, min_time=0.3):
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return runs / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=150)
+    parser.add_argument('--history', type=int, default=100, help="games in the history file")
+    args = parser.parse_args()
+
+    payloads = sample_payloads(args.players, args.history)
+    serializers = [LegacySerializer()] + [serializer.get_serializer(name) for name in serializer.AVAILABLE]
+    print(f"{'kind':<8} {'serializer':<12} {'bytes':>10} {'encode/s':>12} {'decode/s':>12}  keys ok")
+    for kind, payload in payloads.items():
+        for codec in serializers:
+            if isinstance(codec, LegacySerializer):
+                data = codec.dumps(payload)
+                encode = lambda: codec.dumps(payload)  # noqa: E731
+            else:
+                data = serializer.dumps(kind, payload, codec)
+                encode = lambda: serializer.dumps(kind, payload, codec)  # noqa: E731
+            # Old files go through the same reader, that's the upgrade path
+            decoded = serializer.loads(kind, data)
+            keys_ok = decoded == payload
+            print(
+                f"{kind:<8} {codec.name:<12} {len(data):>10,} {measure(encode):>12,.0f} "
+                f"{measure(lambda: serializer.loads(kind, data)):>12,.0f}  {keys_ok}"
+            )
+        print()
+
+
+if __name__ == '__main__':
+    main()
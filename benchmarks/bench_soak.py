@@ -0,0 +1,290 @@
+"""Soak test: hours of simulated games on a virtual clock, through
+MafiaGame, the real phase timers (on a VirtualScheduler), the journal and
+data/ files, with effects run inline and a bot that only counts sends.
+Now and then a new chat gets a lobby nobody joins, or /fastphases off
+without a game. Checks that threads, games held in memory, pending timers, open files,
+RSS and traced memory stay flat once the first games are over, and
+measures with tracemalloc the bytes per game, per player and per cache.
+
+    python benchmarks/bench_soak.py --hours 6 --concurrent 20 --report soak.json
+
+The report is sorted JSON without timings, so two releases compare with
+a plain diff. Exits with status 1 when something grew.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from common import FakeBot, use_temp_data_dir
+
+import mafia_bot
+from footprint import measure, process_footprint
+from game_core import KEYBOARD_PAGE_SIZE, ROLES
+from mafia_bot import InlineExecutor, MafiaGame
+from rendering import PlayerListCache
+from timers import VirtualScheduler
+
+TICK = 5  # virtual seconds between rounds of player actions
+ACTION_CHANCE = 0.3  # chance a player who hasn't acted yet does so in a tick
+EARLY_FINISH_EVERY = 4  # every 4th chat turns early finish on, and so stays in memory
+IDLE_CHAT_EVERY = 60  # virtual seconds between chats that never get a game going
+
+# Allowed growth from the settled window to the end of the run. Games in
+# memory vary with which chats happen to be playing, up to the running
+# games plus the early finish chats that are between games plus the idle
+# chats not timed out yet.
+ALLOWED_GROWTH = {
+    'threads': lambda settled, args: 0,
+    'resident_games': lambda settled, args: (args.concurrent + args.chats // EARLY_FINISH_EVERY
+                                             + mafia_bot.IDLE_GAME_TIMEOUT // IDLE_CHAT_EVERY + 1 - settled),
+    'pending_timers': lambda settled, args: 0,
+    'open_files': lambda settled, args: 0,
+    'traced_bytes': lambda settled, args: settled * 0.02 + 256 * 1024,
+    'rss_bytes': lambda settled, args: settled * 0.02 + 2 * 1024 * 1024,
+}
+
+
+class CountingBot(FakeBot):
+    # Keeping every message would be a leak of the benchmark's own
+    def __init__(self):
+        super().__init__()
+        self.sends = 0
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sends += 1
+
+
+def footprint_report(players, count):
+    # tracemalloc: bytes a game, a player and the caches leave allocated
+    executor = InlineExecutor()
+    scheduler = VirtualScheduler()
+    report = {}
+    games = []
+
+    def new_game(index):
+        game = MafiaGame(-(index + 1), persist=False, executor=executor, scheduler=scheduler)
+        games.append(game)
+        return game
+
+    def join(index):
+        for player in range(players):
+            games[index].add_player(index * 1000 + player + 1, f"Player {player}")
+
+    def render(index):
+        cache = PlayerListCache()
+        cache.rebuild(games[index].players)
+        cache.render_player_list()
+        cache.render_player_names()
+        return cache
+
+    def fill_buttons(index):
+        game = games[index]
+        voter = next(iter(game.players))
+        for page in range((players + KEYBOARD_PAGE_SIZE - 1) // KEYBOARD_PAGE_SIZE):
+            game.vote_rows(voter, page)
+
+    report['game (empty lobby)'] = measure(new_game, count)
+    report['player (lobby)'] = measure(join, count, units=players)
+    report['player (game start)'] = measure(lambda index: games[index].start_game(1, seed=index), count, units=players)
+    report['render_cache (per player)'] = measure(render, count, units=players)
+    report['button_cache (per player)'] = measure(fill_buttons, count, units=players)
+    for game in games:
+        game.cancel_phase_timer()
+    return report
+
+
+class Soak:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.scheduler = VirtualScheduler()
+        self.executor = InlineExecutor()
+        self.bot = CountingBot()
+        self.free_chats = [-(100000 + index) for index in range(args.chats)]
+        self.users = list(range(1, args.users + 1))
+        self.running = {}  # chat_id -> game
+        self.idle_chats = 0
+        self.next_idle = 0
+        self.games_played = 0
+        self.samples = []
+
+    def open_game(self):
+        # As /startgame, the joins and the start button would
+        chat_id = self.free_chats.pop(0)
+        game = mafia_bot.get_game(chat_id)
+        if game is None:
+            game = mafia_bot.new_game(chat_id, executor=self.executor, scheduler=self.scheduler)
+        game.set_bot(self.bot)
+        if chat_id % EARLY_FINISH_EVERY == 0 and not game.early_finish:
+            game.set_early_finish(True)
+        players = self.rng.randint(mafia_bot.MIN_PLAYERS, self.args.players)
+        for user_id in self.rng.sample(self.users, players):
+            game.add_player(user_id, f"Player {user_id}")
+        mafia_bot.admission.admit(chat_id, lambda: game.start_game(1, seed=self.rng.getrandbits(32))[0])
+        self.running[chat_id] = game
+
+    def open_idle_chat(self):
+        # As /startgame nobody joins, or /fastphases off in a chat without a
+        # game; a chat never seen before every time, so only the idle timeout
+        # keeps them from piling up in memory
+        chat_id = -(200000 + self.idle_chats)
+        game = mafia_bot.new_game(chat_id, executor=self.executor, scheduler=self.scheduler)
+        game.set_bot(self.bot)
+        if self.idle_chats % 2:
+            game.set_early_finish(False)
+        self.idle_chats += 1
+
+    def act(self, game):
+        alive = [u for u, p in game.players.items() if 'is_dead' not in p]
+        phase = game.phase
+        if phase == 'night':
+            for user_id in alive:
+                if game.phase != phase:
+                    break  # early finish ended the night
+                role = game.players[user_id]['role']
+                if ROLES[role]['is_active'] and user_id not in game.night_actions and self.rng.random() < ACTION_CHANCE:
+                    action = self.rng.choice(('check', 'shoot')) if role == 'detective' else None
+                    game.process_night_action(user_id, self.rng.choice(alive), action)
+        elif phase == 'vote':
+            for voter_id in alive:
+                if game.phase != phase:
+                    break
+                if voter_id not in game.votes and self.rng.random() < ACTION_CHANCE:
+                    target_id = self.rng.choice([u for u in alive if u != voter_id])
+                    game.process_vote(voter_id, target_id)
+        elif phase == 'hang_confirm' and game.vote_counts and self.rng.random() < ACTION_CHANCE:
+            if self.rng.random() < 0.8:
+                game.hang_player(max(game.vote_counts, key=game.vote_counts.get))
+            else:
+                game.skip_hang()
+
+    def sample(self):
+        gc.collect()
+        data = process_footprint(mafia_bot.active_games, self.scheduler)
+        data['hours'] = self.scheduler.now / 3600
+        data['games_played'] = self.games_played
+        self.samples.append(data)
+        return data
+
+    def run(self):
+        duration = self.args.hours * 3600
+        sample_every = self.args.sample_minutes * 60
+        next_sample = 0
+        while self.scheduler.now < duration:
+            while len(self.running) < self.args.concurrent:
+                self.open_game()
+            if self.scheduler.now >= self.next_idle:
+                self.open_idle_chat()
+                self.next_idle += IDLE_CHAT_EVERY
+            # Sampled with every game slot filled, whenever the last games ended
+            if self.scheduler.now >= next_sample:
+                data = self.sample()
+                if len(self.samples) % max(1, 3600 // sample_every) == 1:
+                    print(
+                        f"  {data['hours']:5.1f} h | {self.games_played:6} games | threads {data['threads']:3} | "
+                        f"in memory {data['resident_games']:4} | timers {data['pending_timers']:4} | "
+                        f"files {data['open_files']} | traced {data['traced_bytes'] / 2 ** 20:7.2f} MB | "
+                        f"RSS {(data['rss_bytes'] or 0) / 2 ** 20:7.1f} MB"
+                    )
+                next_sample += sample_every
+            for game in list(self.running.values()):
+                self.act(game)
+            self.scheduler.advance(TICK)
+            for chat_id, game in list(self.running.items()):
+                if not game.game_started:
+                    del self.running[chat_id]
+                    self.free_chats.append(chat_id)
+                    self.games_played += 1
+        for game in self.running.values():
+            game.cancel_phase_timer()
+
+    def verdicts(self):
+        # Peak of the window after warm-up against the peak of the last quarter
+        count = len(self.samples)
+        # Idle chats only start leaving memory after IDLE_GAME_TIMEOUT, so the warm-up lasts that long at least
+        timed_out = next(index for index, sample in enumerate(self.samples)
+                         if sample['hours'] * 3600 >= mafia_bot.IDLE_GAME_TIMEOUT)
+        settled = self.samples[max(int(count * self.args.warmup), timed_out):int(count * 0.5)]
+        end = self.samples[int(count * 0.75):]
+        verdicts = {}
+        for name, allowed in ALLOWED_GROWTH.items():
+            if settled[0][name] is None:
+                continue
+            before = max(sample[name] for sample in settled)
+            after = max(sample[name] for sample in end)
+            limit = allowed(before, self.args)
+            verdicts[name] = {
+                'settled': before,
+                'end': after,
+                'growth': after - before,
+                'allowed': round(limit),
+                'flat': after - before <= limit,
+            }
+        return verdicts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=float, default=6, help="virtual time to play")
+    parser.add_argument('--concurrent', type=int, default=20, help="games running at once")
+    parser.add_argument('--chats', type=int, default=40, help="groups the games are played in")
+    parser.add_argument('--users', type=int, default=2000, help="players the lobbies are filled from")
+    parser.add_argument('--players', type=int, default=12, help="most players per game")
+    parser.add_argument('--sample-minutes', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=0.25, help="share of the run before memory must be flat")
+    parser.add_argument('--measure-count', type=int, default=200, help="objects built per footprint measurement")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--report', help="write the report as JSON to this file")
+    args = parser.parse_args()
+    if args.hours * 3600 / 2 < mafia_bot.IDLE_GAME_TIMEOUT + args.sample_minutes * 60:
+        parser.error(f"--hours too short, the first half of the run must sample past the "
+                     f"{mafia_bot.IDLE_GAME_TIMEOUT // 60} minutes idle chats stay in memory")
+
+    report_path = os.path.abspath(args.report) if args.report else None
+    use_temp_data_dir()
+    # The first round pays for imports, regex caches and the like
+    footprint_report(args.players, 1)
+    footprint = footprint_report(args.players, args.measure_count)
+    for name, result in footprint.items():
+        files = ', '.join(f"{file} {size}" for file, size in result['by_file'].items())
+        print(f"{name:<28} {result['bytes']:8} bytes  ({files})")
+
+    print(f"Soak: {args.hours:g} h, {args.concurrent} games at once in {args.chats} chats")
+    tracemalloc.start()
+    soak = Soak(args)
+    started = time.perf_counter()
+    soak.run()
+    elapsed = time.perf_counter() - started
+    verdicts = soak.verdicts()
+    tracemalloc.stop()
+    print(f"{soak.games_played} games in {elapsed:.1f} s, {soak.bot.sends} sends")
+    for name, verdict in verdicts.items():
+        print(
+            f"  {name:<16} {verdict['settled']:>12} -> {verdict['end']:>12} "
+            f"(growth {verdict['growth']}, allowed {verdict['allowed']}) {'flat' if verdict['flat'] else 'GREW'}"
+        )
+
+    if report_path:
+        # No timings and no RSS, which vary from run to run; the rest is the same for the same seed
+        report = {
+            'parameters': {k: v for k, v in vars(args).items() if k != 'report'},
+            'footprint': footprint,
+            'soak': {
+                'games_played': soak.games_played,
+                'flat': {name: verdict['flat'] for name, verdict in verdicts.items()},
+                'end': {name: verdict['end'] for name, verdict in verdicts.items() if name != 'rss_bytes'},
+            },
+        }
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    sys.exit(0 if all(verdict['flat'] for verdict in verdicts.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Cold start: import time of mafia_bot and, for a bot process started on a
+large data/ directory, the time until it polls, until the first update is
+handled and until every live game is loaded again. The first update is a
+button press in a game that is still waiting to be loaded. Last, a first
+start on data/ without an index is stopped while it is still loading, and
+the restart has to find every live game anyway.
+
+    python benchmarks/bench_startup.py --games 5000 --live 200
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+
+from bench_handover import BotProcess, callback_update, wait_until
+from fake_api import FakeApiServer
+from game_core import GameState, encode_callback, transition
+from journal import index_path, snapshot_path
+from serializer import dump_file, load_file
+
+STARTUP_BUDGET = 1.0  # seconds from exec to the first update handled
+
+
+def import_time(repeat=3):
+    # Best of a few runs of python -X importtime, in ms; and whether telegram.ext came along
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import mafia_bot'],
+            cwd=common.ROOT, capture_output=True, text=True
+        )
+        modules = {}
+        for line in result.stderr.splitlines():
+            match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)', line)
+            if match:
+                modules[match.group(3)] = int(match.group(1)) / 1000
+        if best is None or modules['mafia_bot'] < best[0]:
+            best = (modules['mafia_bot'], 'telegram.ext' in modules)
+    return best
+
+
+def build_data_dir(data_dir, games, live, players, with_index):
+    # `live` running games at night, the rest finished long ago
+    chats = []
+    for index in range(games):
+        chat_id = -1000 - index
+        state = GameState(chat_id)
+        data = state.snapshot()
+        if index < live:
+            for player in range(players):
+                transition(state, {'type': 'join', 'user_id': index * 1000 + player + 1, 'name': f"Player {player}"})
+            transition(state, {'type': 'start', 'admin_id': 1, 'seed': index})
+            data = state.snapshot()
+            data['timer'] = {'phase': 'night', 'nonce': state.phase_nonce, 'early': False, 'deadline': time.time() + 600}
+            chats.append(state)
+        dump_file(snapshot_path(chat_id, data_dir), 'game', data)
+    if with_index:
+        dump_file(index_path(data_dir), 'index', {'chats': sorted(state.chat_id for state in chats)})
+    return chats
+
+
+def push_first_update(server, state):
+    # The last live game is loaded last, so the press makes the bot load it out of turn
+    don = next(u for u, p in state.players.items() if p['role'] == 'don_mafia')
+    target = next(u for u in state.players if u != don)
+    server.push_update(callback_update('first', state.chat_id, don, encode_callback('select', state.chat_id, state.phase_nonce, target)))
+
+
+def cold_start(label, args, with_index):
+    workdir = tempfile.mkdtemp(prefix='mafia-startup-')
+    live = build_data_dir(os.path.join(workdir, 'data'), args.games, args.live, args.players, with_index)
+
+    server = FakeApiServer().start()
+    push_first_update(server, live[-1])
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN='123:abc', TELEGRAM_API_URL=server.base_url)
+    started = time.monotonic()
+    process = BotProcess(label, workdir, env)
+    try:
+        process.wait_for("games resumed", timeout=120)
+        wait_until(lambda: server.calls_to('answerCallbackQuery'), 30, "the first update")
+        polling = server.calls_to('getUpdates')[0][0] - started
+        handled = server.calls_to('answerCallbackQuery')[0][0] - started
+        answer = server.calls_to('answerCallbackQuery')[0][3].get('text')
+        resumed = next(at for at, line in process.lines if "games resumed" in line) - started
+    finally:
+        process.stop()
+        server.stop()
+    verdict = 'ok' if handled <= STARTUP_BUDGET and answer is None else 'OVER BUDGET' if answer is None else f"wrong answer: {answer}"
+    print(
+        f"{label:<18} polling {polling:5.2f} s | first update handled {handled:5.2f} s | "
+        f"all games loaded {resumed:5.2f} s | {verdict}"
+    )
+
+
+def interrupted_start(args):
+    # The first press writes the index while most games are still waiting
+    # to be loaded; SIGTERM right after it stops the loader
+    workdir = tempfile.mkdtemp(prefix='mafia-startup-')
+    data_dir = os.path.join(workdir, 'data')
+    live = build_data_dir(data_dir, args.games, args.live, args.players, with_index=False)
+
+    server = FakeApiServer().start()
+    push_first_update(server, live[-1])
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN='123:abc', TELEGRAM_API_URL=server.base_url)
+    processes = []
+    try:
+        first = BotProcess("first start", workdir, env)
+        processes.append(first)
+        wait_until(lambda: server.calls_to('answerCallbackQuery'), 30, "the first update")
+        first.stop()
+        # The loader still reports what it got through before the stop
+        loaded = next((int(line.split()[0]) for _, line in first.lines if "games resumed" in line), 0)
+        document = load_file(index_path(data_dir), 'index')
+        indexed = set(document['chats']) if document else set()
+
+        restart = BotProcess("restart", workdir, env)
+        processes.append(restart)
+        resumed = int(restart.wait_for("games resumed", timeout=120).split()[0])
+    finally:
+        for process in processes:
+            process.stop()
+        server.stop()
+    missing = len([state for state in live if state.chat_id not in indexed])
+    verdict = 'ok' if resumed == len(live) and not missing else f"LOST {len(live) - resumed} games"
+    print(
+        f"{'interrupted load':<18} first start loaded {loaded}/{len(live)} | "
+        f"live games missing from the index {missing} | restart resumed {resumed}/{len(live)} | {verdict}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=5000, help="snapshots in data/")
+    parser.add_argument('--live', type=int, default=200, help="of which running games")
+    parser.add_argument('--players', type=int, default=12)
+    args = parser.parse_args()
+
+    imported, with_ext = import_time()
+    print(f"import mafia_bot   {imported:6.1f} ms (telegram.ext {'imported' if with_ext else 'deferred'})")
+    cold_start("with index", args, with_index=True)
+    cold_start("without index", args, with_index=False)
+    interrupted_start(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Exercises transport.ResilientRequest against the local fake Bot API.
+
+Each scenario reports send latency percentiles and what the retry and
+breaker logic did, and checks the behaviour we rely on:
+
+    python benchmarks/bench_transport.py
+"""
+import socket
+import time
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from fake_api import FakeApiServer
+
+from telegram.error import NetworkError, TimedOut
+
+import transport
+from transport import CircuitBreaker, create_bot
+
+
+def send_many(bot, count, workers=8):
+    latencies = []
+    errors = {}
+
+    def send(i):
+        started = time.perf_counter()
+        try:
+            bot.send_message(chat_id=i, text="bench")
+        except NetworkError as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        latencies.append(time.perf_counter() - started)
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(send, range(count)))
+    return latencies, errors
+
+
+def report(label, latencies, errors, request):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{label:<34} p50 {quantiles[49] * 1000:7.1f} ms | p99 {quantiles[98] * 1000:7.1f} ms | "
+        f"max {max(latencies) * 1000:7.1f} ms | errors {errors} | stats {request.stats} | "
+        f"breaker {request.breaker.state} (opened {request.breaker.times_opened}x)"
+    )
+
+
+def scenario(label, count=200, breaker=None, **server_kwargs):
+    server = FakeApiServer(seed=1, **server_kwargs).start()
+    bot = create_bot('123:abc', base_url=server.base_url, breaker=breaker)
+    latencies, errors = send_many(bot, count)
+    report(label, latencies, errors, bot.request)
+    return server, bot, latencies, errors
+
+
+def main():
+    transport.RETRY_BACKOFF = 0.01
+
+    # Healthy API: no retries, no breaker activity
+    server, bot, _, errors = scenario("healthy, 20ms latency", latency=0.02)
+    assert not errors and bot.request.breaker.state == 'closed'
+    server.stop()
+
+    # Slow responses beyond the sendMessage read timeout are cut off instead of stalling
+    transport.METHOD_TIMEOUTS['sendMessage'] = (transport.CONNECT_TIMEOUT, 0.2)
+    server, bot, latencies, errors = scenario(
+        "10% hung responses", count=100, hang_rate=0.1, hang_for=2.0,
+        breaker=CircuitBreaker(failure_threshold=1000)
+    )
+    assert max(latencies) < 1.0, "hung sendMessage was not cut off by its read timeout"
+    assert errors.get('TimedOut'), "expected timeouts from hung responses"
+    server.stop()
+
+    # Hard outage: the breaker opens, later sends are deferred without touching the API
+    server, bot, latencies, _ = scenario(
+        "100% 502 errors", error_rate=1.0, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.5)
+    )
+    request = bot.request
+    assert request.breaker.state == 'open'
+    assert request.stats['deferred'] > 0
+    hits_while_open = server.count('sendMessage')
+    assert hits_while_open < 200, "breaker did not stop traffic to a failing API"
+
+    # Recovery: once the API is healthy the next call closes the breaker and flushes the queue
+    server.error_rate = 0.0
+    time.sleep(0.6)
+    queued = len(request.deferred)
+    bot.send_message(chat_id=1, text="probe")
+    for _ in range(100):
+        if not request.deferred:
+            break
+        time.sleep(0.05)
+    print(f"{'recovery':<34} flushed {queued - len(request.deferred)}/{queued} deferred sends, "
+          f"breaker {request.breaker.state}")
+    assert request.breaker.state == 'closed' and not request.deferred
+    server.stop()
+
+    # Intermittent 502s on idempotent calls are absorbed by retries
+    server = FakeApiServer(error_rate=0.3, seed=2).start()
+    bot = create_bot('123:abc', base_url=server.base_url, breaker=CircuitBreaker(failure_threshold=1000))
+    failures = 0
+    for _ in range(100):
+        try:
+            bot.get_me()
+        except (NetworkError, TimedOut):
+            failures += 1
+    print(f"{'30% 502 on getMe':<34} failures after retries {failures}/100, stats {bot.request.stats}")
+    assert failures < 10
+    server.stop()
+
+    # Connection refused: nothing was sent, so even sendMessage is retried, each attempt failing fast
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    bot = create_bot('123:abc', base_url=f"http://127.0.0.1:{port}/bot", breaker=CircuitBreaker(failure_threshold=1000))
+    latencies, errors = send_many(bot, 20, workers=4)
+    report("connection refused", latencies, errors, bot.request)
+    assert bot.request.stats['retries'] == 20 * transport.MAX_RETRIES, "refused sendMessage was not retried"
+    assert max(latencies) < 1.0, "connect errors were retried inside urllib3 as well"
+
+
+if __name__ == '__main__':
+    main()
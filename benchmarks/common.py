@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+import tempfile
+
+# Benchmarks run from the repository root or from this directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class FakeBot:
+    # Stands in for telegram.Bot: records calls instead of hitting the API
+    username = 'mafia_bench_bot'
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    def delete_message(self, chat_id, message_id):
+        pass
+
+
+def use_temp_data_dir():
+    # The bot writes to ./data, keep benchmark runs out of the real one
+    path = tempfile.mkdtemp(prefix='mafia_bench_')
+    os.chdir(path)
+    return path
+
+
+def timed(label, func, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<45} {elapsed * 1000:10.3f} ms")
+    return result
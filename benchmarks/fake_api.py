@@ -0,0 +1,125 @@
+"""Local stand-in for the Bot API that injects latency and errors.
+
+    server = FakeApiServer(latency=0.05, error_rate=0.2).start()
+    bot = transport.create_bot('123:abc', base_url=server.base_url)
+
+Updates queued with push_update() are served to getUpdates long polling,
+so a whole bot process can run against it (TELEGRAM_API_URL=server.base_url).
+"""
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeApiServer:
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=502, hang_rate=0.0, hang_for=30.0, seed=None):
+        self.latency = latency  # seconds added to every response
+        self.error_rate = error_rate  # share of requests answered with error_status
+        self.error_status = error_status
+        self.hang_rate = hang_rate  # share of requests that sleep hang_for before answering
+        self.hang_for = hang_for
+        self.random = random.Random(seed)
+        self.requests = []  # (api method, status) in arrival order
+        self.calls = []  # (time, api method, bot token, params) in arrival order
+        self.updates = []  # served to getUpdates
+        self.confirmed = 0  # updates up to this id were confirmed by a poller
+        self.lock = threading.Lock()
+        self.updates_ready = threading.Condition(self.lock)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/bot"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, api_method=None, status=None):
+        with self.lock:
+            return sum(
+                1 for method, code in self.requests
+                if (api_method is None or method == api_method) and (status is None or code == status)
+            )
+
+    def push_update(self, update):
+        with self.lock:
+            update['update_id'] = len(self.updates) + 1
+            self.updates.append(update)
+            self.updates_ready.notify_all()
+        return update['update_id']
+
+    def calls_to(self, api_method, since=0.0):
+        with self.lock:
+            return [call for call in self.calls if call[1] == api_method and call[0] >= since]
+
+    def get_updates(self, params):
+        # Like Telegram: an offset confirms every update before it, and a
+        # long poll waits up to its timeout for the first unconfirmed one
+        deadline = time.monotonic() + min(float(params.get('timeout') or 0), 5.0)
+        with self.lock:
+            self.confirmed = max(self.confirmed, int(params.get('offset') or 1) - 1)
+            while len(self.updates) <= self.confirmed and time.monotonic() < deadline:
+                self.updates_ready.wait(deadline - time.monotonic())
+            return self.updates[self.confirmed:self.confirmed + int(params.get('limit') or 100)]
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    params = json.loads(raw) if raw else {}
+                except ValueError:
+                    params = {}  # multipart uploads
+                token, api_method = self.path.rsplit('/', 2)[-2:]
+                with server.lock:
+                    roll = server.random.random()
+                    server.calls.append((time.monotonic(), api_method, token[len('bot'):], params))
+                if server.latency:
+                    time.sleep(server.latency)
+                if roll < server.hang_rate:
+                    time.sleep(server.hang_for)
+
+                if roll < server.error_rate:
+                    status = server.error_status
+                    body = {'ok': False, 'error_code': status, 'description': 'Injected error'}
+                else:
+                    status = 200
+                    result = server.get_updates(params) if api_method == 'getUpdates' else server.result_for(api_method)
+                    body = {'ok': True, 'result': result}
+                with server.lock:
+                    server.requests.append((api_method, status))
+
+                payload = json.dumps(body).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up on a hung response
+
+        return Handler
+
+    @staticmethod
+    def result_for(api_method):
+        if api_method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Mafia', 'username': 'mafia_bench_bot'}
+        if api_method == 'sendMessage':
+            return {'message_id': 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'}}
+        if api_method == 'getChatMember':
+            return {'user': {'id': 1, 'is_bot': False, 'first_name': 'Admin'}, 'status': 'creator'}
+        return True
@@ -0,0 +1,264 @@
+"""Local stand-in for a Redis server, with the commands RedisStore uses.
+
+    server = FakeRedisServer().start()
+    store = RedisStore('127.0.0.1', server.port, node='node1')
+
+Speaks RESP over TCP like the real thing, so bot processes can share it
+(MAFIA_STORE=server.url). Keys expire, WATCH/MULTI/EXEC abort when a
+watched key changed, BLPOP blocks; everything else a real server does is
+left out.
+"""
+import socketserver
+import threading
+import time
+
+
+class FakeRedisServer:
+    def __init__(self):
+        self.data = {}  # key -> bytes, list of bytes, set of bytes or hash
+        self.expires = {}  # key -> time.monotonic() deadline
+        self.versions = {}  # key -> writes so far, for WATCH
+        self.commands = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)  # notified on every write, for BLPOP
+        self.tcp = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self.make_handler())
+        self.tcp.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.tcp.server_address[1]
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def start(self):
+        threading.Thread(target=self.tcp.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.tcp.shutdown()
+        self.tcp.server_close()
+
+    # Called with the lock held
+
+    def get(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.delete(key)
+        return self.data.get(key)
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.touch(key)
+
+    def touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+        self.changed.notify_all()
+
+    def delete(self, key):
+        existed = key in self.data
+        self.data.pop(key, None)
+        self.expires.pop(key, None)
+        self.touch(key)
+        return existed
+
+    def version(self, key):
+        self.get(key)  # an expired key counts as changed
+        return self.versions.get(key, 0)
+
+    def run(self, name, args):
+        if name == 'PING':
+            return 'PONG'
+        if name == 'SELECT':
+            return 'OK'
+        if name == 'GET':
+            return self.get(args[0])
+        if name == 'MGET':
+            return [self.get(key) for key in args]
+        if name == 'SET':
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            exists = self.get(key) is not None
+            if (b'NX' in options and exists) or (b'XX' in options and not exists):
+                return None
+            self.put(key, value)
+            self.expires.pop(key, None)
+            if b'PX' in options:
+                self.expires[key] = time.monotonic() + int(args[2 + options.index(b'PX') + 1]) / 1000
+            return 'OK'
+        if name == 'DEL':
+            return sum(self.delete(key) for key in args)
+        if name == 'PEXPIRE':
+            if self.get(args[0]) is None:
+                return 0
+            self.expires[args[0]] = time.monotonic() + int(args[1]) / 1000
+            self.touch(args[0])
+            return 1
+        if name == 'RPUSH':
+            items = self.get(args[0]) or []
+            items.extend(args[1:])
+            self.put(args[0], items)
+            return len(items)
+        if name == 'LRANGE':
+            items = self.get(args[0]) or []
+            start, stop = int(args[1]), int(args[2])
+            return items[start:None if stop == -1 else stop + 1]
+        if name == 'LINDEX':
+            items = self.get(args[0]) or []
+            index = int(args[1])
+            return items[index] if -len(items) <= index < len(items) else None
+        if name == 'RENAME':
+            value = self.get(args[0])
+            if value is None:
+                raise ValueError("ERR no such key")
+            self.delete(args[0])
+            self.put(args[1], value)
+            return 'OK'
+        if name == 'LPOP':
+            items = self.get(args[0])
+            if not items:
+                return None
+            item = items.pop(0)
+            if not items:
+                self.delete(args[0])
+            else:
+                self.touch(args[0])
+            return item
+        if name == 'RPOPLPUSH':
+            items = self.get(args[0])
+            if not items:
+                return None
+            item = items.pop()
+            if not items:
+                self.delete(args[0])
+            self.put(args[1], [item] + (self.get(args[1]) or []))
+            return item
+        if name in ('SADD', 'SREM'):
+            members = self.get(args[0]) or set()
+            before = len(members)
+            if name == 'SADD':
+                members.update(args[1:])
+            else:
+                members.difference_update(args[1:])
+            self.put(args[0], members)
+            return abs(len(members) - before)
+        if name == 'SMEMBERS':
+            return sorted(self.get(args[0]) or ())
+        if name == 'HINCRBY':
+            fields = self.get(args[0]) or {}
+            value = int(fields.get(args[1], 0)) + int(args[2])
+            fields[args[1]] = str(value).encode()
+            self.put(args[0], fields)
+            return value
+        if name == 'HGET':
+            return (self.get(args[0]) or {}).get(args[1])
+        if name == 'HSET':
+            fields = self.get(args[0]) or {}
+            added = sum(field not in fields for field in args[1::2])
+            fields.update(zip(args[1::2], args[2::2]))
+            self.put(args[0], fields)
+            return added
+        if name == 'HDEL':
+            fields = self.get(args[0])
+            if not fields:
+                return 0
+            removed = sum(fields.pop(field, None) is not None for field in args[1:])
+            if fields:
+                self.touch(args[0])
+            else:
+                self.delete(args[0])
+            return removed
+        if name == 'HGETALL':
+            return [item for field in (self.get(args[0]) or {}).items() for item in field]
+        raise ValueError(f"ERR unknown command '{name}'")
+
+    def make_handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                self.watched = {}  # key -> version when WATCHed
+                self.queued = None  # commands between MULTI and EXEC
+
+            def handle(self):
+                while True:
+                    try:
+                        command = self.read_command()
+                    except (ConnectionError, ValueError):
+                        return
+                    if command is None:
+                        return
+                    try:
+                        reply = self.execute(command[0].decode().upper(), command[1:])
+                    except ValueError as e:
+                        reply = e
+                    try:
+                        self.wfile.write(self.encode(reply))
+                    except OSError:
+                        return
+
+            def read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                count = int(line[1:-2])
+                args = []
+                for _ in range(count):
+                    length = int(self.rfile.readline()[1:-2])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                return args
+
+            def execute(self, name, args):
+                with server.lock:
+                    server.commands += 1
+                    if name == 'WATCH':
+                        for key in args:
+                            self.watched[key] = server.version(key)
+                        return 'OK'
+                    if name == 'UNWATCH':
+                        self.watched = {}
+                        return 'OK'
+                    if name == 'MULTI':
+                        self.queued = []
+                        return 'OK'
+                    if name == 'DISCARD':
+                        self.queued = None
+                        self.watched = {}
+                        return 'OK'
+                    if name == 'EXEC':
+                        queued, self.queued = self.queued or [], None
+                        watched, self.watched = self.watched, {}
+                        if any(server.version(key) != version for key, version in watched.items()):
+                            return None
+                        return [server.run(queued_name, queued_args) for queued_name, queued_args in queued]
+                    if self.queued is not None:
+                        self.queued.append((name, args))
+                        return 'QUEUED'
+                    if name == 'BLPOP':
+                        # Keys then a timeout in seconds
+                        deadline = time.monotonic() + float(args[-1])
+                        while True:
+                            for key in args[:-1]:
+                                if server.get(key):
+                                    return [key, server.run('LPOP', [key])]
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                return None
+                            server.changed.wait(remaining)
+                    return server.run(name, args)
+
+            def encode(self, reply):
+                if reply is None:
+                    return b'$-1\r\n'
+                if isinstance(reply, Exception):
+                    return b'-%s\r\n' % str(reply).encode()
+                if isinstance(reply, str):
+                    return b'+%s\r\n' % reply.encode()
+                if isinstance(reply, int):
+                    return b':%d\r\n' % reply
+                if isinstance(reply, bytes):
+                    return b'$%d\r\n%s\r\n' % (len(reply), reply)
+                return b'*%d\r\n' % len(reply) + b''.join(self.encode(item) for item in reply)
+
+        return Handler
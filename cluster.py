@@ -0,0 +1,187 @@
+"""Several bot nodes sharing one store (store.py).
+
+Each chat is driven by one node at a time, the one holding the chat's
+lease: it has the game in memory, runs its phase timers and writes its
+state, and the store refuses writes from any other node. Leases are
+renewed every LEASE_TTL / 3 seconds. When a node dies it stops renewing,
+and LEASE_TTL later the least loaded of the other nodes takes over its
+live chats, loading them from the store with their timers running to the
+original deadlines. A node that drains (SIGTERM) releases its leases, so
+the takeover doesn't wait for them to expire.
+
+Telegram gives out updates to one poller per bot, so the node holding the
+'ingress' lease polls and the others don't. Every node routes the updates
+it gets: one about a chat another node holds goes to that node's inbox in
+the store, one about a chat nobody holds goes to the least loaded node,
+which claims the chat. Games, their timers and their sends are spread
+over the nodes, so capacity grows with each node added; the poller only
+reads updates and passes them on.
+"""
+import os
+import threading
+import time
+
+from store import lease_name
+
+LEASE_TTL = float(os.getenv('MAFIA_LEASE_TTL', 15))  # seconds a node holds a chat without renewing
+INGRESS = 'ingress'  # lease of the node polling Telegram
+INBOX_TIMEOUT = 1.0  # seconds an inbox read blocks
+
+
+class ClusterNode:
+    def __init__(self, store, ttl=LEASE_TTL):
+        if not store.shared:
+            raise ValueError(f"{type(store).__name__} can't be shared by nodes, set MAFIA_STORE to SQLite or Redis")
+        self.store = store
+        self.node_id = store.node
+        self.ttl = ttl
+        self.held = set()  # chats this node drives
+        self.ingress = False  # this node polls Telegram
+        self.nodes = {}  # node -> games it runs, as of the last heartbeat round
+        self.routed = {}  # chat -> (node, time.monotonic()) for chats sent to a node that hasn't claimed them yet
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        # Wired up by the bot
+        self.load = lambda: len(self.held)
+        self.can_take = lambda: True  # room for another game (admission)
+        self.on_claimed = lambda chat_id: None  # bring the chat's game into memory
+        self.on_lost = lambda chat_id: None  # drop it, another node drives it now
+        self.on_ingress = lambda polling: None  # start or stop polling Telegram
+        self.on_update = lambda payload: None  # an update forwarded by another node
+
+    def start(self):
+        self.maintain()
+        threading.Thread(target=self.run, name='cluster', daemon=True).start()
+        threading.Thread(target=self.read_inbox, name='inbox', daemon=True).start()
+
+    def run(self):
+        while not self.stopping.wait(self.ttl / 3):
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"Cluster: {e}")
+
+    def maintain(self):
+        # Heartbeat, lease renewal, the poller and the chats of dead nodes
+        self.store.heartbeat(self.load(), self.ttl)
+        with self.lock:
+            names = {lease_name(chat_id): chat_id for chat_id in self.held}
+        if self.ingress:
+            names[INGRESS] = None
+        kept = self.store.renew_leases(list(names), self.ttl)
+        for name, chat_id in names.items():
+            if name not in kept and name != INGRESS:
+                print(f"Cluster: lost the lease of chat {chat_id}")
+                self.drop(chat_id)
+        if self.ingress and INGRESS not in kept:
+            self.ingress = False
+            self.on_ingress(False)
+        if not self.ingress and not self.stopping.is_set() and self.store.acquire_lease(INGRESS, self.ttl):
+            self.ingress = True
+            self.on_ingress(True)
+
+        nodes = self.store.nodes()
+        for node in set(self.nodes) - set(nodes) - {self.node_id}:
+            # Whatever was forwarded to a dead node is routed again from here
+            print(f"Cluster: node {node} is gone")
+            self.store.take_inbox(node)
+        self.nodes = nodes
+        now = time.monotonic()
+        self.routed = {chat_id: (node, at) for chat_id, (node, at) in self.routed.items() if now - at < self.ttl}
+        self.take_over()
+
+    def take_over(self):
+        # Live chats without a lease belonged to a node that died; the least
+        # loaded node claims them while it has room
+        for chat_id in self.store.orphaned_chats():
+            if self.stopping.is_set() or not self.can_take() or self.least_loaded() != self.node_id:
+                return
+            if self.claim(chat_id):
+                self.nodes[self.node_id] = self.nodes.get(self.node_id, 0) + 1
+                print(f"Cluster: took over chat {chat_id}")
+
+    def least_loaded(self):
+        nodes = dict(self.nodes)
+        nodes.setdefault(self.node_id, self.load())
+        return min(nodes, key=lambda node: (nodes[node], node))
+
+    def claim(self, chat_id):
+        # True once this node drives the chat
+        with self.lock:
+            if chat_id in self.held:
+                return True
+            if self.stopping.is_set() or not self.store.acquire_lease(lease_name(chat_id), self.ttl):
+                return False
+            self.held.add(chat_id)
+        self.on_claimed(chat_id)
+        return True
+
+    def release(self, chat_id):
+        with self.lock:
+            if chat_id not in self.held:
+                return
+            self.held.discard(chat_id)
+        self.store.release_lease(lease_name(chat_id))
+
+    def drop(self, chat_id):
+        with self.lock:
+            self.held.discard(chat_id)
+        self.on_lost(chat_id)
+
+    def route(self, chat_id, forwarded=False):
+        # The node that handles updates about the chat: whoever holds it,
+        # or for a chat nobody holds, the least loaded node. Updates that
+        # were already forwarded here are not passed on a second time.
+        if chat_id in self.held:
+            return self.node_id
+        holder = self.store.lease_holder(lease_name(chat_id))
+        if holder is None and not forwarded:
+            holder = self.assign(chat_id)
+        if holder in (None, self.node_id):
+            if self.claim(chat_id):
+                return self.node_id
+            holder = self.store.lease_holder(lease_name(chat_id)) or self.node_id
+        return holder
+
+    def assign(self, chat_id):
+        # Until the chosen node claims the chat, its next updates follow the
+        # first one into the same inbox, so they arrive in order
+        now = time.monotonic()
+        node, at = self.routed.get(chat_id, (None, 0))
+        if now - at < self.ttl:
+            return node
+        node = self.least_loaded()
+        # Count the chat now, so a burst of new chats spreads out before the next heartbeat
+        self.nodes[node] = self.nodes.get(node, 0) + 1
+        self.routed[chat_id] = (node, now)
+        return node
+
+    def forward(self, node, payload):
+        self.store.push_update(node, payload)
+
+    def read_inbox(self):
+        while not self.stopping.is_set():
+            try:
+                payloads = self.store.pop_updates(INBOX_TIMEOUT)
+            except Exception as e:
+                print(f"Cluster: reading the inbox failed: {e}")
+                time.sleep(INBOX_TIMEOUT)
+                continue
+            for payload in payloads:
+                self.on_update(payload)
+
+    def stop(self):
+        # Drain: no more claims, the poller is stopped by the caller
+        self.stopping.set()
+        if self.ingress:
+            self.ingress = False
+            self.store.release_lease(INGRESS)
+
+    def leave(self):
+        # After the games are saved: hand every chat to the other nodes
+        with self.lock:
+            chats = list(self.held)
+            self.held.clear()
+        for chat_id in chats:
+            self.store.release_lease(lease_name(chat_id))
+        self.store.remove_node()
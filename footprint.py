@@ -0,0 +1,74 @@
+"""Memory and thread accounting for the bot process.
+
+process_footprint() is cheap and safe to call any time (/status, the soak
+benchmark): threads, games held in memory, pending phase timers, resident
+set size and open files. measure() is the tracemalloc part: it runs a
+builder with tracing on and reports the bytes each built object left
+allocated, split by the source file that allocated them. The soak
+benchmark uses it for the bytes per game, per player and per cache that
+are compared between releases.
+"""
+import gc
+import os
+import threading
+import tracemalloc
+
+# Allocations of the measuring itself, not of what is measured
+TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def rss_bytes():
+    # Current resident set size, None where /proc isn't available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def open_files():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def process_footprint(games, scheduler=None):
+    return {
+        'threads': threading.active_count(),
+        'resident_games': len(games),
+        'pending_timers': scheduler.pending() if scheduler else None,
+        'rss_bytes': rss_bytes(),
+        'open_files': open_files(),
+        'traced_bytes': tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+    }
+
+
+def measure(build, count, units=1):
+    # Calls build(index) `count` times and keeps the results alive; returns
+    # the bytes left allocated per call and unit (e.g. per player when every
+    # call adds `units` players), in total and by allocating source file
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        gc.collect()
+        before = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+        kept = [build(index) for index in range(count)]
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+    finally:
+        if started:
+            tracemalloc.stop()
+    by_file = {}
+    for stat in after.compare_to(before, 'filename'):
+        size = round(stat.size_diff / (count * units))
+        if size:
+            name = os.path.basename(stat.traceback[0].filename)
+            by_file[name] = by_file.get(name, 0) + size
+    del kept
+    return {'bytes': sum(by_file.values()), 'by_file': dict(sorted(by_file.items()))}
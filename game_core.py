@@ -0,0 +1,889 @@
+"""Game rules as a pure state machine.
+
+transition(state, event) applies one event (a join, a night choice, a vote,
+a phase timeout, ...) to a GameState and returns the effects it produced:
+messages to send, journal events and snapshots to persist, timers to
+schedule. Nothing in here touches the network, the disk or the clock, so a
+transition takes microseconds and whole games can be played in bulk; the
+bot runs the effects afterwards (EffectExecutor in mafia_bot.py).
+
+Effects are plain dicts with a 'type':
+    send         {'chat_id', 'text', 'parse_mode'?, 'keyboard'?}
+    dm           {'user_id', 'text', 'parse_mode'?, 'keyboard'?}
+    reply        {'ok', 'text'}              answer to the user behind the event
+    journal      {'event'}
+    snapshot     {'data'}                    full state, journal can be compacted
+    schedule     {'phase', 'duration', 'nonce', 'early'?}
+    cancel_timer {}
+    rewards      {'winners', 'roles'}
+    archive      {'record'}
+
+Events may carry 'now' (a monotonic timestamp from the caller); it is only
+used for the minimum dwell of early phase endings.
+
+Keyboards are rows of button dicts, {'text', 'callback_data'} or
+{'text', 'url'}; urls contain a {bot_username} placeholder.
+"""
+import os
+import json
+import random
+
+from rendering import PlayerListCache, render_registration, render_game_start, render_morning
+
+# Constants
+MIN_PLAYERS = 3
+MAX_PLAYERS = 150
+NIGHT_DURATION = 30  # seconds
+DAY_DURATION = 45   # seconds
+VOTE_DURATION = 15  # seconds
+CONFIRM_DURATION = 30  # seconds to press "As"/"Asma" before nobody is hanged
+MIN_PHASE_DWELL = 10  # seconds a phase lasts at least when it can end early
+WIN_REWARD = 20
+LOSE_REWARD = 10
+KEYBOARD_PAGE_SIZE = 24  # target buttons per keyboard page
+KEYBOARD_COLUMNS = 3
+KEYBOARD_SINGLE_COLUMN_LIMIT = 8  # small lobbies keep one button per row
+MAFIA_PER_KILL = 4  # the mafia get one extra kill per night for every 4 living members
+COMPACT_EVERY = 100  # events between snapshots
+
+PHASE_DURATIONS = {
+    'night': NIGHT_DURATION,
+    'day': DAY_DURATION,
+    'vote': VOTE_DURATION,
+    'hang_confirm': CONFIRM_DURATION
+}
+
+# Game roles with emojis and descriptions
+ROLES = {
+    'don_mafia': {
+        'name': '🕴 Don Mafia',
+        'description': 'Bütün mafiyaların başçısıdır. Gecə olduğu zaman bir oyunçunu seçərək öldürə bilər.',
+        'is_active': True
+    },
+    'mafia': {
+        'name': '🤵🏻 Mafia',
+        'description': 'Don mafia öldüyü zaman Don mafia roluna keçər. Gecə olduğu zaman Don mafianın əmri ilə hərəkət edər.',
+        'is_active': True
+    },
+    'doctor': {
+        'name': '👨🏻‍⚕️ Hekim',
+        'description': 'İlk gecə istəsə özünü xilas edə bilər. Hər gecə bir oyunçunu seçərək onu ölümdən qoruya bilər.',
+        'is_active': True
+    },
+    'detective': {
+        'name': '🕵🏻‍♂️ Komisar Katani',
+        'description': 'Gecə olduğu zaman bir oyunçunu yoxlaya və ya silahını çəkərək vura bilər.',
+        'is_active': True
+    },
+    'citizen': {
+        'name': '👫 Vətəndaş',
+        'description': 'Heç bir aktiv rolu yoxdur. Gecə danışa bilməz. Səhər müzakirə edərək mafiyanı tapıb asdıra bilər.',
+        'is_active': False
+    },
+    'crazy': {
+        'name': '🧌 Dəli',
+        'description': 'Bu rola sahib olan oyunçu oyun başladığı zaman random rollardan birini verər. Ancaq hekim və komisar rollarını ala bilər.',
+        'is_active': False
+    }
+}
+
+# Role categories
+ROLE_CATEGORIES = {
+    'citizens': ['doctor', 'detective', 'citizen', 'crazy'],
+    'mafia': ['don_mafia', 'mafia']
+}
+
+# Tuned role setups written by role_simulator.py ({player_count: [roles]})
+ROLE_TABLE_FILE = os.path.join('data', 'role_table.json')
+
+def load_role_table(file_path=ROLE_TABLE_FILE):
+    if not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error loading role table {file_path}: {e}")
+        return {}
+    
+    role_table = {}
+    for player_count, entry in data.get('table', {}).items():
+        roles = entry['roles'] if isinstance(entry, dict) else entry
+        # Ignore setups that mention unknown roles or don't fit the player count
+        if len(roles) == int(player_count) and all(role in ROLES for role in roles):
+            role_table[int(player_count)] = list(roles)
+    return role_table
+
+# Read once at import, transitions only look it up
+ROLE_TABLE = load_role_table()
+
+def role_side(role):
+    return 'mafia' if role in ROLE_CATEGORIES['mafia'] else 'citizens'
+
+def default_roles(player_count):
+    roles = []
+    # Add roles based on player count
+    if player_count >= 3:
+        roles.extend(['don_mafia', 'doctor', 'detective'])
+    if player_count >= 4:
+        roles.append('mafia')
+    if player_count >= 5:
+        roles.append('crazy')
+    
+    # Large lobbies: scale the mafia and the doctors with the player count
+    if player_count > 8:
+        roles.extend(['mafia'] * (player_count // 4 - 2))
+        roles.extend(['doctor'] * (player_count // 12))
+        roles.extend(['detective'] * (player_count // 25))
+    
+    # Fill remaining slots with citizens
+    roles.extend(['citizen'] * (player_count - len(roles)))
+    return roles
+
+# Callback data layout: <version>.<action code>.<chat id>.<phase nonce>.<target>
+# Numbers are base36 so the whole string stays well under Telegram's 64 byte limit.
+CALLBACK_VERSION = '1'
+CALLBACK_MAX_BYTES = 64
+CALLBACK_ACTIONS = {
+    'start': 's',
+    'select': 'n',
+    'check': 'c',
+    'shoot': 'x',
+    'detective_check': 'k',
+    'detective_shoot': 'g',
+    'vote': 'v',
+    'hang': 'h',
+    'no_hang': 'o',
+    'page': 'p',
+    'noop': 'z'
+}
+CALLBACK_CODES = {code: action for action, code in CALLBACK_ACTIONS.items()}
+PLAYER_TARGET_ACTIONS = ('select', 'check', 'shoot', 'vote', 'hang')  # their target is a player id
+BASE36_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+def to_base36(number):
+    if number < 0:
+        return '-' + to_base36(-number)
+    digits = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        digits = BASE36_DIGITS[remainder] + digits
+        if not number:
+            return digits
+
+def encode_callback(action, chat_id, nonce, target=''):
+    if not isinstance(target, str):
+        target = to_base36(target)
+    data = '.'.join([CALLBACK_VERSION, CALLBACK_ACTIONS[action], to_base36(chat_id), to_base36(nonce), target])
+    if len(data.encode('utf-8')) > CALLBACK_MAX_BYTES:
+        raise ValueError(f"Callback data too long: {data}")
+    return data
+
+def decode_target(action, target):
+    # Player ids for the actions that name a player, (action, page) for page
+    # switches; raises ValueError for a target that doesn't fit the action
+    if action in PLAYER_TARGET_ACTIONS:
+        return int(target, 36)
+    if action == 'page':
+        page_action = CALLBACK_CODES.get(target[:1])
+        page = int(target[1:], 36)
+        if page_action is None or page < 0:
+            raise ValueError(f"Bad page target: {target}")
+        return page_action, page
+    return target
+
+def decode_callback(data):
+    # Returns (action, chat_id, nonce, target) or None for unknown, old or malformed data
+    parts = data.split('.')
+    if len(parts) != 5 or parts[0] != CALLBACK_VERSION:
+        return None
+    action = CALLBACK_CODES.get(parts[1])
+    if not action:
+        return None
+    try:
+        return action, int(parts[2], 36), int(parts[3], 36), decode_target(action, parts[4])
+    except ValueError:
+        return None
+
+def callback_button(text, action, chat_id, nonce, target=''):
+    return {'text': text, 'callback_data': encode_callback(action, chat_id, nonce, target)}
+
+def paginated_rows(options, action, chat_id, nonce, page=0, cache=None):
+    # options: [(target_id, name)], pages are switched with 'page' callbacks
+    # whose target is the action code followed by the page number.
+    # cache ({target_id: button}) reuses buttons across the keyboards of one phase.
+    def target_button(target_id, name):
+        if cache is None:
+            return callback_button(name, action, chat_id, nonce, target_id)
+        button = cache.get(target_id)
+        if button is None:
+            button = cache[target_id] = callback_button(name, action, chat_id, nonce, target_id)
+        return button
+    
+    if len(options) <= KEYBOARD_SINGLE_COLUMN_LIMIT:
+        return [[target_button(target_id, name)] for target_id, name in options]
+    
+    page_count = (len(options) + KEYBOARD_PAGE_SIZE - 1) // KEYBOARD_PAGE_SIZE
+    page = min(max(page, 0), page_count - 1)
+    start = page * KEYBOARD_PAGE_SIZE
+    buttons = [target_button(target_id, name) for target_id, name in options[start:start + KEYBOARD_PAGE_SIZE]]
+    rows = [buttons[i:i + KEYBOARD_COLUMNS] for i in range(0, len(buttons), KEYBOARD_COLUMNS)]
+    
+    if page_count > 1:
+        page_prefix = CALLBACK_ACTIONS[action]
+        navigation = []
+        if page > 0:
+            navigation.append(callback_button("⬅️", 'page', chat_id, nonce, page_prefix + to_base36(page - 1)))
+        navigation.append(callback_button(f"{page + 1}/{page_count}", 'noop', chat_id, nonce))
+        if page < page_count - 1:
+            navigation.append(callback_button("➡️", 'page', chat_id, nonce, page_prefix + to_base36(page + 1)))
+        rows.append(navigation)
+    
+    return rows
+
+def registration_rows(chat_id, nonce):
+    return [
+        [{'text': "Oyuna qatıl", 'url': "https://t.me/{bot_username}?start=join_" + str(chat_id)}],
+        [callback_button("Oyunu başlat", 'start', chat_id, nonce)]
+    ]
+
+def start_link_rows(chat_id):
+    return [
+        [{'text': "Rolunuza baxın", 'url': "https://t.me/{bot_username}?start=role_" + str(chat_id)}],
+        [{'text': "Bota keçid", 'url': "https://t.me/{bot_username}"}]
+    ]
+
+class GameState:
+    # Everything a game is, and the only code allowed to change it. Changes
+    # are journal events: record() numbers an event, applies it and emits it
+    # as a 'journal' effect, so replaying the journal rebuilds this state.
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.players = {}  # {user_id: {'name': name, 'role': role}}
+        self.game_started = False
+        self.phase = None  # 'night', 'day', 'vote' or 'hang_confirm'
+        self.phase_nonce = 0  # bumped on every phase change, buttons and timers from older phases are rejected
+        self.admin_id = None
+        self.night_actions = {}  # {user_id: {'target_id': target_id, 'action': action}}
+        self.day_number = 1
+        self.votes = {}  # {voter_id: target_id}
+        self.vote_counts = {}  # {target_id: votes}, kept in step with self.votes
+        self.alive_counts = {'citizens': 0, 'mafia': 0}
+        self.winners = []  # List to store winning team
+        self.render_cache = PlayerListCache()  # escaped player list fragments for announcements
+        self.assigned_role_names = {'citizens': [], 'mafia': []}  # role names dealt this game, per side
+        self.seq = 0  # seq of the last recorded event
+        self.since_snapshot = 0
+        self.button_cache = {}  # {action: {target_id: button}} for the current phase
+        self.early_finish = False  # chat opted in to ending phases once their outcome is settled
+        self.awaiting_actions = set()  # living active roles that haven't chosen this night
+        self.phase_started_at = None  # 'now' of the event that started the phase
+
+    def record(self, effects, event_type, **fields):
+        self.seq += 1
+        event = {'seq': self.seq, 'type': event_type}
+        event.update(fields)
+        self.apply_event(event)
+        effects.append({'type': 'journal', 'event': event})
+        self.since_snapshot += 1
+        if self.since_snapshot >= COMPACT_EVERY:
+            self.checkpoint(effects)
+        return event
+
+    def checkpoint(self, effects):
+        self.since_snapshot = 0
+        effects.append({'type': 'snapshot', 'data': self.snapshot()})
+
+    def set_phase(self, effects, phase, day_number=None):
+        self.record(effects, 'phase', phase=phase, day_number=day_number or self.day_number)
+
+    def apply_event(self, event):
+        getattr(self, f"apply_{event['type']}")(event)
+        self.seq = max(self.seq, event['seq'])
+
+    def apply_add_player(self, event):
+        self.players[event['user_id']] = {'name': event['name'], 'role': None}
+        self.alive_counts['citizens'] += 1
+        self.render_cache.add_player(event['user_id'], event['name'])
+
+    def apply_start(self, event):
+        self.admin_id = event['admin_id']
+        self.game_started = True
+
+    def apply_assign_roles(self, event):
+        # Same seed and deck always give the same shuffle
+        roles = list(event['roles'])
+        random.Random(event['seed']).shuffle(roles)
+        for (user_id, player), role in zip(self.players.items(), roles):
+            player['role'] = role
+        self.recount_alive()
+        self.collect_assigned_role_names()
+
+    def apply_phase(self, event):
+        self.phase = event['phase']
+        self.phase_nonce += 1
+        self.day_number = event['day_number']
+        self.button_cache = {}  # buttons carry the nonce
+        if self.phase == 'night':
+            self.votes = {}  # Reset votes
+            self.vote_counts = {}
+            self.night_actions = {}  # Reset night actions
+            self.awaiting_actions = self.active_players()
+
+    def apply_settings(self, event):
+        self.early_finish = event['early_finish']
+
+    def apply_night_action(self, event):
+        self.night_actions[event['user_id']] = {'target_id': event['target_id'], 'action': event['action']}
+        self.awaiting_actions.discard(event['user_id'])
+
+    def apply_vote(self, event):
+        # Keep the tally up to date so closing the vote doesn't recount everything
+        voter_id = event['voter_id']
+        target_id = event['target_id']
+        previous_target = self.votes.get(voter_id)
+        if previous_target is not None:
+            self.vote_counts[previous_target] -= 1
+            if not self.vote_counts[previous_target]:
+                del self.vote_counts[previous_target]
+        self.votes[voter_id] = target_id
+        self.vote_counts[target_id] = self.vote_counts.get(target_id, 0) + 1
+
+    def apply_kill(self, event):
+        player = self.players[event['user_id']]
+        player['is_dead'] = True
+        self.alive_counts[role_side(player['role'])] -= 1
+        self.render_cache.remove_player(event['user_id'])
+        self.awaiting_actions.discard(event['user_id'])
+
+    def apply_game_over(self, event):
+        self.game_started = False
+        self.winners = list(event['winners'])
+
+    def apply_reset(self, event):
+        self.players = {}
+        self.game_started = False
+        self.admin_id = None
+        self.night_actions = {}
+        self.day_number = 1
+        self.votes = {}
+        self.vote_counts = {}
+        self.alive_counts = {'citizens': 0, 'mafia': 0}
+        self.winners = []
+        self.render_cache.clear()
+        self.assigned_role_names = {'citizens': [], 'mafia': []}
+        self.awaiting_actions = set()
+
+    def is_alive(self, user_id):
+        player = self.players.get(user_id)
+        return player is not None and 'is_dead' not in player
+
+    def active_players(self):
+        return {
+            user_id for user_id, player in self.players.items()
+            if 'is_dead' not in player and player['role'] and ROLES[player['role']]['is_active']
+        }
+
+    def recount_alive(self):
+        # Full recount, only needed after role assignment or loading a saved game
+        self.alive_counts = {'citizens': 0, 'mafia': 0}
+        for player in self.players.values():
+            if 'is_dead' not in player:
+                self.alive_counts[role_side(player['role'])] += 1
+        self.vote_counts = {}
+        for target_id in self.votes.values():
+            self.vote_counts[target_id] = self.vote_counts.get(target_id, 0) + 1
+
+    def collect_assigned_role_names(self):
+        # In ROLES order so the start message always lists roles the same way
+        dealt = {player['role'] for player in self.players.values()}
+        self.assigned_role_names = {
+            side: [ROLES[role]['name'] for role in ROLES if role in dealt and role in ROLE_CATEGORIES[side]]
+            for side in ('citizens', 'mafia')
+        }
+
+    def generate_role_message(self, user_id):
+        player = self.players[user_id]
+        role = ROLES[player['role']]
+        
+        message = (
+            f"Sizin rolunuz: {role['name']}\n\n"
+            f"{role['description']}\n"
+        )
+        
+        if role['is_active']:
+            message += "\nSeciminizi edin:"
+        
+        return message
+
+    def selection_rows(self, user_id, action_type=None, page=0):
+        player = self.players[user_id]
+        role = player['role']
+        
+        # For detective, first show action selection
+        if role == 'detective' and not action_type:
+            return [[
+                callback_button("Yoxla", 'detective_check', self.chat_id, self.phase_nonce),
+                callback_button("Silahını çək", 'detective_shoot', self.chat_id, self.phase_nonce)
+            ]]
+        
+        # Filter out players based on role
+        available_players = []
+        for target_id, target in self.players.items():
+            if target_id != user_id and 'is_dead' not in target:  # Can't select self
+                if role in ['don_mafia', 'mafia']:
+                    # Mafia can't see other mafia members
+                    if target['role'] not in ROLE_CATEGORIES['mafia']:
+                        available_players.append((target_id, target['name']))
+                else:
+                    available_players.append((target_id, target['name']))
+        
+        action = action_type or 'select'
+        return paginated_rows(
+            available_players, action, self.chat_id, self.phase_nonce, page, self.button_cache.setdefault(action, {})
+        )
+
+    def vote_rows(self, voter_id, page=0):
+        # Filter out dead players and voter
+        available_players = []
+        for target_id, player in self.players.items():
+            if target_id != voter_id and 'is_dead' not in player:
+                available_players.append((target_id, player['name']))
+        
+        return paginated_rows(
+            available_players, 'vote', self.chat_id, self.phase_nonce, page, self.button_cache.setdefault('vote', {})
+        )
+
+    def generate_morning_message(self):
+        # Process night actions
+        killed_players = []
+        healed_players = []
+        
+        for user_id, action in self.night_actions.items():
+            target_id = action['target_id']
+            if action['action'] == 'kill':
+                killed_players.append(target_id)
+            elif action['action'] == 'heal':
+                healed_players.append(target_id)
+        
+        # Remove healed players from killed list
+        killed_players = [p for p in killed_players if p not in healed_players]
+        
+        # Generate night results message
+        night_results = []
+        for killed_id in killed_players:
+            killer_role = None
+            for user_id, action in self.night_actions.items():
+                if action['target_id'] == killed_id and action['action'] == 'kill':
+                    killer_role = ROLES[self.players[user_id]['role']]['name']
+                    break
+            
+            if killer_role:
+                night_results.append(
+                    f"{ROLES[self.players[killed_id]['role']]['name']} gecə öldürüldü. "
+                    f"Onun öldürən {killer_role} idi."
+                )
+        
+        for healed_id in healed_players:
+            if healed_id in killed_players:
+                night_results.append(
+                    f"{ROLES[self.players[healed_id]['role']]['name']} gecə ölümlə üzləşdi "
+                    f"ancaq {ROLES['doctor']['name']} iş başında idi, o ölmədi."
+                )
+        
+        return render_morning(self.render_cache, self.alive_counts, self.chat_id, self.day_number, night_results)
+
+    def generate_game_start_message(self):
+        return render_game_start(
+            self.render_cache,
+            self.alive_counts,
+            self.assigned_role_names['citizens'],
+            self.assigned_role_names['mafia']
+        )
+
+    def generate_registration_message(self):
+        return render_registration(self.render_cache)
+
+    def mafia_kill_targets(self):
+        # The don's choice always comes first, the rest of the mafia fill the
+        # remaining kills by how many of them picked the same target
+        kill_budget = max(1, self.alive_counts['mafia'] // MAFIA_PER_KILL)
+        don_targets = []
+        mafia_votes = {}
+        for user_id, action in self.night_actions.items():
+            role = self.players[user_id]['role']
+            if role == 'don_mafia' and action['action'] == 'kill':
+                don_targets.append(action['target_id'])
+            elif role == 'mafia' and action['action'] == 'kill':
+                mafia_votes[action['target_id']] = mafia_votes.get(action['target_id'], 0) + 1
+        
+        targets = don_targets[:kill_budget]
+        for target_id in sorted(mafia_votes, key=mafia_votes.get, reverse=True):
+            if len(targets) >= kill_budget:
+                break
+            if target_id not in targets:
+                targets.append(target_id)
+        return targets
+
+    def snapshot(self):
+        # Player dicts are copied so the snapshot can be written while the game goes on
+        return {
+            'chat_id': self.chat_id,
+            'players': {user_id: dict(player) for user_id, player in self.players.items()},
+            'game_started': self.game_started,
+            'phase': self.phase,
+            'admin_id': self.admin_id,
+            'night_actions': {user_id: dict(action) for user_id, action in self.night_actions.items()},
+            'day_number': self.day_number,
+            'votes': dict(self.votes),
+            'phase_nonce': self.phase_nonce,
+            'winners': list(self.winners),
+            'early_finish': self.early_finish,
+            'journal_seq': self.seq
+        }
+
+    def restore_snapshot(self, data):
+        # JSON object keys are strings, user ids are ints everywhere else
+        self.players = {int(user_id): player for user_id, player in data['players'].items()}
+        self.game_started = data['game_started']
+        self.phase = data['phase']
+        self.admin_id = data['admin_id']
+        self.night_actions = {int(user_id): action for user_id, action in data.get('night_actions', {}).items()}
+        self.day_number = data.get('day_number', 1)
+        self.phase_nonce = data.get('phase_nonce', 0)
+        self.votes = {int(voter_id): target_id for voter_id, target_id in data.get('votes', {}).items()}
+        self.winners = data.get('winners', [])
+        self.early_finish = data.get('early_finish', False)
+        self.seq = data.get('journal_seq', 0)
+        self.since_snapshot = 0
+        self.button_cache = {}
+        self.recount_alive()
+        self.render_cache.rebuild(self.players)
+        self.collect_assigned_role_names()
+        self.awaiting_actions = self.active_players() - set(self.night_actions) if self.phase == 'night' else set()
+        self.phase_started_at = None
+
+def reply(effects, ok, text=None):
+    effects.append({'type': 'reply', 'ok': ok, 'text': text})
+
+def send(effects, chat_id, text, **options):
+    effects.append(dict(type='send', chat_id=chat_id, text=text, **options))
+
+def dm(effects, user_id, text, **options):
+    effects.append(dict(type='dm', user_id=user_id, text=text, **options))
+
+def schedule(state, effects, phase, duration=None, early=False):
+    effects.append({
+        'type': 'schedule',
+        'phase': phase,
+        'duration': PHASE_DURATIONS[phase] if duration is None else duration,
+        'nonce': state.phase_nonce,
+        'early': early
+    })
+
+def night_settled(state):
+    # Every living don, mafia, doctor and detective has made a choice
+    return not state.awaiting_actions
+
+def vote_settled(state):
+    # A strict majority of the living players agree on one target
+    alive_total = state.alive_counts['citizens'] + state.alive_counts['mafia']
+    return bool(state.vote_counts) and max(state.vote_counts.values()) * 2 > alive_total
+
+# Phases that may end before their timer; phase -> settled(state)
+PHASE_CONTROLLERS = {
+    'night': night_settled,
+    'vote': vote_settled
+}
+
+def phase_elapsed(state, event):
+    # None when the caller keeps no clock (simulations, replays)
+    if event.get('now') is None or state.phase_started_at is None:
+        return None
+    return event['now'] - state.phase_started_at
+
+def finish_phase_early(state, event, effects):
+    # Opted-in chats skip the rest of a phase once its outcome can't change,
+    # but never before MIN_PHASE_DWELL; until then the timer is brought forward
+    settled = PHASE_CONTROLLERS.get(state.phase)
+    if not state.early_finish or not settled or not settled(state):
+        return
+    elapsed = phase_elapsed(state, event)
+    if elapsed is not None and elapsed < MIN_PHASE_DWELL:
+        schedule(state, effects, state.phase, MIN_PHASE_DWELL - elapsed, early=True)
+        return
+    end_phase(state, effects)
+
+def end_phase(state, effects):
+    if state.phase == 'night':
+        resolve_night(state, effects)
+    elif state.phase == 'day':
+        open_vote(state, effects)
+    elif state.phase == 'vote':
+        close_vote(state, effects)
+    elif state.phase == 'hang_confirm':
+        skip_hang(state, effects)
+
+def on_join(state, event, effects):
+    user_id = event['user_id']
+    if state.game_started:
+        return reply(effects, False, "Oyun artıq başladılıb və ya mövcud deyil!")
+    if len(state.players) >= MAX_PLAYERS:
+        return reply(effects, False, "Oyun artıq maksimum oyunçu sayına çatıb!")
+    if user_id in state.players:
+        return reply(effects, False, "Siz artıq qeydiyyatdan keçmisiniz!")
+    state.record(effects, 'add_player', user_id=user_id, name=event['name'])
+    reply(effects, True, "Qeydiyyat uğurla tamamlandı!")
+
+def on_start(state, event, effects):
+    if state.game_started:
+        return reply(effects, False, "Oyun artıq başladılıb!")
+    if len(state.players) < MIN_PLAYERS:
+        return reply(effects, False, f"Minimum {MIN_PLAYERS} oyunçu lazımdır!")
+    state.record(effects, 'start', admin_id=event['admin_id'])
+    
+    # Prefer the simulator-tuned setup for this player count; the seed comes
+    # with the event and is journaled so replays deal the same hands
+    roles = list(ROLE_TABLE.get(len(state.players), [])) or default_roles(len(state.players))
+    state.record(effects, 'assign_roles', roles=roles, seed=event['seed'])
+    state.set_phase(effects, 'night')
+    schedule(state, effects, 'night')
+    reply(effects, True, state.generate_game_start_message())
+    
+    # Role information to each player, and the selection keyboard for active roles
+    for user_id, player in state.players.items():
+        dm(effects, user_id, state.generate_role_message(user_id), parse_mode='HTML')
+        if ROLES[player['role']]['is_active']:
+            dm(effects, user_id, "Seciminizi edin:", keyboard=state.selection_rows(user_id))
+
+def on_night_action(state, event, effects):
+    user_id = event['user_id']
+    target_id = event['target_id']
+    if state.phase != 'night' or not state.is_alive(user_id) or not state.is_alive(target_id):
+        return reply(effects, False)
+    
+    role = state.players[user_id]['role']
+    if role == 'don_mafia':
+        action, message = 'kill', "🕴 Don qurbanı seçdi.."
+    elif role == 'mafia':
+        action, message = 'kill', "🤵🏻 Mafia qurbanı nişan aldı.."
+    elif role == 'doctor':
+        action, message = 'heal', "👨🏻‍⚕️ Həkim gecə növbəsinə çıxdı.."
+    elif role == 'detective' and event.get('action') == 'check':
+        action, message = 'check', "🕵🏻‍♂️ Komissar yaramazları axtarmağa getdi!"
+    elif role == 'detective':
+        action, message = 'shoot', "🕵🏻‍♂️ Komissar silahını çəkdi"
+    else:
+        return reply(effects, False)
+    
+    state.record(effects, 'night_action', user_id=user_id, target_id=target_id, action=action)
+    send(effects, state.chat_id, message)
+    reply(effects, True, "Seçiminiz qeydə alındı.")
+    finish_phase_early(state, event, effects)
+
+def on_vote(state, event, effects):
+    voter_id = event['voter_id']
+    target_id = event['target_id']
+    if state.phase != 'vote' or voter_id == target_id or not state.is_alive(voter_id) or not state.is_alive(target_id):
+        return reply(effects, False)
+    state.record(effects, 'vote', voter_id=voter_id, target_id=target_id)
+    reply(effects, True, "Səs verməniz qeydə alındı.")
+    
+    # Check if all alive players have voted
+    alive_total = state.alive_counts['citizens'] + state.alive_counts['mafia']
+    if len(state.votes) == alive_total:
+        close_vote(state, effects)
+    else:
+        finish_phase_early(state, event, effects)
+
+def on_hang(state, event, effects):
+    target_id = event['target_id']
+    if state.phase != 'hang_confirm' or not state.is_alive(target_id):
+        return reply(effects, False)
+    reply(effects, True)
+    state.record(effects, 'kill', user_id=target_id)
+    target = state.players[target_id]
+    send(effects, state.chat_id, f"{target['name']} ({ROLES[target['role']]['name']}) asıldı!")
+    
+    # Check if game is over
+    if check_game_end(state, effects):
+        return
+    start_next_night(state, effects)
+
+def on_no_hang(state, event, effects):
+    if state.phase != 'hang_confirm':
+        return reply(effects, False)
+    reply(effects, True)
+    skip_hang(state, effects)
+
+def on_timeout(state, event, effects):
+    # Timers of a phase that already ended (early vote close, restart) are ignored
+    if event['nonce'] != state.phase_nonce or event['phase'] != state.phase:
+        return
+    if event.get('early') and not PHASE_CONTROLLERS[state.phase](state):
+        # A vote changed after the timer was brought forward, back to the full phase
+        elapsed = phase_elapsed(state, event)
+        remaining = PHASE_DURATIONS[state.phase] - (elapsed or 0)
+        if remaining > 0:
+            schedule(state, effects, state.phase, remaining)
+            return
+    end_phase(state, effects)
+
+def on_settings(state, event, effects):
+    if event['early_finish'] != state.early_finish:
+        state.record(effects, 'settings', early_finish=event['early_finish'])
+    if state.early_finish:
+        reply(effects, True, "⚡ Sürətli fazalar aktivdir: hamı seçimini edəndə və ya səslərin çoxluğu bir oyunçuda "
+                             f"toplananda faza ən azı {MIN_PHASE_DWELL} saniyədən sonra erkən bitir.")
+    else:
+        reply(effects, True, "Sürətli fazalar söndürüldü, fazalar tam müddət davam edir.")
+
+def on_end_game(state, event, effects):
+    if not state.game_started:
+        return reply(effects, False, "Oyun hələ başlamayıb.")
+    finish(state, effects, ['citizens'])  # Default to citizens winning
+    reply(effects, True, "Oyun bitdi! Bütün oyunçular mükafatlarını aldılar.")
+
+def resolve_night(state, effects):
+    # Detective checks are answered privately
+    for user_id, action in state.night_actions.items():
+        if action['action'] == 'check' and state.players[user_id]['role'] == 'detective':
+            target = state.players[action['target_id']]
+            dm(effects, user_id, f"{target['name']} {ROLES[target['role']]['name']}dir")
+    
+    # Process doctor's save
+    saved_players = set()
+    for user_id, action in state.night_actions.items():
+        if state.players[user_id]['role'] == 'doctor':
+            saved_players.add(action['target_id'])
+    
+    # Process mafia's kill
+    killed_names = []
+    for target_id in state.mafia_kill_targets():
+        if target_id not in saved_players and state.is_alive(target_id):
+            state.record(effects, 'kill', user_id=target_id)
+            killed_names.append(state.players[target_id]['name'])
+    
+    # Send morning message
+    morning_message = "Səhər oldu! Gecə hadisələri:\n\n"
+    if killed_names:
+        morning_message += f"Gecə {', '.join(killed_names)} öldürüldü.\n"
+    else:
+        morning_message += "Bu gecə heç kim ölmədi.\n"
+    send(effects, state.chat_id, morning_message)
+    
+    # Check if game is over
+    if check_game_end(state, effects):
+        return
+    
+    # Start day phase
+    state.set_phase(effects, 'day')
+    schedule(state, effects, 'day')
+
+def open_vote(state, effects):
+    state.set_phase(effects, 'vote')
+    send(effects, state.chat_id, "İndi səs vermə vaxtıdır!\nKimin mafiya olduğunu düşünürsünüz?")
+    
+    # Send vote keyboard to each player
+    for user_id, player in state.players.items():
+        if 'is_dead' not in player:
+            dm(effects, user_id, "Səs vermək üçün bir oyunçu seçin:", keyboard=state.vote_rows(user_id))
+    
+    schedule(state, effects, 'vote')
+
+def close_vote(state, effects):
+    vote_counts = state.vote_counts
+    max_votes = max(vote_counts.values()) if vote_counts else 0
+    candidates = [p for p, v in vote_counts.items() if v == max_votes]
+    
+    # No votes or a tie: nobody is hanged
+    if len(candidates) != 1:
+        skip_hang(state, effects)
+        return
+    
+    # Single candidate with most votes; the new phase retires the vote buttons
+    target_id = candidates[0]
+    state.set_phase(effects, 'hang_confirm')
+    send(
+        effects,
+        state.chat_id,
+        f"{state.players[target_id]['name']} asmaq istədiyinizə əminsiniz?",
+        keyboard=[[
+            callback_button(f"As {max_votes}", 'hang', state.chat_id, state.phase_nonce, target_id),
+            callback_button(f"Asma {max_votes}", 'no_hang', state.chat_id, state.phase_nonce)
+        ]]
+    )
+    schedule(state, effects, 'hang_confirm')
+
+def skip_hang(state, effects):
+    send(effects, state.chat_id, "Oyuncular qərar verə bilmədilər, heç kim asılmadı.")
+    start_next_night(state, effects)
+
+def start_next_night(state, effects):
+    # Entering the night also clears the votes and night actions
+    state.set_phase(effects, 'night', state.day_number + 1)
+    send(effects, state.chat_id, "Gecə düşür!\nYalnız cəsarətlilər və qorxmazlar şəhər küçələrinə çıxırlar...")
+    
+    # Send role selection to active players
+    for user_id, player in state.players.items():
+        if 'is_dead' not in player and ROLES[player['role']]['is_active']:
+            dm(effects, user_id, "Seciminizi edin:", keyboard=state.selection_rows(user_id))
+    
+    schedule(state, effects, 'night')
+
+def check_game_end(state, effects):
+    # Remaining players by side, maintained by the kill events
+    if state.alive_counts['mafia'] == 0:
+        finish(state, effects, ['citizens'], "🎉 Mülki sakinlər qalib gəldi! Mafiyalar məğlub oldu!")
+        return True
+    if state.alive_counts['mafia'] >= state.alive_counts['citizens']:
+        finish(state, effects, ['mafia'], "🎭 Mafiyalar qalib gəldi! Şəhər onların əlində!")
+        return True
+    return False
+
+def finish(state, effects, winners, announcement=None):
+    if announcement:
+        send(effects, state.chat_id, announcement)
+    state.record(effects, 'game_over', winners=winners)
+    effects.append({
+        'type': 'rewards',
+        'winners': list(winners),
+        'roles': {user_id: player['role'] for user_id, player in state.players.items()}
+    })
+    effects.append({
+        'type': 'archive',
+        'record': {
+            'players': state.snapshot()['players'],
+            'winners': list(winners),
+            'day_number': state.day_number
+        }
+    })
+    
+    # Reset for the next registration
+    state.record(effects, 'reset')
+    state.set_phase(effects, None)
+    state.checkpoint(effects)
+    effects.append({'type': 'cancel_timer'})
+
+# event['type'] -> handler(state, event, effects)
+TRANSITIONS = {
+    'join': on_join,
+    'start': on_start,
+    'night_action': on_night_action,
+    'vote': on_vote,
+    'hang': on_hang,
+    'no_hang': on_no_hang,
+    'timeout': on_timeout,
+    'settings': on_settings,
+    'end_game': on_end_game
+}
+
+def transition(state, event):
+    # The state is updated in place (copying it per event would dominate the
+    # cost); the caller owns it and runs the returned effects in order
+    effects = []
+    nonce = state.phase_nonce
+    TRANSITIONS[event['type']](state, event, effects)
+    if state.phase_nonce != nonce:
+        state.phase_started_at = event.get('now')
+    return state, effects
@@ -0,0 +1,75 @@
+"""Single-owner lock for the bot process, used to hand over between deploys.
+
+Only the process holding data/bot.lock polls Telegram and runs games. A
+new process started during a deploy blocks in ProcessLock.acquire() until
+the old one has drained (see mafia_bot.drain) and released the lock, then
+loads the games from disk and carries on. The lock is an OS file lock, so
+it is also released if the old process dies without draining.
+"""
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_POLL_INTERVAL = 0.05  # seconds between attempts while another process holds the lock
+
+
+class ProcessLock:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def try_acquire(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        f = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        # The holder's pid, for whoever wonders which process has the bot
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self.file = f
+        return True
+
+    def acquire(self, timeout=None):
+        # Waits for the current holder, False if it still has it after `timeout` seconds
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+        return True
+
+    def release(self):
+        if self.file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+
+def holder_pid(path):
+    # Pid written by the last process that held the lock, None if unknown
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0) or None
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,215 @@
+"""Append-only per-game event journal.
+
+Every state change of a game is a numbered event (game_core.GameState.record)
+appended here as one JSON line by the effect executor. The game file is a
+snapshot that records the last journal seq it contains; once it is written
+the journal moves to an archive segment named after its first event
+(compaction). Snapshot + journal tail rebuilds the exact game state, and
+the segments rebuild any point before the snapshot, finished games too:
+
+    python journal.py -1001754537100            # current state
+    python journal.py -1001754537100 --until 42 # state right after event 42
+"""
+import os
+import json
+import time
+import argparse
+import threading
+
+from serializer import load_file, dump_file
+
+DATA_DIR = 'data'
+
+
+def journal_path(chat_id, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f'journal_{chat_id}.jsonl')
+
+
+def segment_path(chat_id, first_seq, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f'journal_{chat_id}.{first_seq}.jsonl')
+
+
+def segment_paths(chat_id, data_dir=DATA_DIR):
+    # The archived segments of a chat's journal, oldest first
+    prefix = f'journal_{chat_id}.'
+    names = os.listdir(data_dir) if os.path.isdir(data_dir) else []
+    seqs = [name[len(prefix):-len('.jsonl')] for name in names if name.startswith(prefix) and name.endswith('.jsonl')]
+    return [segment_path(chat_id, seq, data_dir) for seq in sorted(int(seq) for seq in seqs if seq.isdigit())]
+
+
+def snapshot_path(chat_id, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f'game_{chat_id}.json')
+
+
+def index_path(data_dir=DATA_DIR):
+    return os.path.join(data_dir, 'live_games.json')
+
+
+class LiveGameIndex:
+    # Chats worth loading after a restart (lobbies with players, running
+    # games, chats with settings). Startup reads this one file instead of
+    # listing data/ and opening every snapshot in it.
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.path = index_path(data_dir)
+        self.chats = None  # read on the first update
+        self._lock = threading.Lock()
+
+    def read(self):
+        # None when there is no index yet (data/ from before it existed)
+        document = load_file(self.path, 'index')
+        return None if document is None else set(document['chats'])
+
+    def snapshot_chats(self):
+        # Every chat with a snapshot in data/
+        names = os.listdir(self.data_dir) if os.path.isdir(self.data_dir) else []
+        return {int(name[len('game_'):-len('.json')]) for name in names
+                if name.startswith('game_') and name.endswith('.json')}
+
+    def update(self, chat_id, live):
+        # Called with every snapshot written; the file changes only when a chat comes or goes
+        with self._lock:
+            if self.chats is None:
+                # No index yet: it starts out with every snapshot, so a
+                # process stopped before loading them all leaves the rest
+                # listed for the next one; loading drops the dead ones
+                chats = self.read()
+                self.chats = self.snapshot_chats() if chats is None else chats
+            if (chat_id in self.chats) == live:
+                return
+            if live:
+                self.chats.add(chat_id)
+            else:
+                self.chats.discard(chat_id)
+            dump_file(self.path, 'index', {'chats': sorted(self.chats)})
+
+    def chat_ids(self):
+        chats = self.read()
+        if chats is None:
+            # No index yet: every snapshot is a candidate, loading them builds the index
+            chats = self.snapshot_chats()
+        return sorted(chats)
+
+
+class GameJournal:
+    def __init__(self, chat_id, data_dir=DATA_DIR, persist=True):
+        self.chat_id = chat_id
+        self.data_dir = data_dir
+        self.path = journal_path(chat_id, data_dir) if persist else None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def append_events(self, events):
+        # Events already carry their seq; a whole batch goes out in one write
+        if not self.path or not events:
+            return
+        now = time.time()
+        lines = []
+        for event in events:
+            event.setdefault('ts', now)
+            lines.append(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(''.join(lines))
+            self._file.flush()
+
+    def compact(self):
+        # Called right after a snapshot containing every event written so
+        # far; the journal is kept as a segment for replays of older points
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not self.path or not os.path.exists(self.path):
+                return
+            events = read_events(self.path, limit=1)
+            if events:
+                os.replace(self.path, segment_path(self.chat_id, events[0]['seq'], self.data_dir))
+            else:
+                os.remove(self.path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_events(path, after_seq=0, until_seq=None, limit=None):
+    events = []
+    if not os.path.exists(path):
+        return events
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-append, nothing after it was written
+                break
+            if event['seq'] <= after_seq:
+                continue
+            if until_seq is not None and event['seq'] > until_seq:
+                break
+            events.append(event)
+            if len(events) == limit:
+                break
+    return events
+
+
+def read_snapshot(path):
+    return load_file(path, 'game')
+
+
+def archived_events(chat_id, data_dir=DATA_DIR, until_seq=None):
+    # Every event from the chat's first one on, out of the segments and the journal
+    events = []
+    for path in segment_paths(chat_id, data_dir) + [journal_path(chat_id, data_dir)]:
+        events.extend(read_events(path, events[-1]['seq'] if events else 0, until_seq))
+    for expected, event in enumerate(events, 1):
+        if event['seq'] != expected:
+            raise ValueError(f"The journal archive of chat {chat_id} has no event {expected}")
+    return events
+
+
+def replay(chat_id, data_dir=DATA_DIR, until_seq=None):
+    # Rebuilds the game state in memory only, nothing under data_dir is
+    # modified. A point before the snapshot is replayed from the first event
+    from game_core import GameState
+
+    snapshot = read_snapshot(snapshot_path(chat_id, data_dir))
+    after_seq = snapshot.get('journal_seq', 0) if snapshot else 0
+    game = GameState(chat_id)
+    if until_seq is not None and until_seq < after_seq:
+        events = archived_events(chat_id, data_dir, until_seq)
+    else:
+        events = read_events(journal_path(chat_id, data_dir), after_seq, until_seq)
+        if snapshot:
+            game.restore_snapshot(snapshot)
+    for event in events:
+        game.apply_event(event)
+    return game, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a game from its snapshot and journal")
+    parser.add_argument('chat_id', type=int)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--until', type=int, default=None,
+                        help="stop after this event seq; one before the snapshot is replayed from the archive")
+    parser.add_argument('--events', action='store_true', help="print the replayed events")
+    args = parser.parse_args()
+
+    game, events = replay(args.chat_id, args.data_dir, args.until)
+    if args.events:
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False))
+    print(json.dumps(game.snapshot(), ensure_ascii=False, indent=4))
+
+
+if __name__ == '__main__':
+    main()
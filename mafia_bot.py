@@ -1,1009 +1,1170 @@
-import os
-import json
-import random
-import asyncio
-import threading
-import time
-from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, CallbackContext, MessageHandler, Filters
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Constants
-MIN_PLAYERS = 3
-MAX_PLAYERS = 8
-NIGHT_DURATION = 30  # seconds
-DAY_DURATION = 45   # seconds
-VOTE_DURATION = 15  # seconds
-WIN_REWARD = 20
-LOSE_REWARD = 10
-
-# Game roles with emojis and descriptions
-ROLES = {
-    'don_mafia': {
-        'name': '🕴 Don Mafia',
-        'description': 'Bütün mafiyaların başçısıdır. Gecə olduğu zaman bir oyunçunu seçərək öldürə bilər.',
-        'is_active': True
-    },
-    'mafia': {
-        'name': '🤵🏻 Mafia',
-        'description': 'Don mafia öldüyü zaman Don mafia roluna keçər. Gecə olduğu zaman Don mafianın əmri ilə hərəkət edər.',
-        'is_active': True
-    },
-    'doctor': {
-        'name': '👨🏻‍⚕️ Hekim',
-        'description': 'İlk gecə istəsə özünü xilas edə bilər. Hər gecə bir oyunçunu seçərək onu ölümdən qoruya bilər.',
-        'is_active': True
-    },
-    'detective': {
-        'name': '🕵🏻‍♂️ Komisar Katani',
-        'description': 'Gecə olduğu zaman bir oyunçunu yoxlaya və ya silahını çəkərək vura bilər.',
-        'is_active': True
-    },
-    'citizen': {
-        'name': '👫 Vətəndaş',
-        'description': 'Heç bir aktiv rolu yoxdur. Gecə danışa bilməz. Səhər müzakirə edərək mafiyanı tapıb asdıra bilər.',
-        'is_active': False
-    },
-    'crazy': {
-        'name': '🧌 Dəli',
-        'description': 'Bu rola sahib olan oyunçu oyun başladığı zaman random rollardan birini verər. Ancaq hekim və komisar rollarını ala bilər.',
-        'is_active': False
-    }
-}
-
-# Role categories
-ROLE_CATEGORIES = {
-    'citizens': ['doctor', 'detective', 'citizen', 'crazy'],
-    'mafia': ['don_mafia', 'mafia']
-}
-
-class UserData:
-    def __init__(self, user_id):
-        self.user_id = user_id
-        self.games_played = 0
-        self.games_won = 0
-        self.total_money = 0
-        self.load_data()
-
-    def load_data(self):
-        file_path = f"data/users/{self.user_id}.json"
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.games_played = data.get('games_played', 0)
-                self.games_won = data.get('games_won', 0)
-                self.total_money = data.get('total_money', 0)
-
-    def save_data(self):
-        os.makedirs("data/users", exist_ok=True)
-        file_path = f"data/users/{self.user_id}.json"
-        data = {
-            'games_played': self.games_played,
-            'games_won': self.games_won,
-            'total_money': self.total_money
-        }
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-
-    def add_game_result(self, won):
-        self.games_played += 1
-        if won:
-            self.games_won += 1
-            self.total_money += WIN_REWARD
-        else:
-            self.total_money += LOSE_REWARD
-        self.save_data()
-
-class MafiaGame:
-    def __init__(self, chat_id):
-        self.chat_id = chat_id
-        self.players = {}  # {user_id: {'name': name, 'role': role}}
-        self.game_started = False
-        self.phase = None  # 'night' or 'day'
-        self.admin_id = None
-        self.night_actions = {}  # {user_id: {'target_id': target_id, 'action': action}}
-        self.day_number = 1
-        self.phase_timer = None
-        self.bot = None
-        self.votes = {}  # {voter_id: target_id}
-        self.winners = []  # List to store winning team
-        self.save_game_state()
-
-    def set_bot(self, bot):
-        self.bot = bot
-
-    def start_phase_timer(self, phase, duration):
-        if self.phase_timer:
-            self.phase_timer.cancel()
-        
-        def timer_callback():
-            if phase == 'night':
-                self.process_night_actions()
-            elif phase == 'day':
-                self.end_day()
-            elif phase == 'vote':
-                self.end_vote()
-        
-        self.phase_timer = threading.Timer(duration, timer_callback)
-        self.phase_timer.start()
-
-    def end_night(self):
-        if self.bot:
-            # Send morning message
-            morning_message = self.generate_morning_message()
-            self.bot.send_message(
-                chat_id=self.chat_id,
-                text=morning_message,
-                parse_mode='HTML'
-            )
-            # Start day phase
-            self.phase = 'day'
-            self.start_phase_timer('day', DAY_DURATION)
-            self.save_game_state()
-
-    def end_day(self):
-        if self.bot:
-            # Start voting phase
-            self.phase = 'vote'
-            vote_message = (
-                "İndi səs vermə vaxtıdır!\n"
-                "Kimin mafiya olduğunu düşünürsünüz?"
-            )
-            self.bot.send_message(chat_id=self.chat_id, text=vote_message)
-            
-            # Send vote keyboard to each player
-            for user_id, player in self.players.items():
-                if 'is_dead' not in player:
-                    try:
-                        keyboard = self.generate_vote_keyboard(user_id)
-                        self.bot.send_message(
-                            chat_id=user_id,
-                            text="Səs vermək üçün bir oyunçu seçin:",
-                            reply_markup=keyboard
-                        )
-                    except Exception as e:
-                        print(f"Error sending vote keyboard to user {user_id}: {e}")
-            
-            self.start_phase_timer('vote', VOTE_DURATION)
-            self.save_game_state()
-
-    def end_vote(self):
-        if self.bot:
-            # Process any remaining votes
-            self.process_voting_results()
-            # Note: start_next_night will be called after voting results are processed
-
-    def add_player(self, user_id, name):
-        if len(self.players) >= MAX_PLAYERS:
-            return False, "Oyun artıq maksimum oyunçu sayına çatıb!"
-        if user_id in self.players:
-            return False, "Siz artıq qeydiyyatdan keçmisiniz!"
-        self.players[user_id] = {'name': name, 'role': None}
-        self.save_game_state()
-        return True, "Qeydiyyat uğurla tamamlandı!"
-
-    def start_game(self, admin_id):
-        if len(self.players) < MIN_PLAYERS:
-            return False, f"Minimum {MIN_PLAYERS} oyunçu lazımdır!"
-        self.admin_id = admin_id
-        self.game_started = True
-        self.assign_roles()
-        self.phase = 'night'
-        self.start_phase_timer('night', NIGHT_DURATION)
-        self.save_game_state()
-        return True, self.generate_game_start_message()
-
-    def generate_role_message(self, user_id):
-        player = self.players[user_id]
-        role = ROLES[player['role']]
-        
-        message = (
-            f"Sizin rolunuz: {role['name']}\n\n"
-            f"{role['description']}\n"
-        )
-        
-        if role['is_active']:
-            message += "\nSeciminizi edin:"
-            
-        return message
-
-    def generate_player_selection_keyboard(self, user_id, action_type=None):
-        player = self.players[user_id]
-        role = player['role']
-        
-        # For detective, first show action selection
-        if role == 'detective' and not action_type:
-            keyboard = [
-                [
-                    InlineKeyboardButton("Yoxla", callback_data="detective_check"),
-                    InlineKeyboardButton("Silahını çək", callback_data="detective_shoot")
-                ]
-            ]
-            return InlineKeyboardMarkup(keyboard)
-        
-        # Filter out players based on role
-        available_players = []
-        for target_id, target in self.players.items():
-            if target_id != user_id:  # Can't select self
-                if role in ['don_mafia', 'mafia']:
-                    # Mafia can't see other mafia members
-                    if target['role'] not in ROLE_CATEGORIES['mafia']:
-                        available_players.append((target_id, target['name']))
-                else:
-                    available_players.append((target_id, target['name']))
-        
-        keyboard = []
-        for target_id, name in available_players:
-            keyboard.append([InlineKeyboardButton(name, callback_data=f"select_{target_id}")])
-        
-        return InlineKeyboardMarkup(keyboard)
-
-    def process_night_action(self, user_id, target_id, action=None):
-        player = self.players[user_id]
-        role = player['role']
-        
-        if role == 'don_mafia':
-            self.night_actions[user_id] = {'target_id': target_id, 'action': 'kill'}
-            return f"🕴 Don qurbanı seçdi.."
-        elif role == 'doctor':
-            self.night_actions[user_id] = {'target_id': target_id, 'action': 'heal'}
-            return f"👨🏻‍⚕️ Həkim gecə növbəsinə çıxdı.."
-        elif role == 'detective':
-            if action == 'check':
-                self.night_actions[user_id] = {'target_id': target_id, 'action': 'check'}
-                return f"🕵🏻‍♂️ Komissar yaramazları axtarmağa getdi!"
-            else:  # shoot
-                self.night_actions[user_id] = {'target_id': target_id, 'action': 'shoot'}
-                return f"🕵🏻‍♂️ Komissar silahını çəkdi"
-
-    def generate_morning_message(self):
-        # Process night actions
-        killed_players = []
-        healed_players = []
-        
-        for user_id, action in self.night_actions.items():
-            target_id = action['target_id']
-            if action['action'] == 'kill':
-                killed_players.append(target_id)
-            elif action['action'] == 'heal':
-                healed_players.append(target_id)
-        
-        # Remove healed players from killed list
-        killed_players = [p for p in killed_players if p not in healed_players]
-        
-        # Generate night results message
-        night_results = []
-        for killed_id in killed_players:
-            killer_role = None
-            for user_id, action in self.night_actions.items():
-                if action['target_id'] == killed_id and action['action'] == 'kill':
-                    killer_role = ROLES[self.players[user_id]['role']]['name']
-                    break
-            
-            if killer_role:
-                night_results.append(
-                    f"{ROLES[self.players[killed_id]['role']]['name']} gecə öldürüldü. "
-                    f"Onun öldürən {killer_role} idi."
-                )
-        
-        for healed_id in healed_players:
-            if healed_id in killed_players:
-                night_results.append(
-                    f"{ROLES[self.players[healed_id]['role']]['name']} gecə ölümlə üzləşdi "
-                    f"ancaq {ROLES['doctor']['name']} iş başında idi, o ölmədi."
-                )
-        
-        # Generate player list with HTML links
-        player_list = "\n".join([
-            f"{i+1}. <a href='tg://user?id={user_id}'>{player['name']}</a>"
-            for i, (user_id, player) in enumerate(self.players.items())
-        ])
-        
-        # Count remaining roles
-        role_counts = {'citizens': 0, 'mafia': 0}
-        for player in self.players.values():
-            if player['role'] in ROLE_CATEGORIES['citizens']:
-                role_counts['citizens'] += 1
-            elif player['role'] in ROLE_CATEGORIES['mafia']:
-                role_counts['mafia'] += 1
-        
-        message = (
-            f"{self.chat_id}, Sabahın Xeyir!!\n"
-            "Günəş, səkilərdə gecə tökülən qanı qurudaraq, çıxır........\n"
-            f"☀️Gün: {self.day_number}\n\n"
-        )
-        
-        if night_results:
-            message += "\n".join(night_results) + "\n\n"
-        
-        message += (
-            f"Sağ qalan oyunçular:\n{player_list}\n\n"
-            "Onlardan:\n\n"
-            f"👫Dinc Sakinlər - {role_counts['citizens']}\n"
-            "---------\n"
-            f"👥Mafiyalar - {role_counts['mafia']}\n\n"
-            f"🎪 Cəmi: {len(self.players)} nəfər\n\n"
-            "İndi gecənin nəticələrini müzakirə etmək, səbəb və təsirləri anlamaq vaxtıdır......"
-        )
-        
-        return message
-
-    def generate_game_start_message(self):
-        # Count roles and collect assigned roles
-        role_counts = {'citizens': 0, 'mafia': 0}
-        assigned_roles = {'citizens': set(), 'mafia': set()}
-        
-        for player in self.players.values():
-            if player['role'] in ROLE_CATEGORIES['citizens']:
-                role_counts['citizens'] += 1
-                assigned_roles['citizens'].add(player['role'])
-            elif player['role'] in ROLE_CATEGORIES['mafia']:
-                role_counts['mafia'] += 1
-                assigned_roles['mafia'].add(player['role'])
-
-        # Generate player list with HTML links
-        player_list = "\n".join([
-            f"{i+1}. <a href='tg://user?id={user_id}'>{player['name']}</a>"
-            for i, (user_id, player) in enumerate(self.players.items())
-        ])
-
-        # Generate role list for assigned roles only
-        citizen_roles = [ROLES[role]['name'] for role in assigned_roles['citizens']]
-        mafia_roles = [ROLES[role]['name'] for role in assigned_roles['mafia']]
-
-        message = (
-            "Mafia Combat Oyunu Başladı\n\n"
-            "Gecə düşür!\n"
-            "Yalnız cəsarətlilər və qorxmazlar şəhər küçələrinə çıxırlar. "
-            "Səhər başlarını saymağa çalışacağıq...\n\n"
-            f"Sağ qalan oyunçular:\n{player_list}\n\n"
-            "Onlardan:\n\n"
-            f"👫Dinc Sakinlər - {role_counts['citizens']}\n"
-            f" {' '.join(citizen_roles)}\n"
-            "---------\n"
-            f"👥Mafiyalar - {role_counts['mafia']}\n"
-            f" {' '.join(mafia_roles)}\n\n"
-            f"🎪 Cəmi: {len(self.players)} nəfər"
-        )
-        return message
-
-    def assign_roles(self):
-        available_roles = []
-        # Add roles based on player count
-        if len(self.players) >= 3:
-            available_roles.extend(['don_mafia', 'doctor', 'detective'])
-        if len(self.players) >= 4:
-            available_roles.append('mafia')
-        if len(self.players) >= 5:
-            available_roles.append('crazy')
-        
-        # Fill remaining slots with citizens
-        remaining_slots = len(self.players) - len(available_roles)
-        available_roles.extend(['citizen'] * remaining_slots)
-        
-        # Shuffle and assign roles
-        random.shuffle(available_roles)
-        for (user_id, player), role in zip(self.players.items(), available_roles):
-            player['role'] = role
-
-    def save_game_state(self):
-        data_dir = 'data'
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-        
-        file_path = os.path.join(data_dir, f'game_{self.chat_id}.json')
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                'chat_id': self.chat_id,
-                'players': self.players,
-                'game_started': self.game_started,
-                'phase': self.phase,
-                'admin_id': self.admin_id,
-                'night_actions': self.night_actions,
-                'day_number': self.day_number,
-                'votes': self.votes
-            }, f, ensure_ascii=False, indent=4)
-
-    @classmethod
-    def load_game_state(cls, chat_id):
-        file_path = os.path.join('data', f'game_{chat_id}.json')
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                game = cls(chat_id)
-                game.players = data['players']
-                game.game_started = data['game_started']
-                game.phase = data['phase']
-                game.admin_id = data['admin_id']
-                game.night_actions = data.get('night_actions', {})
-                game.day_number = data.get('day_number', 1)
-                game.votes = data.get('votes', {})
-                return game
-        return None
-
-    def generate_vote_keyboard(self, voter_id):
-        # Filter out dead players and voter
-        available_players = []
-        for target_id, player in self.players.items():
-            if target_id != voter_id and 'is_dead' not in player:
-                available_players.append((target_id, player['name']))
-        
-        keyboard = []
-        for target_id, name in available_players:
-            keyboard.append([InlineKeyboardButton(name, callback_data=f"vote_{target_id}")])
-        
-        return InlineKeyboardMarkup(keyboard)
-
-    def process_vote(self, voter_id, target_id):
-        self.votes[voter_id] = target_id
-        self.save_game_state()
-        
-        # Check if all alive players have voted
-        alive_players = [p for p in self.players if 'is_dead' not in self.players[p]]
-        if len(self.votes) == len(alive_players):
-            self.process_voting_results()
-
-    def process_voting_results(self):
-        # Count votes
-        vote_counts = {}
-        for target_id in self.votes.values():
-            vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
-        
-        if not vote_counts:
-            message = "Oyuncular qərar verə bilmədilər, heç kim asılmadı."
-            self.bot.send_message(chat_id=self.chat_id, text=message)
-            self.start_next_night()
-            return
-        
-        # Find player with most votes
-        max_votes = max(vote_counts.values())
-        candidates = [p for p, v in vote_counts.items() if v == max_votes]
-        
-        if len(candidates) > 1:
-            message = "Oyuncular qərar verə bilmədilər, heç kim asılmadı."
-            self.bot.send_message(chat_id=self.chat_id, text=message)
-            self.start_next_night()
-            return
-        
-        # Single candidate with most votes
-        target_id = candidates[0]
-        target_name = self.players[target_id]['name']
-        
-        # Create confirmation message
-        message = f"{target_name} asmaq istədiyinizə əminsiniz?"
-        keyboard = [
-            [
-                InlineKeyboardButton(f"As {max_votes}", callback_data=f"hang_{target_id}"),
-                InlineKeyboardButton(f"Asma {max_votes}", callback_data="no_hang")
-            ]
-        ]
-        self.bot.send_message(
-            chat_id=self.chat_id,
-            text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-
-    def hang_player(self, target_id):
-        self.players[target_id]['is_dead'] = True
-        target_name = self.players[target_id]['name']
-        target_role = ROLES[self.players[target_id]['role']]['name']
-        
-        message = f"{target_name} ({target_role}) asıldı!"
-        self.bot.send_message(chat_id=self.chat_id, text=message)
-        
-        # Check if game is over
-        if self.check_game_end():
-            return
-        
-        self.start_next_night()
-
-    def check_game_end(self):
-        # Count remaining players by role
-        mafia_count = 0
-        citizen_count = 0
-        
-        for player in self.players.values():
-            if 'is_dead' not in player:
-                if player['role'] in ROLE_CATEGORIES['mafia']:
-                    mafia_count += 1
-                else:
-                    citizen_count += 1
-        
-        if mafia_count == 0:
-            message = "🎉 Mülki sakinlər qalib gəldi! Mafiyalar məğlub oldu!"
-            self.bot.send_message(chat_id=self.chat_id, text=message)
-            self.game_started = False
-            self.winners = ['citizens']
-            self.distribute_rewards()
-            self.reset_game()
-            return True
-        
-        if mafia_count >= citizen_count:
-            message = "🎭 Mafiyalar qalib gəldi! Şəhər onların əlində!"
-            self.bot.send_message(chat_id=self.chat_id, text=message)
-            self.game_started = False
-            self.winners = ['mafia']
-            self.distribute_rewards()
-            self.reset_game()
-            return True
-        
-        return False
-
-    def start_next_night(self):
-        self.phase = 'night'
-        self.day_number += 1
-        self.votes = {}  # Reset votes
-        self.night_actions = {}  # Reset night actions
-        
-        night_message = (
-            "Gecə düşür!\n"
-            "Yalnız cəsarətlilər və qorxmazlar şəhər küçələrinə çıxırlar..."
-        )
-        self.bot.send_message(chat_id=self.chat_id, text=night_message)
-        
-        # Send role selection to active players
-        for user_id, player in self.players.items():
-            if 'is_dead' not in player and ROLES[player['role']]['is_active']:
-                try:
-                    keyboard = self.generate_player_selection_keyboard(user_id)
-                    self.bot.send_message(
-                        chat_id=user_id,
-                        text="Seciminizi edin:",
-                        reply_markup=keyboard
-                    )
-                except Exception as e:
-                    print(f"Error sending role selection to user {user_id}: {e}")
-        
-        self.start_phase_timer('night', NIGHT_DURATION)
-        self.save_game_state()
-
-    def process_night_actions(self):
-        if self.bot:
-            # Process commissioner's check
-            for user_id, action in self.night_actions.items():
-                if self.players[user_id]['role'] == 'commissioner':
-                    target_id = action['target_id']
-                    target_name = self.players[target_id]['name']
-                    target_role = self.players[target_id]['role']
-                    role_name = ROLES[target_role]['name']
-                    try:
-                        self.bot.send_message(
-                            chat_id=user_id,
-                            text=f"{target_name} {role_name}dir"
-                        )
-                    except Exception as e:
-                        print(f"Error sending commissioner check result to user {user_id}: {e}")
-
-            # Process doctor's save
-            saved_players = set()
-            for user_id, action in self.night_actions.items():
-                if self.players[user_id]['role'] == 'doctor':
-                    saved_players.add(action['target_id'])
-
-            # Process mafia's kill
-            killed_players = set()
-            for user_id, action in self.night_actions.items():
-                if self.players[user_id]['role'] in ROLE_CATEGORIES['mafia']:
-                    target_id = action['target_id']
-                    if target_id not in saved_players:
-                        killed_players.add(target_id)
-                        self.players[target_id]['is_dead'] = True
-
-            # Send morning message
-            morning_message = "Səhər oldu! Gecə hadisələri:\n\n"
-            
-            if killed_players:
-                killed_names = [self.players[p]['name'] for p in killed_players]
-                morning_message += f"Gecə {', '.join(killed_names)} öldürüldü.\n"
-            else:
-                morning_message += "Bu gecə heç kim ölmədi.\n"
-            
-            self.bot.send_message(chat_id=self.chat_id, text=morning_message)
-            
-            # Check if game is over
-            if self.check_game_end():
-                return
-            
-            # Start day phase
-            self.phase = 'day'
-            self.start_phase_timer('day', DAY_DURATION)
-            self.save_game_state()
-
-    def distribute_rewards(self):
-        for user_id, player in self.players.items():
-            user_data = UserData(user_id)
-            won = False
-            
-            if 'mafia' in self.winners and player['role'] in ROLE_CATEGORIES['mafia']:
-                won = True
-            elif 'citizens' in self.winners and player['role'] not in ROLE_CATEGORIES['mafia']:
-                won = True
-            
-            user_data.add_game_result(won)
-            
-            # Send reward message to player
-            reward = WIN_REWARD if won else LOSE_REWARD
-            try:
-                self.bot.send_message(
-                    chat_id=user_id,
-                    text=f"Oyun bitdi! {'Qalib' if won else 'Məğlub'} oldunuz.\n"
-                         f"Mükafat: {reward} dollar\n"
-                         f"Ümumi balansınız: {user_data.total_money} dollar"
-                )
-            except Exception as e:
-                print(f"Error sending reward message to user {user_id}: {e}")
-
-    def reset_game(self):
-        # Save game history
-        history_file = f"data/game_history_{self.chat_id}.json"
-        game_data = {
-            'timestamp': datetime.now().isoformat(),
-            'players': self.players,
-            'winners': self.winners,
-            'day_number': self.day_number
-        }
-        
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        else:
-            history = []
-        
-        history.append(game_data)
-        
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=4)
-        
-        # Reset current game file
-        self.players = {}
-        self.game_started = False
-        self.phase = None
-        self.admin_id = None
-        self.night_actions = {}
-        self.day_number = 1
-        self.votes = {}
-        self.winners = []
-        self.save_game_state()
-
-# Global games dictionary
-active_games = {}
-
-def start_game_command(update: Update, context: CallbackContext):
-    chat_id = update.effective_chat.id
-    user_id = update.effective_user.id
-    
-    # Check if user is admin
-    chat_member = context.bot.get_chat_member(chat_id, user_id)
-    if chat_member.status not in ['creator', 'administrator']:
-        update.message.reply_text("Bu əmri yalnız qrup yöneticiləri istifadə edə bilər!")
-        return
-
-    # Create or get existing game
-    if chat_id not in active_games:
-        active_games[chat_id] = MafiaGame(chat_id)
-    
-    game = active_games[chat_id]
-    
-    # Create registration message
-    keyboard = [
-        [InlineKeyboardButton("Oyuna qatıl", url=f"https://t.me/{context.bot.username}?start=join_{chat_id}")],
-        [InlineKeyboardButton("Oyunu başlat", callback_data=f"start_{chat_id}")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    player_list = ", ".join([player['name'] for player in game.players.values()]) or "Hələ heç kim qatılmayıb"
-    
-    message_text = (
-        "Qeydiyyat başladı! Qatılmaq üçün tələs!\n\n"
-        f"<b>Qatılanlar:</b> {player_list}"
-    )
-    
-    update.message.reply_text(message_text, reply_markup=reply_markup, parse_mode='HTML')
-
-def button_callback(update: Update, context: CallbackContext):
-    query = update.callback_query
-    query.answer()
-    
-    if query.data.startswith("start_"):
-        chat_id = int(query.data.split("_")[1])
-        game = active_games.get(chat_id)
-        
-        if game:
-            game.set_bot(context.bot)  # Set bot instance for game
-            success, message = game.start_game(query.from_user.id)
-            
-            # Create keyboard for game start message
-            keyboard = [
-                [InlineKeyboardButton("Rolunuza baxın", url=f"https://t.me/{context.bot.username}?start=role_{chat_id}")],
-                [InlineKeyboardButton("Bota keçid", url=f"https://t.me/{context.bot.username}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            query.message.reply_text(message, reply_markup=reply_markup, parse_mode='HTML')
-            
-            if success:
-                # Send role information to each player
-                for user_id, player in game.players.items():
-                    try:
-                        role_message = game.generate_role_message(user_id)
-                        context.bot.send_message(
-                            chat_id=user_id,
-                            text=role_message,
-                            parse_mode='HTML'
-                        )
-                        
-                        # If player has an active role, send selection keyboard
-                        if ROLES[player['role']]['is_active']:
-                            keyboard = game.generate_player_selection_keyboard(user_id)
-                            context.bot.send_message(
-                                chat_id=user_id,
-                                text="Seciminizi edin:",
-                                reply_markup=keyboard
-                            )
-                    except Exception as e:
-                        print(f"Error sending role to user {user_id}: {e}")
-    
-    elif query.data.startswith("select_"):
-        target_id = int(query.data.split("_")[1])
-        user_id = query.from_user.id
-        
-        # Find the game this user is in
-        game = None
-        for g in active_games.values():
-            if user_id in g.players:
-                game = g
-                break
-        
-        if game:
-            result_message = game.process_night_action(user_id, target_id)
-            # Send result to group
-            context.bot.send_message(
-                chat_id=game.chat_id,
-                text=result_message
-            )
-            # Confirm to user
-            query.message.reply_text("Seçiminiz qeydə alındı.")
-    
-    elif query.data.startswith(("detective_check", "detective_shoot")):
-        user_id = query.from_user.id
-        
-        # Find the game this user is in
-        game = None
-        for g in active_games.values():
-            if user_id in g.players:
-                game = g
-                break
-        
-        if game and game.players[user_id]['role'] == 'detective':
-            action = query.data.split("_")[1]
-            keyboard = game.generate_player_selection_keyboard(user_id, action)
-            query.message.reply_text("İndi hədəf seçin:", reply_markup=keyboard)
-    
-    elif query.data.startswith(("check_", "shoot_")):
-        action, target_id = query.data.split("_")
-        target_id = int(target_id)
-        user_id = query.from_user.id
-        
-        # Find the game this user is in
-        game = None
-        for g in active_games.values():
-            if user_id in g.players:
-                game = g
-                break
-        
-        if game and game.players[user_id]['role'] == 'detective':
-            result_message = game.process_night_action(user_id, target_id, action)
-            # Send result to group
-            context.bot.send_message(
-                chat_id=game.chat_id,
-                text=result_message
-            )
-            # Confirm to user
-            query.message.reply_text("Seçiminiz qeydə alındı.")
-
-    elif query.data.startswith("vote_"):
-        target_id = int(query.data.split("_")[1])
-        user_id = query.from_user.id
-        
-        # Find the game this user is in
-        game = None
-        for g in active_games.values():
-            if user_id in g.players:
-                game = g
-                break
-        
-        if game and game.phase == 'vote':
-            game.process_vote(user_id, target_id)
-            query.message.reply_text("Səs verməniz qeydə alındı.")
-    
-    elif query.data.startswith("hang_"):
-        target_id = int(query.data.split("_")[1])
-        user_id = query.from_user.id
-        
-        # Find the game this user is in
-        game = None
-        for g in active_games.values():
-            if user_id in g.players:
-                game = g
-                break
-        
-        if game:
-            game.hang_player(target_id)
-    
-    elif query.data == "no_hang":
-        user_id = query.from_user.id
-        
-        # Find the game this user is in
-        game = None
-        for g in active_games.values():
-            if user_id in g.players:
-                game = g
-                break
-        
-        if game:
-            message = "Oyuncular qərar verə bilmədilər, heç kim asılmadı."
-            game.bot.send_message(chat_id=game.chat_id, text=message)
-            game.start_next_night()
-
-def start_command(update: Update, context: CallbackContext):
-    if context.args and context.args[0].startswith("join_"):
-        chat_id = int(context.args[0].split("_")[1])
-        game = active_games.get(chat_id)
-        
-        if game and not game.game_started:
-            success, message = game.add_player(
-                update.effective_user.id,
-                update.effective_user.full_name
-            )
-            update.message.reply_text(message)
-        else:
-            update.message.reply_text("Oyun artıq başladılıb və ya mövcud deyil!")
-    
-    elif context.args and context.args[0].startswith("role_"):
-        chat_id = int(context.args[0].split("_")[1])
-        game = active_games.get(chat_id)
-        
-        if game and update.effective_user.id in game.players:
-            role_message = game.generate_role_message(update.effective_user.id)
-            update.message.reply_text(role_message, parse_mode='HTML')
-            
-            # If player has an active role, send selection keyboard
-            if ROLES[game.players[update.effective_user.id]['role']]['is_active']:
-                keyboard = game.generate_player_selection_keyboard(update.effective_user.id)
-                update.message.reply_text("Seciminizi edin:", reply_markup=keyboard)
-
-def message_handler(update: Update, context: CallbackContext):
-    if not update.message or not update.message.text:
-        return
-    
-    chat_id = update.message.chat_id
-    user_id = update.message.from_user.id
-    message_text = update.message.text
-    
-    # Check if message is from a game chat
-    game = None
-    for g in active_games.values():
-        if g.chat_id == chat_id:
-            game = g
-            break
-    
-    if not game or not game.game_started:
-        return
-    
-    # Allow messages from admins with ! prefix
-    if message_text.startswith('!'):
-        # Check if user is admin
-        chat_member = context.bot.get_chat_member(chat_id, user_id)
-        if chat_member.status in ['creator', 'administrator']:
-            return
-        else:
-            context.bot.delete_message(chat_id=chat_id, message_id=update.message.message_id)
-            return
-    
-    # Delete all messages during night phase
-    if game.phase == 'night':
-        context.bot.delete_message(chat_id=chat_id, message_id=update.message.message_id)
-        return
-    
-    # During day phase, only allow messages from active players
-    if game.phase == 'day':
-        if user_id not in game.players or 'is_dead' in game.players[user_id]:
-            context.bot.delete_message(chat_id=chat_id, message_id=update.message.message_id)
-            context.bot.send_message(
-                chat_id=chat_id,
-                text="Oyunda olmadığınız üçün mesaj yaza bilmərsiniz",
-                reply_to_message_id=update.message.message_id
-            )
-            return
-
-def profile_command(update: Update, context: CallbackContext):
-    user_id = update.effective_user.id
-    user_data = UserData(user_id)
-    
-    # Calculate win rate
-    win_rate = (user_data.games_won / user_data.games_played * 100) if user_data.games_played > 0 else 0
-    
-    # Create profile message
-    profile_message = (
-        "📊 Profil Məlumatları\n\n"
-        f"🎮 Oynanmış oyun: {user_data.games_played}\n"
-        f"🏆 Qazanılmış oyun: {user_data.games_won}\n"
-        f"📈 Qalibiyyət faizi: {win_rate:.1f}%\n"
-        f"💰 Ümumi balans: {user_data.total_money} dollar\n"
-    )
-    
-    update.message.reply_text(profile_message)
-
-def end_game_command(update: Update, context: CallbackContext):
-    chat_id = update.effective_chat.id
-    user_id = update.effective_user.id
-    
-    # Find the game
-    game = None
-    for g in active_games.values():
-        if g.chat_id == chat_id:
-            game = g
-            break
-    
-    if not game:
-        update.message.reply_text("Bu qrupda aktiv oyun yoxdur.")
-        return
-    
-    # Check if user is admin or game admin
-    if user_id != game.admin_id:
-        chat_member = context.bot.get_chat_member(chat_id, user_id)
-        if chat_member.status not in ['creator', 'administrator']:
-            update.message.reply_text("Yalnız adminlər və oyun admini oyunu bitirə bilər.")
-            return
-    
-    if not game.game_started:
-        update.message.reply_text("Oyun hələ başlamayıb.")
-        return
-    
-    # End the game
-    game.game_started = False
-    game.phase = None
-    
-    # Distribute rewards
-    game.winners = ['citizens']  # Default to citizens winning
-    game.distribute_rewards()
-    
-    # Reset the game
-    game.reset_game()
-    
-    update.message.reply_text("Oyun bitdi! Bütün oyunçular mükafatlarını aldılar.")
-
-def help_command(update: Update, context: CallbackContext):
-    help_message = (
-        "🎮 Mafia Bot Əmrləri:\n\n"
-        "📝 Qeyd: Bəzi əmrlər yalnız adminlər və ya oyun admini tərəfindən istifadə edilə bilər."
-    )
-    
-    update.message.reply_text(help_message)
-
-def main():
-    # Create the Updater and pass it your bot's token
-    updater = Updater(os.getenv('TELEGRAM_BOT_TOKEN'), use_context=True)
-    
-    # Get the dispatcher to register handlers
-    dp = updater.dispatcher
-    
-    # Add handlers
-    dp.add_handler(CommandHandler("start", start_command))
-    dp.add_handler(CommandHandler("help", help_command))
-    dp.add_handler(CommandHandler("join", start_command))
-    dp.add_handler(CommandHandler("startgame", start_game_command))
-    dp.add_handler(CommandHandler("profile", profile_command))
-    dp.add_handler(CallbackQueryHandler(button_callback))
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, message_handler))
-    
-    # Start the Bot
-    updater.start_polling()
-    updater.idle()
-
-if __name__ == '__main__':
+# Handler annotations name telegram.ext classes; only type checkers import them
+# here, the bot imports telegram.ext in main() when it starts
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import json
+import os
+import random
+import re
+import signal
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Unauthorized, BadRequest
+from dotenv import load_dotenv
+from game_core import (
+    WIN_REWARD, LOSE_REWARD, ROLES, ROLE_CATEGORIES, decode_callback,
+    MIN_PLAYERS, PHASE_DURATIONS, registration_rows, start_link_rows, GameState, transition
+)
+from admission import AdmissionController, RETRY_AFTER
+from handover import ProcessLock, holder_pid
+from cluster import ClusterNode
+from journal import DATA_DIR
+from footprint import process_footprint
+from store import open_store
+from timers import PhaseScheduler
+from transport import create_bot
+
+if TYPE_CHECKING:
+    from telegram.ext import CallbackContext
+
+# Load environment variables
+load_dotenv()
+
+# Constants (the game rules and their constants live in game_core.py)
+UNREACHABLE_RETRY_BASE = 60  # seconds before the first re-probe of an unreachable user
+UNREACHABLE_RETRY_MAX = 3600
+EFFECT_WORKERS = 8  # threads running sends and disk writes for all games
+IDLE_GAME_TIMEOUT = 900  # seconds a lobby nobody joins, or a chat without settings, stays in memory
+LOCK_FILE = os.path.join(DATA_DIR, 'bot.lock')
+POLL_TIMEOUT = int(os.getenv('TELEGRAM_POLL_TIMEOUT', 2))  # long polling; a drain waits up to this for the last poll
+DRAIN_TIMEOUT = 20  # seconds a drain waits for queued sends and writes
+DRAIN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+NODE_ID = os.getenv('MAFIA_NODE_ID') or f"{socket.gethostname()}:{os.getpid()}"  # this process in a cluster
+JOIN_LINK = re.compile(r'/(?:start|join)(?:@\w+)?\s+(?:join|role)_(-?\d+)')  # deep links that name a game chat
+
+def inline_keyboard(rows, bot=None):
+    # Button dicts from game_core -> telegram markup; only url buttons need the bot's username
+    keyboard = []
+    for row in rows:
+        buttons = []
+        for button in row:
+            if 'url' in button:
+                buttons.append(InlineKeyboardButton(button['text'], url=button['url'].format(bot_username=bot.username)))
+            else:
+                buttons.append(InlineKeyboardButton(button['text'], callback_data=button['callback_data']))
+        keyboard.append(buttons)
+    return InlineKeyboardMarkup(keyboard)
+
+class UserData:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.games_played = 0
+        self.games_won = 0
+        self.total_money = 0
+        self.load_data()
+
+    def load_data(self):
+        self.update(store.load_user(self.user_id))
+
+    def update(self, data):
+        if data:
+            self.games_played = data.get('games_played', 0)
+            self.games_won = data.get('games_won', 0)
+            self.total_money = data.get('total_money', 0)
+
+    def add_game_result(self, won):
+        # Games in other chats, or on other nodes, can reward the same user
+        # at once; the store adds the result atomically and returns the sums
+        reward = WIN_REWARD if won else LOSE_REWARD
+        self.update(store.add_game_result(self.user_id, won, reward))
+
+class ReachabilityRegistry:
+    # Users we can't DM (never opened a private chat, or blocked the bot).
+    # Sends to them are skipped until a backoff deadline passes, then one
+    # send is let through as a probe. Blocked users are skipped until a
+    # my_chat_member update says they unblocked us. The entries are kept in
+    # the store (data/reachability.json by default), so a restart or another
+    # node doesn't try every failing DM again, and in memory: a DM to a user
+    # without an entry, nearly every DM, doesn't touch the store. The lock
+    # is never held during store I/O.
+    def __init__(self, store):
+        self.store = store
+        self.entries = None  # {user_id: {'failures': n, 'retry_at': timestamp, 'blocked': bool}}, read on first use
+        self.skipped_sends = 0
+        self.lock = threading.Lock()
+
+    def cached(self):
+        if self.entries is None:
+            entries = self.store.unreachable_users()
+            with self.lock:
+                if self.entries is None:
+                    self.entries = entries
+        return self.entries
+
+    def is_unreachable(self, user_id):
+        return user_id in self.cached()
+
+    def should_send(self, user_id):
+        if user_id not in self.cached():
+            return True
+        # Another node may have changed or cleared the entry since
+        entry = self.store.reachability(user_id)
+        with self.lock:
+            if entry is None:
+                self.entries.pop(user_id, None)
+                return True
+            cached = self.entries.get(user_id)
+            if cached:
+                # A probe let through here may not be in the store yet
+                entry['retry_at'] = max(entry['retry_at'], cached['retry_at'])
+            self.entries[user_id] = entry
+            if entry['blocked'] or time.time() < entry['retry_at']:
+                self.skipped_sends += 1
+                return False
+            # Let this send through as a probe; push the deadline so
+            # concurrent sends don't all probe at once
+            entry['retry_at'] = time.time() + UNREACHABLE_RETRY_BASE
+            probe = dict(entry)
+        self.store.set_reachability(user_id, probe)
+        return True
+
+    def mark_reachable(self, user_id, confirmed=False):
+        # A DM that went through clears the entry this node knows of;
+        # confirmed (the user opened or unblocked the private chat) also
+        # clears one another node made
+        entries = self.cached()
+        with self.lock:
+            known = entries.pop(user_id, None) is not None
+        if known or confirmed:
+            self.store.set_reachability(user_id, None)
+
+    def mark_unreachable(self, user_id, blocked=False):
+        entries = self.cached()
+        entry = self.store.reachability(user_id) or {'failures': 0, 'retry_at': 0, 'blocked': False}
+        entry['failures'] += 1
+        entry['blocked'] = blocked
+        delay = min(UNREACHABLE_RETRY_BASE * 2 ** (entry['failures'] - 1), UNREACHABLE_RETRY_MAX)
+        entry['retry_at'] = time.time() + delay
+        with self.lock:
+            entries[user_id] = entry
+        self.store.set_reachability(user_id, dict(entry))
+
+def is_unreachable_error(error):
+    if isinstance(error, Unauthorized):
+        return True
+    return isinstance(error, BadRequest) and 'chat not found' in str(error).lower()
+
+def send_private_message(bot, user_id, text, **kwargs):
+    # DM a player unless they are known to be unreachable; returns True if sent
+    if not reachability.should_send(user_id):
+        return False
+    try:
+        bot.send_message(chat_id=user_id, text=text, **kwargs)
+    except Exception as e:
+        if is_unreachable_error(e):
+            reachability.mark_unreachable(user_id)
+        print(f"Error sending message to user {user_id}: {e}")
+        return False
+    reachability.mark_reachable(user_id)
+    return True
+
+def distribute_rewards(bot, winners, roles):
+    for user_id, role in roles.items():
+        user_data = UserData(user_id)
+        won = False
+        
+        if 'mafia' in winners and role in ROLE_CATEGORIES['mafia']:
+            won = True
+        elif 'citizens' in winners and role not in ROLE_CATEGORIES['mafia']:
+            won = True
+        
+        user_data.add_game_result(won)
+        if not bot:
+            continue
+        
+        # Send reward message to player
+        reward = WIN_REWARD if won else LOSE_REWARD
+        send_private_message(
+            bot,
+            user_id,
+            f"Oyun bitdi! {'Qalib' if won else 'Məğlub'} oldunuz.\n"
+            f"Mükafat: {reward} dollar\n"
+            f"Ümumi balansınız: {user_data.total_money} dollar"
+        )
+
+def archive_game(chat_id, record):
+    # Save game history
+    game_data = {'timestamp': datetime.now().isoformat()}
+    game_data.update(record)
+    
+    store.archive_game(chat_id, game_data)
+
+def message_options(game, effect):
+    options = {}
+    if effect.get('parse_mode'):
+        options['parse_mode'] = effect['parse_mode']
+    if effect.get('keyboard'):
+        options['reply_markup'] = inline_keyboard(effect['keyboard'], game.bot)
+    return options
+
+def run_send_effect(game, effect):
+    if not game.bot:
+        return
+    try:
+        game.bot.send_message(chat_id=effect['chat_id'], text=effect['text'], **message_options(game, effect))
+    except Exception as e:
+        print(f"Error sending message to chat {effect['chat_id']}: {e}")
+
+def run_dm_effect(game, effect):
+    if not game.bot:
+        return
+    if not send_private_message(game.bot, effect['user_id'], effect['text'], **message_options(game, effect)):
+        if reachability.is_unreachable(effect['user_id']):
+            game.warn_unreachable(effect['user_id'])
+
+def run_rewards_effect(game, effect):
+    distribute_rewards(game.bot, effect['winners'], effect['roles'])
+
+def run_archive_effect(game, effect):
+    archive_game(game.chat_id, effect['record'])
+
+def evict_idle_game(game):
+    # A chat that isn't live has nothing worth keeping in memory; its next
+    # /startgame makes a new MafiaGame from what the store has
+    with game.lock:
+        if game.is_live() or active_games.get(game.chat_id) is not game:
+            return
+        del active_games[game.chat_id]
+    if cluster:
+        # Any node can pick the chat up again
+        cluster.release(game.chat_id)
+
+def run_index_effect(game, effect):
+    store.set_live(game.chat_id, effect['live'])
+    if effect['live']:
+        with game.lock:
+            active_games.setdefault(game.chat_id, game)
+            if game.idle_timer:
+                game.scheduler.cancel(game.idle_timer)
+                game.idle_timer = None
+    else:
+        evict_idle_game(game)
+
+# Effect type -> runner(game, effect); journal and snapshot effects are
+# handled by the executor itself, reply and timer effects by MafiaGame.dispatch
+EFFECT_RUNNERS = {
+    'send': run_send_effect,
+    'dm': run_dm_effect,
+    'rewards': run_rewards_effect,
+    'archive': run_archive_effect,
+    'index': run_index_effect
+}
+
+# Effects that are a Bot API call, counted against the in-flight send limit
+SEND_EFFECTS = ('send', 'dm')
+
+class EffectExecutor:
+    # Runs the effects of game transitions off the handler and timer threads.
+    # Every chat has a lane: its batches run one after another in order,
+    # different chats run in parallel. Batches queued while a lane is busy
+    # are merged, so their journal events go to disk in one write.
+    def __init__(self, max_workers=EFFECT_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='effects')
+        self.lanes = {}  # {chat_id: deque of effect lists}
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)  # notified whenever a lane empties
+        self.in_flight = 0  # queued or running send effects, for admission control
+
+    def submit(self, game, effects):
+        sends = sum(1 for effect in effects if effect['type'] in SEND_EFFECTS)
+        with self.lock:
+            self.in_flight += sends
+            lane = self.lanes.get(game.chat_id)
+            if lane is not None:
+                # A worker is already draining this chat, it picks these up next
+                lane.append(effects)
+                return
+            self.lanes[game.chat_id] = deque([effects])
+        self.pool.submit(self.drain, game)
+
+    def drain(self, game):
+        while True:
+            with self.lock:
+                lane = self.lanes[game.chat_id]
+                if not lane:
+                    del self.lanes[game.chat_id]
+                    self.idle.notify_all()
+                    return
+                effects = []
+                while lane:
+                    effects.extend(lane.popleft())
+            try:
+                self.run(game, effects)
+            except Exception as e:
+                print(f"Error running effects for chat {game.chat_id}: {e}")
+            sends = sum(1 for effect in effects if effect['type'] in SEND_EFFECTS)
+            with self.lock:
+                self.in_flight -= sends
+
+    def run(self, game, effects):
+        events = []
+        for effect in effects:
+            if effect['type'] == 'journal':
+                events.append(effect['event'])
+                continue
+            if effect['type'] == 'snapshot':
+                # The snapshot contains every event before it, but the
+                # journal archive must have them too
+                if events:
+                    game.journal.append_events(events)
+                    events = []
+                game.write_snapshot(effect['data'])
+                continue
+            
+            # Journal first, so nothing is announced that a restart would lose
+            if events:
+                game.journal.append_events(events)
+                events = []
+            try:
+                EFFECT_RUNNERS[effect['type']](game, effect)
+            except Exception as e:
+                print(f"Error running {effect['type']} effect for chat {game.chat_id}: {e}")
+        
+        if events:
+            game.journal.append_events(events)
+
+    def flush(self, timeout=None):
+        # Waits until every queued batch has run; False if some are left after `timeout`
+        with self.lock:
+            return self.idle.wait_for(lambda: not self.lanes, timeout)
+
+class InlineExecutor(EffectExecutor):
+    # Runs effects right away on the calling thread (benchmarks, scripts)
+    def __init__(self):
+        self.in_flight = 0
+
+    def submit(self, game, effects):
+        self.run(game, effects)
+
+    def flush(self, timeout=None):
+        return True
+
+effect_executor = EffectExecutor()
+phase_scheduler = PhaseScheduler()  # one thread for the phase timers of every game
+
+# Limits on running games, queued sends and the update backlog (admission.py)
+admission = AdmissionController()
+admission.sends = lambda: effect_executor.in_flight
+
+class MafiaGame(GameState):
+    # The rules and the state are in GameState/transition (game_core.py);
+    # this adds the bot, the journal file, the phase timer and runs effects
+    def __init__(self, chat_id, persist=True, executor=None, scheduler=None):
+        super().__init__(chat_id)
+        self.persist = persist  # False keeps the game purely in memory (replays, simulations)
+        self.journal = store.journal(chat_id, persist=persist)
+        self.executor = executor or effect_executor
+        self.scheduler = scheduler or phase_scheduler
+        self.bot = None
+        self.phase_timer = None
+        self.idle_timer = None  # evicts a game made by a command that never went live
+        self.timer_state = None  # phase, nonce, early and wall-clock deadline of the phase timer
+        self.suspended = False  # set by a drain; timers are then only recorded, not started
+        self.lock = threading.RLock()  # transitions of one game never interleave; re-entered by inline effects
+        self.unreachable_warned = set()  # players the group was already warned about
+        if persist:
+            # A chat evicted after its last game goes on with its counters:
+            # its journal archive stays in order and the last game's buttons stale
+            data, events = store.load_game(chat_id)
+            if data:
+                previous = GameState(chat_id)
+                previous.restore_snapshot(data)
+                for event in events:
+                    previous.apply_event(event)
+                self.seq = previous.seq
+                self.phase_nonce = previous.phase_nonce
+        self.save_game_state()
+
+    def set_bot(self, bot):
+        self.bot = bot
+
+    def apply_reset(self, event):
+        super().apply_reset(event)
+        # A new game warns again about players that still can't be reached
+        self.unreachable_warned = set()
+
+    def dispatch(self, event):
+        # The transition only touches memory; timers are set right away and
+        # everything else goes to the executor. Returns the (ok, text) reply.
+        event.setdefault('now', self.scheduler.clock())
+        with self.lock:
+            was_started = self.game_started
+            was_live = self.is_live()
+            state, effects = transition(self, event)
+            result = (True, None)
+            pending = []
+            scheduled = False
+            for effect in effects:
+                if effect['type'] == 'reply':
+                    result = (effect['ok'], effect['text'])
+                elif effect['type'] == 'schedule':
+                    self.start_phase_timer(effect['phase'], effect['duration'], effect['nonce'], effect.get('early', False))
+                    scheduled = True
+                elif effect['type'] == 'cancel_timer':
+                    self.cancel_phase_timer()
+                else:
+                    pending.append(effect)
+            if scheduled and self.persist and store.shared:
+                # A node taking the chat over after this one died needs the deadline
+                self.checkpoint(pending)
+            if self.persist and self.is_live() != was_live:
+                # After the journal events, so an indexed game always has them on disk
+                pending.append({'type': 'index', 'live': self.is_live()})
+            if pending:
+                self.executor.submit(self, pending)
+            ended = was_started and not self.game_started
+        if ended:
+            # Outside the lock: the freed slot may start a waiting game right away
+            admission.release(self.chat_id)
+        return result
+
+    def is_live(self):
+        # Worth loading after a restart: the store lists these chats as live
+        return bool(self.players) or self.game_started or self.early_finish
+
+    def start_phase_timer(self, phase, duration, nonce, early=False):
+        self.cancel_phase_timer()
+        # The timeout carries the nonce, so a timer that fires after its phase ended does nothing
+        event = {'type': 'timeout', 'phase': phase, 'nonce': nonce, 'early': early}
+        # The deadline is wall-clock time so another process can pick the timer up
+        self.timer_state = {'phase': phase, 'nonce': nonce, 'early': early, 'deadline': time.time() + duration}
+        if self.suspended:
+            return
+        self.phase_timer = self.scheduler.call_later(duration, self.dispatch, event)
+
+    def cancel_phase_timer(self):
+        self.timer_state = None
+        if self.phase_timer:
+            self.scheduler.cancel(self.phase_timer)
+            self.phase_timer = None
+
+    def suspend(self):
+        # Drain: stop the timer but keep its deadline for the snapshot
+        with self.lock:
+            self.suspended = True
+            if self.phase_timer:
+                self.scheduler.cancel(self.phase_timer)
+                self.phase_timer = None
+
+    def resume_phase_timer(self):
+        # After a handover: the same timeout at the same deadline, or a whole
+        # new phase when the snapshot has no timer for the current phase
+        with self.lock:
+            self.suspended = False
+            if not self.game_started or self.phase not in PHASE_DURATIONS:
+                return
+            timer = self.timer_state
+            if timer and timer['phase'] == self.phase and timer['nonce'] == self.phase_nonce:
+                self.start_phase_timer(self.phase, max(0, timer['deadline'] - time.time()), self.phase_nonce, timer['early'])
+            else:
+                self.start_phase_timer(self.phase, PHASE_DURATIONS[self.phase], self.phase_nonce)
+
+    def add_player(self, user_id, name):
+        return self.dispatch({'type': 'join', 'user_id': user_id, 'name': name})
+
+    def start_game(self, admin_id, seed=None):
+        # The seed is drawn here so the transition itself stays deterministic
+        if seed is None:
+            seed = random.getrandbits(32)
+        return self.dispatch({'type': 'start', 'admin_id': admin_id, 'seed': seed})
+
+    def process_night_action(self, user_id, target_id, action=None):
+        return self.dispatch({'type': 'night_action', 'user_id': user_id, 'target_id': target_id, 'action': action})
+
+    def process_vote(self, voter_id, target_id):
+        return self.dispatch({'type': 'vote', 'voter_id': voter_id, 'target_id': target_id})
+
+    def hang_player(self, target_id):
+        return self.dispatch({'type': 'hang', 'target_id': target_id})
+
+    def skip_hang(self):
+        return self.dispatch({'type': 'no_hang'})
+
+    def end_game(self):
+        return self.dispatch({'type': 'end_game'})
+
+    def set_early_finish(self, enabled):
+        return self.dispatch({'type': 'settings', 'early_finish': enabled})
+
+    def expire_phase(self):
+        # Same as the current phase timer firing now
+        return self.dispatch({'type': 'timeout', 'phase': self.phase, 'nonce': self.phase_nonce})
+
+    def warn_unreachable(self, user_id):
+        # A player's role or keyboard couldn't be DM'd; the group hears about it once.
+        # Joins come through the private deep link, so this can't be found out earlier.
+        player = self.players.get(user_id)
+        if not self.bot or not player or user_id in self.unreachable_warned:
+            return
+        self.unreachable_warned.add(user_id)
+        try:
+            self.bot.send_message(
+                chat_id=self.chat_id,
+                text=f"{player['name']} botla şəxsi söhbəti başlatmayıb və ya botu bloklayıb. "
+                     "Rolunu və seçim düymələrini ala bilməyəcək, əvvəlcə bota /start yazsın."
+            )
+        except Exception as e:
+            print(f"Error sending reachability warning to chat {self.chat_id}: {e}")
+
+    def generate_player_selection_keyboard(self, user_id, action_type=None, page=0):
+        return inline_keyboard(self.selection_rows(user_id, action_type, page))
+
+    def generate_vote_keyboard(self, voter_id, page=0):
+        return inline_keyboard(self.vote_rows(voter_id, page))
+
+    def snapshot(self):
+        data = super().snapshot()
+        if self.timer_state:
+            data['timer'] = dict(self.timer_state)
+        return data
+
+    def write_snapshot(self, data):
+        # Full snapshot; everything journaled so far is inside it, so the journal is archived
+        if self.persist:
+            store.save_snapshot(self.chat_id, data)
+        self.journal.compact()
+
+    def save_game_state(self):
+        with self.lock:
+            self.since_snapshot = 0
+            data = self.snapshot()
+        self.write_snapshot(data)
+
+    @classmethod
+    def load_game_state(cls, chat_id):
+        # Snapshot plus whatever was journaled after it
+        data, events = store.load_game(chat_id)
+        if data is None:
+            return None
+        
+        game = cls(chat_id, persist=False)
+        game.restore_snapshot(data)
+        game.timer_state = data.get('timer')
+        for event in events:
+            game.apply_event(event)
+        
+        game.persist = True
+        game.journal = store.journal(chat_id)
+        game.save_game_state()
+        return game
+
+# Global games dictionary
+active_games = {}
+# Snapshots, journals, the live chats and the players: data/ by default, or
+# a store shared with other bot nodes (MAFIA_STORE, store.py and cluster.py)
+store = open_store(node=NODE_ID)
+cluster = ClusterNode(store) if store.shared else None
+reachability = ReachabilityRegistry(store)
+draining = threading.Event()  # set once this process is handing over to the next one
+
+class GameLoader:
+    # Brings back the games a previous process left in data/, with their
+    # phase timers running to the original deadlines. Runs in the background
+    # while the bot already polls; an update for a game that isn't loaded
+    # yet loads that game first (get_game).
+    def __init__(self):
+        self.pending = set()
+        self.bot = None
+        self.lock = threading.Lock()
+
+    def start(self, bot, chat_ids):
+        self.bot = bot
+        self.pending = set(chat_ids)
+        threading.Thread(target=self.run, name='game-loader', daemon=True).start()
+
+    def run(self):
+        started = time.monotonic()
+        for chat_id in sorted(self.pending):
+            self.load(chat_id)
+        print(f"{len(active_games)} games resumed in {time.monotonic() - started:.2f}s")
+
+    def load(self, chat_id):
+        with self.lock:
+            if chat_id not in self.pending:
+                return active_games.get(chat_id)
+            self.pending.discard(chat_id)
+            return self.resume(chat_id)
+
+    def resume(self, chat_id):
+        # Called with the lock held
+        try:
+            game = MafiaGame.load_game_state(chat_id)
+        except Exception as e:
+            print(f"Error loading game {chat_id}: {e}")
+            return None
+        if game is None:
+            return None
+        # Builds the index on the first start after it was introduced
+        store.set_live(chat_id, game.is_live())
+        if not game.is_live():
+            return None
+        game.set_bot(self.bot)
+        game.resume_phase_timer()
+        if game.game_started:
+            admission.resume(chat_id)
+        active_games[chat_id] = game
+        return game
+
+    def stop(self):
+        # Drain: whatever isn't loaded yet stays on disk for the next process
+        with self.lock:
+            self.pending.clear()
+
+game_loader = GameLoader()
+
+def new_game(chat_id, **options):
+    # Games made by commands aren't live until someone joins or a setting is
+    # on; the index effect never evicts them, so a timer does if that never happens
+    game = active_games[chat_id] = MafiaGame(chat_id, **options)
+    game.idle_timer = game.scheduler.call_later(IDLE_GAME_TIMEOUT, evict_idle_game, game)
+    return game
+
+def get_game(chat_id):
+    game = active_games.get(chat_id)
+    if game is None and chat_id in game_loader.pending:
+        game = game_loader.load(chat_id)
+    return game
+
+def adopt_game(chat_id):
+    # Cluster: this node holds the chat's lease now, its game comes from the store
+    with game_loader.lock:
+        game_loader.pending.discard(chat_id)
+        if chat_id not in active_games:
+            game_loader.resume(chat_id)
+
+def drop_game(chat_id):
+    # Cluster: another node drives the chat now, its timers must stop here
+    game = active_games.pop(chat_id, None)
+    if game:
+        game.suspend()
+        admission.release(chat_id)
+
+def update_chat(update):
+    # The game chat an update is about; None for updates about a user only (/profile, private chat)
+    if update.callback_query:
+        decoded = decode_callback(update.callback_query.data or '')
+        return decoded[1] if decoded else None
+    if update.message and update.message.text:
+        match = JOIN_LINK.match(update.message.text)
+        if match:
+            return int(match.group(1))
+    chat = update.effective_chat
+    if chat and chat.type != 'private':
+        return chat.id
+    return None
+
+def route_update(update: Update, context: CallbackContext):
+    # Cluster: runs before every other handler. Updates about a chat that
+    # another node drives go to that node's inbox and stop here.
+    from telegram.ext import DispatcherHandlerStop
+    
+    chat_id = update_chat(update)
+    if chat_id is None:
+        return
+    forwarded = update.update_id in forwarded_updates
+    forwarded_updates.discard(update.update_id)
+    node = cluster.route(chat_id, forwarded=forwarded)
+    if node != cluster.node_id:
+        cluster.forward(node, update.to_json())
+        raise DispatcherHandlerStop
+
+class IngressPoller:
+    # Cluster: polls Telegram while this node holds the ingress lease. Every
+    # node runs its dispatcher, only one of them feeds it from getUpdates.
+    def __init__(self):
+        self.updater = None
+        self.active = threading.Event()
+        self.thread = None
+
+    def set_active(self, polling):
+        if not polling:
+            print("Cluster: another node polls Telegram now")
+            self.active.clear()
+            return
+        print("Cluster: this node polls Telegram")
+        self.active.set()
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='ingress', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        updater = self.updater
+        while self.active.is_set():
+            try:
+                updates = updater.bot.get_updates(updater.last_update_id, timeout=POLL_TIMEOUT)
+            except Exception as e:
+                print(f"Error polling updates: {e}")
+                time.sleep(1)
+                continue
+            for update in updates:
+                updater.update_queue.put(update)
+            if updates:
+                updater.last_update_id = updates[-1].update_id + 1
+
+    def stop(self):
+        self.active.clear()
+        if self.thread is not None:
+            self.thread.join()
+
+ingress_poller = IngressPoller()
+forwarded_updates = set()  # ids of updates other nodes routed here
+
+def receive_forwarded(updater, payload):
+    # An update another node routed here; route_update doesn't pass it on again
+    update = Update.de_json(json.loads(payload), updater.bot)
+    forwarded_updates.add(update.update_id)
+    updater.update_queue.put(update)
+
+def start_cluster(updater):
+    # Every node runs the dispatcher; the ingress lease decides which one polls
+    threading.Thread(target=updater.dispatcher.start, name='dispatcher', daemon=True).start()
+    ingress_poller.updater = updater
+    cluster.load = lambda: len(active_games)
+    cluster.can_take = lambda: admission.pressure() is None
+    cluster.on_claimed = adopt_game
+    cluster.on_lost = drop_game
+    cluster.on_ingress = ingress_poller.set_active
+    cluster.on_update = lambda payload: receive_forwarded(updater, payload)
+    cluster.start()
+
+def drain(updater):
+    # Stop taking updates, let queued sends and journal writes finish and
+    # leave every game on disk with its timer deadline for the next process
+    started = time.monotonic()
+    draining.set()
+    game_loader.stop()
+    if cluster:
+        ingress_poller.stop()
+    updater.stop()
+    # Confirm the last batch of updates, otherwise the next process gets it again
+    try:
+        if updater.last_update_id:
+            updater.bot.get_updates(offset=updater.last_update_id, timeout=0)
+    except Exception as e:
+        print(f"Drain: could not confirm the last updates: {e}")
+    if cluster:
+        # Another node starts polling from the confirmed offset
+        cluster.stop()
+    games = list(active_games.values())
+    for game in games:
+        game.suspend()
+    if not effect_executor.flush(DRAIN_TIMEOUT):
+        print(f"Drain: effects still queued after {DRAIN_TIMEOUT}s")
+    # Sends held back by an open circuit breaker go out now if the API is back
+    updater.bot.request.flush_deferred()
+    for game in games:
+        try:
+            game.save_game_state()
+        except Exception as e:
+            print(f"Drain: could not save game {game.chat_id}: {e}")
+    if cluster:
+        # The other nodes take the chats over right away instead of when the leases expire
+        cluster.leave()
+    print(f"Drained {len(games)} games in {time.monotonic() - started:.2f}s")
+
+def start_game_command(update: Update, context: CallbackContext):
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    
+    if draining.is_set():
+        update.message.reply_text("Bot yenilənir, bir neçə saniyədən sonra yenidən cəhd edin.")
+        return
+    
+    # Check if user is admin
+    chat_member = context.bot.get_chat_member(chat_id, user_id)
+    if chat_member.status not in ['creator', 'administrator']:
+        update.message.reply_text("Bu əmri yalnız qrup yöneticiləri istifadə edə bilər!")
+        return
+
+    # Create or get existing game; new lobbies are shed while the bot is overloaded
+    game = get_game(chat_id)
+    if game is None:
+        if not admission.open_lobby():
+            update.message.reply_text(overload_message(RETRY_AFTER))
+            return
+        game = new_game(chat_id)
+    
+    game.set_bot(context.bot)
+    
+    # Create registration message
+    reply_markup = inline_keyboard(registration_rows(chat_id, game.phase_nonce), context.bot)
+    
+    message_text = game.generate_registration_message()
+    
+    update.message.reply_text(message_text, reply_markup=reply_markup, parse_mode='HTML')
+    
+    if not game.game_started and admission.pressure() == 'games':
+        update.message.reply_text(
+            f"Hazırda bütün oyun yerləri doludur. Oyun başladılanda növbəyə düşəcək "
+            f"(növbədə {len(admission.waiting)} qrup var)."
+        )
+
+def fast_phases_command(update: Update, context: CallbackContext):
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    
+    # Check if user is admin
+    chat_member = context.bot.get_chat_member(chat_id, user_id)
+    if chat_member.status not in ['creator', 'administrator']:
+        update.message.reply_text("Bu əmri yalnız qrup yöneticiləri istifadə edə bilər!")
+        return
+    
+    game = get_game(chat_id)
+    if game is None:
+        game = new_game(chat_id)
+    
+    # /fastphases on|off, without an argument it toggles
+    if context.args:
+        enabled = context.args[0].lower() in ('on', 'aç', '1')
+    else:
+        enabled = not game.early_finish
+    success, message = game.set_early_finish(enabled)
+    update.message.reply_text(message)
+
+def overload_message(retry_after):
+    return f"Bot hazırda çox yüklənib. Zəhmət olmasa {retry_after} saniyə sonra yenidən cəhd edin."
+
+def handle_start_callback(query, context, game, action, target):
+    game.set_bot(context.bot)  # Set bot instance for game
+    admin_id = query.from_user.id
+    
+    def start():
+        # Roles and selection keyboards are sent to the players by the executor
+        success, message = game.start_game(admin_id)
+        
+        # Create keyboard for game start message
+        reply_markup = inline_keyboard(start_link_rows(game.chat_id), context.bot)
+        
+        query.message.reply_text(message, reply_markup=reply_markup, parse_mode='HTML')
+        return success
+    
+    # Only a game that can actually start takes a slot or a place in the queue
+    if game.game_started or len(game.players) < MIN_PLAYERS:
+        start()
+        return
+    decision, value = admission.admit(game.chat_id, start)
+    if decision == 'queued':
+        query.message.reply_text(
+            f"Hazırda bütün oyun yerləri doludur. Oyununuz növbədədir, sıranız: {value}. "
+            "Yer açılan kimi oyun avtomatik başlayacaq."
+        )
+    elif decision == 'rejected':
+        query.message.reply_text(overload_message(value))
+
+def handle_page_callback(query, context, game, action, target):
+    user_id = query.from_user.id
+    page_action, page = target
+    
+    if page_action == 'vote':
+        keyboard = game.generate_vote_keyboard(user_id, page)
+    elif page_action in ('select', 'check', 'shoot'):
+        action_type = page_action if page_action in ('check', 'shoot') else None
+        keyboard = game.generate_player_selection_keyboard(user_id, action_type, page)
+    else:
+        return
+    query.edit_message_reply_markup(reply_markup=keyboard)
+
+def handle_select_callback(query, context, game, action, target):
+    # The group is told about the choice by the game, confirm to user
+    success, message = game.process_night_action(query.from_user.id, target)
+    if success:
+        query.message.reply_text(message)
+
+def handle_detective_mode_callback(query, context, game, action, target):
+    user_id = query.from_user.id
+    if game.players[user_id]['role'] == 'detective':
+        keyboard = game.generate_player_selection_keyboard(user_id, action.split('_')[1])
+        query.message.reply_text("İndi hədəf seçin:", reply_markup=keyboard)
+
+def handle_detective_target_callback(query, context, game, action, target):
+    # Only a detective's choice is accepted as a check or a shot
+    success, message = game.process_night_action(query.from_user.id, target, action)
+    if success:
+        query.message.reply_text(message)
+
+def handle_vote_callback(query, context, game, action, target):
+    success, message = game.process_vote(query.from_user.id, target)
+    if success:
+        query.message.reply_text(message)
+
+def handle_hang_callback(query, context, game, action, target):
+    game.hang_player(target)
+
+def handle_no_hang_callback(query, context, game, action, target):
+    game.skip_hang()
+
+def handle_noop_callback(query, context, game, action, target):
+    pass
+
+# Decoded callback action -> handler(query, context, game, action, target)
+CALLBACK_HANDLERS = {
+    'start': handle_start_callback,
+    'page': handle_page_callback,
+    'select': handle_select_callback,
+    'detective_check': handle_detective_mode_callback,
+    'detective_shoot': handle_detective_mode_callback,
+    'check': handle_detective_target_callback,
+    'shoot': handle_detective_target_callback,
+    'vote': handle_vote_callback,
+    'hang': handle_hang_callback,
+    'no_hang': handle_no_hang_callback,
+    'noop': handle_noop_callback
+}
+
+# Actions that anyone in the group may press, the rest need a player of the game
+PUBLIC_CALLBACK_ACTIONS = ('start', 'noop')
+
+def button_callback(update: Update, context: CallbackContext):
+    query = update.callback_query
+    decoded = decode_callback(query.data)
+    
+    # The game is referenced directly by the button, stale and malformed
+    # buttons are dropped before any handler runs
+    game = None
+    if decoded:
+        action, chat_id, nonce, target = decoded
+        game = get_game(chat_id)
+    if not game or nonce != game.phase_nonce:
+        query.answer("Bu düymə artıq keçərli deyil.")
+        return
+    if action not in PUBLIC_CALLBACK_ACTIONS and query.from_user.id not in game.players:
+        query.answer("Siz bu oyunda iştirak etmirsiniz.")
+        return
+    
+    query.answer()
+    CALLBACK_HANDLERS[action](query, context, game, action, target)
+
+def start_command(update: Update, context: CallbackContext):
+    # Anyone talking to us in private can receive DMs
+    if update.effective_chat.type == 'private':
+        reachability.mark_reachable(update.effective_user.id, confirmed=True)
+    
+    if context.args and context.args[0].startswith("join_"):
+        chat_id = int(context.args[0].split("_")[1])
+        game = get_game(chat_id)
+        
+        if game and not game.game_started:
+            game.set_bot(context.bot)
+            success, message = game.add_player(
+                update.effective_user.id,
+                update.effective_user.full_name
+            )
+            update.message.reply_text(message)
+        else:
+            update.message.reply_text("Oyun artıq başladılıb və ya mövcud deyil!")
+    
+    elif context.args and context.args[0].startswith("role_"):
+        chat_id = int(context.args[0].split("_")[1])
+        game = get_game(chat_id)
+        
+        if game and update.effective_user.id in game.players:
+            role_message = game.generate_role_message(update.effective_user.id)
+            update.message.reply_text(role_message, parse_mode='HTML')
+            
+            # If player has an active role, send selection keyboard
+            if ROLES[game.players[update.effective_user.id]['role']]['is_active']:
+                keyboard = game.generate_player_selection_keyboard(update.effective_user.id)
+                update.message.reply_text("Seciminizi edin:", reply_markup=keyboard)
+
+def message_handler(update: Update, context: CallbackContext):
+    if not update.message or not update.message.text:
+        return
+    
+    chat_id = update.message.chat_id
+    user_id = update.message.from_user.id
+    message_text = update.message.text
+    
+    # Check if message is from a game chat
+    game = get_game(chat_id)
+    
+    if not game or not game.game_started:
+        return
+    
+    # Allow messages from admins with ! prefix
+    if message_text.startswith('!'):
+        # Check if user is admin
+        chat_member = context.bot.get_chat_member(chat_id, user_id)
+        if chat_member.status in ['creator', 'administrator']:
+            return
+        else:
+            context.bot.delete_message(chat_id=chat_id, message_id=update.message.message_id)
+            return
+    
+    # Delete all messages during night phase
+    if game.phase == 'night':
+        context.bot.delete_message(chat_id=chat_id, message_id=update.message.message_id)
+        return
+    
+    # During day phase, only allow messages from active players
+    if game.phase == 'day':
+        if user_id not in game.players or 'is_dead' in game.players[user_id]:
+            context.bot.delete_message(chat_id=chat_id, message_id=update.message.message_id)
+            context.bot.send_message(
+                chat_id=chat_id,
+                text="Oyunda olmadığınız üçün mesaj yaza bilmərsiniz",
+                reply_to_message_id=update.message.message_id
+            )
+            return
+
+def profile_command(update: Update, context: CallbackContext):
+    user_id = update.effective_user.id
+    user_data = UserData(user_id)
+    
+    # Calculate win rate
+    win_rate = (user_data.games_won / user_data.games_played * 100) if user_data.games_played > 0 else 0
+    
+    # Create profile message
+    profile_message = (
+        "📊 Profil Məlumatları\n\n"
+        f"🎮 Oynanmış oyun: {user_data.games_played}\n"
+        f"🏆 Qazanılmış oyun: {user_data.games_won}\n"
+        f"📈 Qalibiyyət faizi: {win_rate:.1f}%\n"
+        f"💰 Ümumi balans: {user_data.total_money} dollar\n"
+    )
+    
+    update.message.reply_text(profile_message)
+
+def end_game_command(update: Update, context: CallbackContext):
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    
+    # Find the game
+    game = get_game(chat_id)
+    
+    if not game:
+        update.message.reply_text("Bu qrupda aktiv oyun yoxdur.")
+        return
+    
+    # Check if user is admin or game admin
+    if user_id != game.admin_id:
+        chat_member = context.bot.get_chat_member(chat_id, user_id)
+        if chat_member.status not in ['creator', 'administrator']:
+            update.message.reply_text("Yalnız adminlər və oyun admini oyunu bitirə bilər.")
+            return
+    
+    # End the game; rewards and the reset are done by the game
+    success, message = game.end_game()
+    update.message.reply_text(message)
+
+def status_command(update: Update, context: CallbackContext):
+    # Saturation of this bot process: how close it is to each admission limit
+    metrics = admission.metrics()
+    memory = process_footprint(active_games, phase_scheduler)
+    rss = f"{memory['rss_bytes'] / 2 ** 20:.0f} MB" if memory['rss_bytes'] else "?"
+    node = ""
+    if cluster:
+        node = (
+            f"Node: {cluster.node_id}{' (Telegram-ı dinləyir)' if cluster.ingress else ''}, "
+            f"qruplar: {len(cluster.held)}, node sayı: {len(cluster.nodes)}\n"
+        )
+    update.message.reply_text(
+        "📊 Bot yükü:\n"
+        f"Gedən oyunlar: {metrics['running_games']}/{metrics['max_games']}\n"
+        f"Növbədəki oyunlar: {metrics['waiting_games']}/{metrics['queue_size']}\n"
+        f"Göndərilməyi gözləyən mesajlar: {metrics['inflight_sends']}/{metrics['max_sends']}\n"
+        f"Emal olunmamış yeniləmələr: {metrics['dispatcher_backlog']}/{metrics['max_backlog']}\n"
+        f"Axınlar: {metrics['threads']}\n"
+        f"Yaddaşdakı oyunlar: {memory['resident_games']}, taymerlər: {memory['pending_timers']}, RSS: {rss}\n"
+        f"{node}"
+        f"Qəbul edilib: {metrics['admitted']}, növbəyə düşüb: {metrics['queued']}, "
+        f"rədd edilib: {metrics['rejected'] + metrics['shed_lobbies']}"
+    )
+
+def help_command(update: Update, context: CallbackContext):
+    help_message = (
+        "🎮 Mafia Bot Əmrləri:\n\n"
+        "📝 Qeyd: Bəzi əmrlər yalnız adminlər və ya oyun admini tərəfindən istifadə edilə bilər."
+    )
+    
+    update.message.reply_text(help_message)
+
+def bot_membership_handler(update: Update, context: CallbackContext):
+    # Private chat status changes: the user blocked or unblocked the bot
+    member_update = update.my_chat_member
+    if member_update.chat.type != 'private':
+        return
+    user_id = member_update.chat.id
+    if member_update.new_chat_member.status in ['kicked', 'left']:
+        reachability.mark_unreachable(user_id, blocked=True)
+    else:
+        reachability.mark_reachable(user_id, confirmed=True)
+
+def main():
+    # With data/ one process runs the bot at a time; during a deploy the new
+    # one waits here until the old one has drained and released the lock.
+    # Nodes of a cluster run side by side, leases decide who drives a chat.
+    lock = None
+    if cluster is None:
+        lock = ProcessLock(LOCK_FILE)
+        if not lock.try_acquire():
+            print(f"Waiting for process {holder_pid(LOCK_FILE)} to hand over the bot...")
+            # Import what starting up needs meanwhile, the drain takes longer
+            import telegram.ext  # noqa: F401
+            lock.acquire()
+    
+    # Games come back in the background while the rest starts up and polls;
+    # in a cluster they come with the leases of the chats instead
+    bot = create_bot(os.getenv('TELEGRAM_BOT_TOKEN'), base_url=os.getenv('TELEGRAM_API_URL'))
+    game_loader.start(bot, [] if cluster else store.live_chats())
+    
+    # telegram.ext (with its scheduler and web server) is only needed to run the bot
+    from telegram.ext import (
+        Updater, CommandHandler, CallbackQueryHandler, MessageHandler, Filters, ChatMemberHandler, TypeHandler
+    )
+    
+    # Create the Updater with a bot using the pooled, retrying transport
+    updater = Updater(bot=bot, use_context=True)
+    
+    # Get the dispatcher to register handlers
+    dp = updater.dispatcher
+    admission.backlog = dp.update_queue.qsize
+    
+    # Add handlers
+    dp.add_handler(CommandHandler("start", start_command))
+    dp.add_handler(CommandHandler("help", help_command))
+    dp.add_handler(CommandHandler("join", start_command))
+    dp.add_handler(CommandHandler("startgame", start_game_command))
+    dp.add_handler(CommandHandler("profile", profile_command))
+    dp.add_handler(CommandHandler("fastphases", fast_phases_command))
+    dp.add_handler(CommandHandler("status", status_command))
+    dp.add_handler(CallbackQueryHandler(button_callback))
+    dp.add_handler(ChatMemberHandler(bot_membership_handler, ChatMemberHandler.MY_CHAT_MEMBER))
+    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, message_handler))
+    
+    # Start the Bot
+    if cluster:
+        dp.add_handler(TypeHandler(Update, route_update), group=-1)
+        start_cluster(updater)
+        print(f"Bot started as node {cluster.node_id}")
+    else:
+        updater.start_polling(timeout=POLL_TIMEOUT)
+        print("Bot started")
+    
+    # SIGTERM (deploys) and Ctrl+C drain instead of dropping timers and sends
+    stop = threading.Event()
+    for signum in DRAIN_SIGNALS:
+        signal.signal(signum, lambda signum, frame: stop.set())
+    while not stop.wait(1):
+        pass
+    drain(updater)
+    if lock:
+        lock.release()
+
+if __name__ == '__main__':
     main() 
\ No newline at end of file
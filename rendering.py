@@ -0,0 +1,126 @@
+"""Group announcement templates and the per-game player list cache.
+
+Player names are HTML-escaped once when the player joins. The rendered
+player list is kept per game and only rebuilt after a death (a join just
+appends a line), so phase messages are assembled from ready fragments.
+"""
+import html
+
+PLAYER_LINK_TEMPLATE = "{index}. <a href='tg://user?id={user_id}'>{name}</a>"
+
+REGISTRATION_TEMPLATE = (
+    "Qeydiyyat başladı! Qatılmaq üçün tələs!\n\n"
+    "<b>Qatılanlar:</b> {player_names}"
+)
+
+GAME_START_TEMPLATE = (
+    "Mafia Combat Oyunu Başladı\n\n"
+    "Gecə düşür!\n"
+    "Yalnız cəsarətlilər və qorxmazlar şəhər küçələrinə çıxırlar. "
+    "Səhər başlarını saymağa çalışacağıq...\n\n"
+    "Sağ qalan oyunçular:\n{player_list}\n\n"
+    "Onlardan:\n\n"
+    "👫Dinc Sakinlər - {citizens}\n"
+    " {citizen_roles}\n"
+    "---------\n"
+    "👥Mafiyalar - {mafia}\n"
+    " {mafia_roles}\n\n"
+    "🎪 Cəmi: {total} nəfər"
+)
+
+MORNING_HEADER_TEMPLATE = (
+    "{chat_id}, Sabahın Xeyir!!\n"
+    "Günəş, səkilərdə gecə tökülən qanı qurudaraq, çıxır........\n"
+    "☀️Gün: {day_number}\n\n"
+)
+
+MORNING_BODY_TEMPLATE = (
+    "Sağ qalan oyunçular:\n{player_list}\n\n"
+    "Onlardan:\n\n"
+    "👫Dinc Sakinlər - {citizens}\n"
+    "---------\n"
+    "👥Mafiyalar - {mafia}\n\n"
+    "🎪 Cəmi: {total} nəfər\n\n"
+    "İndi gecənin nəticələrini müzakirə etmək, səbəb və təsirləri anlamaq vaxtıdır......"
+)
+
+EMPTY_REGISTRATION = "Hələ heç kim qatılmayıb"
+
+
+class PlayerListCache:
+    def __init__(self):
+        self.escaped_names = {}  # {user_id: html-escaped name}
+        self.alive_ids = []  # living players in join order
+        self.player_list = None  # numbered tg://user links of living players
+        self.player_names = None  # comma separated names for the registration message
+
+    def clear(self):
+        self.escaped_names = {}
+        self.alive_ids = []
+        self.player_list = None
+        self.player_names = None
+
+    def add_player(self, user_id, name):
+        escaped = html.escape(name)
+        self.escaped_names[user_id] = escaped
+        self.alive_ids.append(user_id)
+        # Joins only append, so extend the cached fragments in place
+        if self.player_list is not None:
+            line = PLAYER_LINK_TEMPLATE.format(index=len(self.alive_ids), user_id=user_id, name=escaped)
+            self.player_list = f"{self.player_list}\n{line}" if self.player_list else line
+        if self.player_names is not None:
+            self.player_names = f"{self.player_names}, {escaped}" if self.player_names else escaped
+
+    def remove_player(self, user_id):
+        # A death renumbers the list, rebuild it lazily on the next render
+        if user_id in self.alive_ids:
+            self.alive_ids.remove(user_id)
+            self.player_list = None
+
+    def rebuild(self, players):
+        # Full rebuild from a players dict, used after restoring a saved game
+        self.clear()
+        for user_id, player in players.items():
+            self.escaped_names[user_id] = html.escape(player['name'])
+            if 'is_dead' not in player:
+                self.alive_ids.append(user_id)
+
+    def render_player_list(self):
+        if self.player_list is None:
+            self.player_list = "\n".join([
+                PLAYER_LINK_TEMPLATE.format(index=i + 1, user_id=user_id, name=self.escaped_names[user_id])
+                for i, user_id in enumerate(self.alive_ids)
+            ])
+        return self.player_list
+
+    def render_player_names(self):
+        if self.player_names is None:
+            self.player_names = ", ".join(self.escaped_names.values())
+        return self.player_names
+
+
+def render_registration(cache):
+    return REGISTRATION_TEMPLATE.format(player_names=cache.render_player_names() or EMPTY_REGISTRATION)
+
+
+def render_game_start(cache, alive_counts, citizen_roles, mafia_roles):
+    return GAME_START_TEMPLATE.format(
+        player_list=cache.render_player_list(),
+        citizens=alive_counts['citizens'],
+        citizen_roles=' '.join(citizen_roles),
+        mafia=alive_counts['mafia'],
+        mafia_roles=' '.join(mafia_roles),
+        total=len(cache.alive_ids)
+    )
+
+
+def render_morning(cache, alive_counts, chat_id, day_number, night_results):
+    message = MORNING_HEADER_TEMPLATE.format(chat_id=chat_id, day_number=day_number)
+    if night_results:
+        message += "\n".join(night_results) + "\n\n"
+    return message + MORNING_BODY_TEMPLATE.format(
+        player_list=cache.render_player_list(),
+        citizens=alive_counts['citizens'],
+        mafia=alive_counts['mafia'],
+        total=len(cache.alive_ids)
+    )
@@ -0,0 +1,219 @@
+"""Offline Monte Carlo balance simulator for the role setups dealt when a game starts.
+
+Plays out many games per role mix at once using NumPy arrays and writes the
+best-balanced mix for every player count to data/role_table.json, which
+game_core reads into ROLE_TABLE and game_core.on_start deals from.
+
+    python role_simulator.py --games 1000000 --min-players 3 --max-players 8
+"""
+import os
+import json
+import argparse
+import time
+
+import numpy as np
+
+from game_core import MAFIA_PER_KILL, ROLE_TABLE_FILE
+
+ROLE_TABLE_VERSION = 1
+
+MAFIA_ROLES = ('don_mafia', 'mafia')
+
+
+def candidate_setups(player_count):
+    # Every mix with at least one don, doctors, detectives and an optional
+    # crazy, citizens in the remaining slots. Large lobbies may have several
+    # doctors and detectives, up to one more than game_core.default_roles
+    # gives them. The town must outnumber the mafia at the start, otherwise
+    # the game is over before the first night.
+    setups = []
+    max_mafia = max(1, (player_count - 1) // 2)
+    max_doctors = 1 + player_count // 12
+    max_detectives = 1 + player_count // 25
+    for mafia_count in range(1, max_mafia + 1):
+        for doctors in range(max_doctors + 1):
+            for detectives in range(max_detectives + 1):
+                for crazy in (0, 1):
+                    specials = mafia_count + doctors + detectives + crazy
+                    if specials > player_count:
+                        continue
+                    roles = ['don_mafia'] + ['mafia'] * (mafia_count - 1)
+                    roles += ['doctor'] * doctors + ['detective'] * detectives + ['crazy'] * crazy
+                    roles += ['citizen'] * (player_count - specials)
+                    setups.append(roles)
+    return setups
+
+
+def _pick(rng, mask):
+    # Uniform random column among the True entries of each row of mask.
+    scores = rng.random(mask.shape)
+    scores[~mask] = -1.0
+    return scores.argmax(axis=-1), mask.any(axis=-1)
+
+
+def simulate_batch(roles, games, rng, max_days=None):
+    """Play `games` games with the given role list and return outcome counts.
+
+    Policies are random: the mafia kill random living town players, one for
+    every MAFIA_PER_KILL living members and at least one (like
+    GameState.mafia_kill_targets), each doctor heals a random living player,
+    each detective checks a random living player and votes for any mafia they
+    found, everyone else votes for a random living player (mafia never vote
+    for each other). Ties hang nobody.
+    """
+    player_count = len(roles)
+    max_days = max_days or player_count * 2
+    is_mafia = np.array([role in MAFIA_ROLES for role in roles])
+    doctors = [i for i, role in enumerate(roles) if role == 'doctor']
+    detectives = [i for i, role in enumerate(roles) if role == 'detective']
+    rows = np.arange(games)
+    columns = np.arange(player_count)
+
+    alive = np.ones((games, player_count), dtype=bool)
+    known_mafia = np.zeros((games, player_count), dtype=bool)
+    running = np.ones(games, dtype=bool)
+    mafia_wins = np.zeros(games, dtype=bool)
+    citizen_wins = np.zeros(games, dtype=bool)
+
+    def check_end():
+        mafia_alive = (alive & is_mafia).sum(axis=1)
+        citizens_alive = (alive & ~is_mafia).sum(axis=1)
+        citizens_won = running & (mafia_alive == 0)
+        mafia_won = running & ~citizens_won & (mafia_alive >= citizens_alive)
+        citizen_wins[citizens_won] = True
+        mafia_wins[mafia_won] = True
+        running[citizens_won | mafia_won] = False
+
+    for _ in range(max_days):
+        if not running.any():
+            break
+
+        # Night
+        healed = np.zeros((games, player_count), dtype=bool)
+        for doctor in doctors:
+            target, valid = _pick(rng, alive)
+            valid &= running & alive[:, doctor]
+            healed[rows[valid], target[valid]] = True
+
+        for detective in detectives:
+            target, valid = _pick(rng, alive & (columns != detective))
+            valid &= running & alive[:, detective]
+            found = valid & is_mafia[target]
+            known_mafia[rows[found], target[found]] = True
+
+        kill_budget = np.maximum(1, (alive & is_mafia).sum(axis=1) // MAFIA_PER_KILL)
+        killers = (alive & is_mafia).any(axis=1)
+        targeted = np.zeros((games, player_count), dtype=bool)
+        for kill in range(int(kill_budget.max())):
+            target, valid = _pick(rng, alive & ~is_mafia & ~targeted)
+            valid &= running & killers & (kill < kill_budget)
+            targeted[rows[valid], target[valid]] = True
+        alive &= ~(targeted & ~healed)
+        check_end()
+
+        # Day vote
+        counts = np.zeros((games, player_count), dtype=np.int32)
+        for voter in range(player_count):
+            mask = alive & (columns != voter)
+            if is_mafia[voter]:
+                mask &= ~is_mafia
+            if voter in detectives:
+                suspects = mask & known_mafia
+                mask = np.where(suspects.any(axis=1, keepdims=True), suspects, mask)
+            target, valid = _pick(rng, mask)
+            valid &= running & alive[:, voter]
+            counts[rows[valid], target[valid]] += 1
+
+        top = counts.max(axis=1)
+        leaders = (counts == top[:, None]).sum(axis=1)
+        hanged = running & (top > 0) & (leaders == 1)
+        target = counts.argmax(axis=1)
+        alive[rows[hanged], target[hanged]] = False
+        check_end()
+
+    return {
+        'mafia': int(mafia_wins.sum()),
+        'citizens': int(citizen_wins.sum()),
+        'unresolved': int(running.sum())
+    }
+
+
+def simulate_setup(roles, games, rng, batch_size=200000):
+    totals = {'mafia': 0, 'citizens': 0, 'unresolved': 0}
+    remaining = games
+    while remaining > 0:
+        batch = min(batch_size, remaining)
+        result = simulate_batch(roles, batch, rng)
+        for key in totals:
+            totals[key] += result[key]
+        remaining -= batch
+    return {
+        'roles': roles,
+        'games': games,
+        'mafia_win': totals['mafia'] / games,
+        'citizen_win': totals['citizens'] / games,
+        'unresolved': totals['unresolved'] / games
+    }
+
+
+def describe(roles):
+    counts = {}
+    for role in roles:
+        counts[role] = counts.get(role, 0) + 1
+    return ", ".join(f"{role}x{count}" for role, count in counts.items())
+
+
+def build_role_table(min_players, max_players, games, target, seed=None, batch_size=200000):
+    rng = np.random.default_rng(seed)
+    table = {}
+    for player_count in range(min_players, max_players + 1):
+        results = []
+        for roles in candidate_setups(player_count):
+            started = time.perf_counter()
+            result = simulate_setup(roles, games, rng, batch_size)
+            elapsed = time.perf_counter() - started
+            results.append(result)
+            print(
+                f"{player_count:>3} players | {describe(roles):<60} | "
+                f"mafia {result['mafia_win']:6.1%} | citizens {result['citizen_win']:6.1%} | "
+                f"unresolved {result['unresolved']:5.1%} | {games / elapsed:,.0f} games/s"
+            )
+        best = min(results, key=lambda r: abs(r['mafia_win'] - target))
+        table[str(player_count)] = best
+        print(f"{player_count:>3} players -> {describe(best['roles'])} (mafia {best['mafia_win']:.1%})\n")
+    return table
+
+
+def save_role_table(table, target, path=ROLE_TABLE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': ROLE_TABLE_VERSION,
+            'target_mafia_win': target,
+            'table': table
+        }, f, ensure_ascii=False, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mafia role balance simulator")
+    parser.add_argument('--games', type=int, default=1000000, help="games per role mix")
+    parser.add_argument('--min-players', type=int, default=3)
+    parser.add_argument('--max-players', type=int, default=8)
+    parser.add_argument('--target', type=float, default=0.5, help="desired mafia win probability")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=200000)
+    parser.add_argument('--output', default=ROLE_TABLE_FILE)
+    parser.add_argument('--dry-run', action='store_true', help="print results without writing the table")
+    args = parser.parse_args()
+
+    table = build_role_table(
+        args.min_players, args.max_players, args.games,
+        args.target, args.seed, args.batch_size
+    )
+    if not args.dry_run:
+        save_role_table(table, args.target, args.output)
+        print(f"Role table written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
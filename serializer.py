@@ -0,0 +1,149 @@
+"""Encoding of everything the bot keeps under data/: game snapshots, game
+history, user records and the users the bot can't DM.
+
+Files are written as a small envelope
+
+    {'schema_version': 1, 'kind': 'game', 'data': {...}}
+
+with compact JSON by default, or orjson/msgpack when installed and chosen
+with MAFIA_SERIALIZER=orjson|msgpack. Reading doesn't depend on that
+setting: the format is detected from the file's first byte, and files
+written before the envelope existed (pretty-printed JSON, schema version
+0) are read as they are. SCHEMAS lists the fields whose keys are user ids,
+so they come back as ints whatever the format did to them.
+"""
+import os
+import json
+import tempfile
+import importlib
+import importlib.util
+
+SCHEMA_VERSION = 1
+
+# kind -> fields keyed by user id; history files hold a list of such records
+SCHEMAS = {
+    'game': ('players', 'night_actions', 'votes'),
+    'history': ('players',),
+    'user': (),
+    'index': (),
+    'reachability': ('unreachable',),
+}
+
+# orjson and msgpack are optional; they are only imported once a file needs them
+AVAILABLE = [name for name in ('json', 'orjson', 'msgpack') if importlib.util.find_spec(name) is not None]
+
+
+def backend(name):
+    return importlib.import_module(name)
+
+
+class JsonSerializer:
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    name = 'orjson'
+
+    def dumps(self, obj):
+        # Non-string keys (user ids) are written as strings, like json does
+        orjson = backend('orjson')
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return backend('orjson').loads(data)
+
+
+class MsgpackSerializer:
+    name = 'msgpack'
+
+    def dumps(self, obj):
+        return backend('msgpack').packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return backend('msgpack').unpackb(data, raw=False, strict_map_key=False)
+
+
+SERIALIZERS = {'json': JsonSerializer, 'orjson': OrjsonSerializer, 'msgpack': MsgpackSerializer}
+
+
+def get_serializer(name=None):
+    name = name or os.getenv('MAFIA_SERIALIZER', 'json')
+    if name not in AVAILABLE:
+        print(f"Serializer {name} is not available, using json")
+        name = 'json'
+    return SERIALIZERS[name]()
+
+
+default_serializer = get_serializer()
+
+
+def decode(data):
+    # JSON documents start with '{' or '[' (maybe after whitespace), anything else is msgpack
+    if data.lstrip()[:1] in (b'{', b'['):
+        return backend('orjson').loads(data) if 'orjson' in AVAILABLE else json.loads(data)
+    if 'msgpack' not in AVAILABLE:
+        raise ValueError("msgpack file found but msgpack is not installed")
+    return MsgpackSerializer().loads(data)
+
+
+def type_keys(kind, payload):
+    records = payload if isinstance(payload, list) else [payload]
+    for record in records:
+        for field in SCHEMAS[kind]:
+            mapping = record.get(field)
+            # msgpack keeps int keys, only text formats need converting
+            if mapping and isinstance(next(iter(mapping)), str):
+                record[field] = {int(key): value for key, value in mapping.items()}
+    return payload
+
+
+def unwrap(kind, document):
+    # Version 0 files are the bare object, newer ones carry the envelope
+    if isinstance(document, dict) and 'schema_version' in document:
+        if document['schema_version'] > SCHEMA_VERSION:
+            raise ValueError(f"{kind} file has schema version {document['schema_version']}, "
+                             f"this bot reads up to {SCHEMA_VERSION}")
+        payload = document['data']
+    else:
+        payload = document
+    return type_keys(kind, payload)
+
+
+def dumps(kind, payload, serializer=None):
+    serializer = serializer or default_serializer
+    return serializer.dumps({'schema_version': SCHEMA_VERSION, 'kind': kind, 'data': payload})
+
+
+def loads(kind, data):
+    return unwrap(kind, decode(data))
+
+
+def dump_file(path, kind, payload, serializer=None):
+    # Written aside and renamed, a crash never leaves half a file. Every
+    # writer gets its own temporary file, so concurrent writes of one path
+    # don't trip over each other; the last rename wins.
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data = dumps(kind, payload, serializer)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_file(path, kind, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'rb') as f:
+        return loads(kind, f.read())
@@ -0,0 +1,638 @@
+"""Where game state lives, and how bot nodes share it.
+
+Every game is a snapshot, the journal events written after it and an entry
+in the set of live chats. FileStore keeps them in data/ (journal.py) for a
+single bot process, the default. SQLiteStore (one database file, for
+nodes on the same host) and RedisStore (any Redis server, for nodes on
+different hosts) are shared: several bot processes use them at once, each
+driving the chats it holds a lease on (cluster.py). The store is chosen
+with MAFIA_STORE:
+
+    MAFIA_STORE=sqlite:///data/mafia.db
+    MAFIA_STORE=redis://10.0.0.5:6379/0
+
+Every store has the methods for game state:
+
+    journal(chat_id, persist)           object with GameJournal's methods
+    load_game(chat_id)                  (snapshot or None, events after it)
+    save_snapshot(chat_id, data)        the events before it are archived
+    append_events(chat_id, events)
+    set_live(chat_id, live), live_chats()
+
+and for the players:
+
+    load_user(user_id)                  profile dict or None
+    add_game_result(user_id, won, reward)  the profile after adding, atomic
+    archive_game(chat_id, record)       appends to the chat's game history
+    reachability(user_id)               entry of a user we can't DM, or None
+    set_reachability(user_id, entry)    None removes the entry
+    unreachable_users()                 {user_id: entry} of every user we can't DM
+
+The shared ones also have what the nodes coordinate with:
+
+    orphaned_chats()                    live chats nobody holds a lease on
+    acquire_lease(name, ttl)            True if free, expired or ours already
+    renew_leases(names, ttl)            the names that are still ours
+    release_lease(name), lease_holder(name)
+    heartbeat(load, ttl), nodes(), remove_node()
+    push_update(node, payload), pop_updates(timeout), take_inbox(node)
+
+Writes of a chat's state by a node that doesn't hold the chat's lease
+raise LeaseLost, so a node cut off from the others can't overwrite a game
+that its new owner is already driving.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from journal import DATA_DIR, GameJournal, LiveGameIndex, journal_path, read_events, read_snapshot, snapshot_path
+from serializer import dump_file, dumps, load_file, loads
+
+KEY_PREFIX = 'mafia:'  # Redis keys, so one server can hold other data too
+INBOX_POLL_INTERVAL = 0.05  # seconds between inbox checks of SQLiteStore.pop_updates
+INBOX_BATCH = 100  # updates taken from an inbox at once
+USER_LOCK_STRIPES = 64  # FileStore: locks shared out over user ids for profile updates
+PROFILE_FIELDS = ('games_played', 'games_won', 'total_money')
+
+
+class LeaseLost(Exception):
+    def __init__(self, chat_id):
+        super().__init__(f"lease of chat {chat_id} is held by another node")
+        self.chat_id = chat_id
+
+
+def lease_name(chat_id):
+    return f"chat:{chat_id}"
+
+
+def encode_events(events):
+    return [json.dumps(event, ensure_ascii=False, separators=(',', ':')) for event in events]
+
+
+class StoreJournal:
+    # GameJournal's methods for a shared store; snapshots archive the events there
+    def __init__(self, store, chat_id, persist=True):
+        self.store = store
+        self.chat_id = chat_id
+        self.persist = persist
+
+    def append_events(self, events):
+        if not self.persist or not events:
+            return
+        now = time.time()
+        for event in events:
+            event.setdefault('ts', now)
+        self.store.append_events(self.chat_id, events)
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileStore:
+    # data/ of a single process; the process lock (handover.py) stands in
+    # for leases, so it has nothing to coordinate nodes with
+    shared = False
+
+    def __init__(self, data_dir=DATA_DIR, node=None):
+        self.data_dir = data_dir
+        self.node = node
+        self.index = LiveGameIndex(data_dir)
+        self.user_locks = [threading.Lock() for _ in range(USER_LOCK_STRIPES)]
+        self.unreachable = None  # {user_id: entry} from data/reachability.json, read on first use
+        self.reachability_lock = threading.Lock()
+
+    def journal(self, chat_id, persist=True):
+        return GameJournal(chat_id, self.data_dir, persist=persist)
+
+    def load_game(self, chat_id):
+        data = read_snapshot(snapshot_path(chat_id, self.data_dir))
+        if data is None:
+            return None, []
+        return data, read_events(journal_path(chat_id, self.data_dir), data.get('journal_seq', 0))
+
+    def save_snapshot(self, chat_id, data):
+        # The journal file is compacted by the game's GameJournal
+        dump_file(snapshot_path(chat_id, self.data_dir), 'game', data)
+
+    def append_events(self, chat_id, events):
+        journal = GameJournal(chat_id, self.data_dir)
+        journal.append_events(events)
+        journal.close()
+
+    def set_live(self, chat_id, live):
+        self.index.update(chat_id, live)
+
+    def live_chats(self):
+        return self.index.chat_ids()
+
+    def user_path(self, user_id):
+        return os.path.join(self.data_dir, 'users', f"{user_id}.json")
+
+    def load_user(self, user_id):
+        return load_file(self.user_path(user_id), 'user')
+
+    def add_game_result(self, user_id, won, reward):
+        # Games in different chats can reward the same user at once; the
+        # file is read again under the user's lock so no result is lost
+        with self.user_locks[user_id % USER_LOCK_STRIPES]:
+            profile = self.load_user(user_id) or {}
+            profile = {
+                'games_played': profile.get('games_played', 0) + 1,
+                'games_won': profile.get('games_won', 0) + (1 if won else 0),
+                'total_money': profile.get('total_money', 0) + reward
+            }
+            dump_file(self.user_path(user_id), 'user', profile)
+        return profile
+
+    def archive_game(self, chat_id, record):
+        # Only the chat's own effect lane writes its history
+        path = os.path.join(self.data_dir, f"game_history_{chat_id}.json")
+        history = load_file(path, 'history', [])
+        history.append(record)
+        dump_file(path, 'history', history)
+
+    def unreachable_entries(self):
+        # Called with the lock held
+        if self.unreachable is None:
+            document = load_file(os.path.join(self.data_dir, 'reachability.json'), 'reachability')
+            self.unreachable = document['unreachable'] if document else {}
+        return self.unreachable
+
+    def reachability(self, user_id):
+        with self.reachability_lock:
+            entry = self.unreachable_entries().get(user_id)
+            return dict(entry) if entry else None
+
+    def set_reachability(self, user_id, entry):
+        # The whole file is written, but only when a user comes, goes or is probed
+        with self.reachability_lock:
+            users = self.unreachable_entries()
+            if entry is not None:
+                users[user_id] = dict(entry)
+            elif users.pop(user_id, None) is None:
+                return
+            dump_file(os.path.join(self.data_dir, 'reachability.json'), 'reachability', {'unreachable': users})
+
+    def unreachable_users(self):
+        with self.reachability_lock:
+            return {user_id: dict(entry) for user_id, entry in self.unreachable_entries().items()}
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS events (chat_id INTEGER, seq INTEGER, data TEXT NOT NULL, PRIMARY KEY (chat_id, seq));
+CREATE TABLE IF NOT EXISTS live (chat_id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, node TEXT NOT NULL, expires REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS nodes (node TEXT PRIMARY KEY, load INTEGER NOT NULL, expires REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS inbox (id INTEGER PRIMARY KEY AUTOINCREMENT, node TEXT NOT NULL, payload TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS inbox_node ON inbox (node, id);
+CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, games_played INTEGER NOT NULL, games_won INTEGER NOT NULL, total_money INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS unreachable (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+"""
+
+
+class SQLiteStore:
+    # One database file shared by the nodes of one host; WAL lets them read
+    # while one writes, BEGIN IMMEDIATE makes every check-and-write atomic
+    shared = True
+
+    def __init__(self, path, node=None):
+        self.path = path
+        self.node = node
+        self.local = threading.local()  # a connection per thread
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db().executescript(SQLITE_SCHEMA)
+
+    def db(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        db = self.db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def check_lease(self, db, chat_id):
+        row = db.execute('SELECT node FROM leases WHERE name = ? AND expires > ?',
+                         (lease_name(chat_id), time.time())).fetchone()
+        if row is None or row[0] != self.node:
+            raise LeaseLost(chat_id)
+
+    def journal(self, chat_id, persist=True):
+        return StoreJournal(self, chat_id, persist)
+
+    def load_game(self, chat_id):
+        db = self.db()
+        row = db.execute('SELECT data FROM snapshots WHERE chat_id = ?', (chat_id,)).fetchone()
+        if row is None:
+            return None, []
+        data = loads('game', row[0])
+        rows = db.execute('SELECT data FROM events WHERE chat_id = ? AND seq > ? ORDER BY seq',
+                          (chat_id, data.get('journal_seq', 0))).fetchall()
+        return data, [json.loads(text) for text, in rows]
+
+    def save_snapshot(self, chat_id, data):
+        with self.transaction() as db:
+            self.check_lease(db, chat_id)
+            # The events stay as the archive; loading skips the ones the snapshot contains
+            db.execute('INSERT OR REPLACE INTO snapshots (chat_id, data) VALUES (?, ?)', (chat_id, dumps('game', data)))
+
+    def append_events(self, chat_id, events):
+        with self.transaction() as db:
+            self.check_lease(db, chat_id)
+            db.executemany('INSERT OR REPLACE INTO events (chat_id, seq, data) VALUES (?, ?, ?)',
+                           [(chat_id, event['seq'], text) for event, text in zip(events, encode_events(events))])
+
+    def set_live(self, chat_id, live):
+        with self.transaction() as db:
+            if live:
+                db.execute('INSERT OR IGNORE INTO live (chat_id) VALUES (?)', (chat_id,))
+            else:
+                db.execute('DELETE FROM live WHERE chat_id = ?', (chat_id,))
+
+    def live_chats(self):
+        return [chat_id for chat_id, in self.db().execute('SELECT chat_id FROM live ORDER BY chat_id')]
+
+    def orphaned_chats(self):
+        # Live chats nobody holds a lease on
+        rows = self.db().execute(
+            "SELECT chat_id FROM live WHERE 'chat:' || chat_id NOT IN "
+            "(SELECT name FROM leases WHERE expires > ?) ORDER BY chat_id", (time.time(),)
+        )
+        return [chat_id for chat_id, in rows]
+
+    def acquire_lease(self, name, ttl):
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute('SELECT node, expires FROM leases WHERE name = ?', (name,)).fetchone()
+            if row and row[0] != self.node and row[1] > now:
+                return False
+            db.execute('INSERT OR REPLACE INTO leases (name, node, expires) VALUES (?, ?, ?)', (name, self.node, now + ttl))
+            return True
+
+    def renew_leases(self, names, ttl):
+        now = time.time()
+        kept = set()
+        with self.transaction() as db:
+            for name in names:
+                cursor = db.execute('UPDATE leases SET expires = ? WHERE name = ? AND node = ? AND expires > ?',
+                                    (now + ttl, name, self.node, now))
+                if cursor.rowcount:
+                    kept.add(name)
+        return kept
+
+    def release_lease(self, name):
+        with self.transaction() as db:
+            db.execute('DELETE FROM leases WHERE name = ? AND node = ?', (name, self.node))
+
+    def lease_holder(self, name):
+        row = self.db().execute('SELECT node FROM leases WHERE name = ? AND expires > ?', (name, time.time())).fetchone()
+        return row[0] if row else None
+
+    def heartbeat(self, load, ttl):
+        with self.transaction() as db:
+            db.execute('INSERT OR REPLACE INTO nodes (node, load, expires) VALUES (?, ?, ?)',
+                       (self.node, load, time.time() + ttl))
+
+    def nodes(self):
+        rows = self.db().execute('SELECT node, load FROM nodes WHERE expires > ?', (time.time(),))
+        return dict(rows.fetchall())
+
+    def remove_node(self):
+        with self.transaction() as db:
+            db.execute('DELETE FROM nodes WHERE node = ?', (self.node,))
+
+    def push_update(self, node, payload):
+        with self.transaction() as db:
+            db.execute('INSERT INTO inbox (node, payload) VALUES (?, ?)', (node, payload))
+
+    def pop_updates(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.transaction() as db:
+                rows = db.execute('SELECT id, payload FROM inbox WHERE node = ? ORDER BY id LIMIT ?',
+                                  (self.node, INBOX_BATCH)).fetchall()
+                if rows:
+                    db.execute('DELETE FROM inbox WHERE node = ? AND id <= ?', (self.node, rows[-1][0]))
+                    return [payload for _, payload in rows]
+            if time.monotonic() >= deadline:
+                return []
+            time.sleep(INBOX_POLL_INTERVAL)
+
+    def take_inbox(self, node):
+        # Updates forwarded to a node that died, this node routes them on
+        with self.transaction() as db:
+            db.execute('UPDATE inbox SET node = ? WHERE node = ?', (self.node, node))
+
+    def load_user(self, user_id):
+        row = self.db().execute('SELECT games_played, games_won, total_money FROM users WHERE user_id = ?',
+                                (user_id,)).fetchone()
+        return dict(zip(PROFILE_FIELDS, row)) if row else None
+
+    def add_game_result(self, user_id, won, reward):
+        with self.transaction() as db:
+            db.execute(
+                'INSERT INTO users (user_id, games_played, games_won, total_money) VALUES (?, 1, ?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET games_played = games_played + 1, '
+                'games_won = games_won + excluded.games_won, total_money = total_money + excluded.total_money',
+                (user_id, 1 if won else 0, reward)
+            )
+            row = db.execute('SELECT games_played, games_won, total_money FROM users WHERE user_id = ?',
+                             (user_id,)).fetchone()
+        return dict(zip(PROFILE_FIELDS, row))
+
+    def archive_game(self, chat_id, record):
+        with self.transaction() as db:
+            db.execute('INSERT INTO history (chat_id, data) VALUES (?, ?)', (chat_id, dumps('history', record)))
+
+    def reachability(self, user_id):
+        row = self.db().execute('SELECT data FROM unreachable WHERE user_id = ?', (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_reachability(self, user_id, entry):
+        with self.transaction() as db:
+            if entry is None:
+                db.execute('DELETE FROM unreachable WHERE user_id = ?', (user_id,))
+            else:
+                db.execute('INSERT OR REPLACE INTO unreachable (user_id, data) VALUES (?, ?)', (user_id, json.dumps(entry)))
+
+    def unreachable_users(self):
+        rows = self.db().execute('SELECT user_id, data FROM unreachable').fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    # Just enough of the Redis protocol (RESP2) for RedisStore. Commands go
+    # out as arrays of bulk strings; replies come back as str (status), int,
+    # bytes, None or lists. One connection per thread, since WATCH and
+    # MULTI belong to a connection.
+    def __init__(self, host='localhost', port=6379, db=0, timeout=10):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = self.local.connection = (sock, sock.makefile('rb'))
+            if self.db:
+                self.execute('SELECT', self.db)
+        return connection
+
+    def execute(self, *args):
+        sock, reader = self.connection()
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        try:
+            sock.sendall(b''.join(parts))
+            return self.read_reply(reader)
+        except (OSError, ValueError):
+            # The connection is in an unknown state, the next command opens a new one
+            self.close()
+            raise
+
+    def read_reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RespError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self.read_reply(reader) for _ in range(length)]
+        raise ValueError(f"Unexpected Redis reply {line!r}")
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            self.local.connection = None
+            connection[0].close()
+
+
+class RedisStore:
+    # Keys: game:<chat> snapshot, journal:<chat> list of events (archived to
+    # journal:<chat>:<first seq> by the next snapshot), live set of
+    # chat ids, lease:<name> holder with a TTL, node:<node> load with a TTL,
+    # nodes set of node ids, inbox:<node> list of forwarded updates,
+    # user:<user> profile hash, history:<chat> list of finished games and
+    # unreachable hash of the users we can't DM.
+    # Lease checks use WATCH/MULTI, which any Redis-protocol server has.
+    shared = True
+
+    def __init__(self, host='localhost', port=6379, db=0, node=None):
+        self.client = RespClient(host, port, db)
+        self.node = node
+
+    def key(self, *parts):
+        return KEY_PREFIX + ':'.join(str(part) for part in parts)
+
+    def holds(self, name):
+        # WATCHes the lease and checks it is ours; the caller EXECs or UNWATCHes
+        key = self.key('lease', name)
+        self.client.execute('WATCH', key)
+        if self.client.execute('GET', key) != self.node.encode('utf-8'):
+            self.client.execute('UNWATCH')
+            return False
+        return True
+
+    def transaction(self, *commands):
+        # MULTI/EXEC after holds(); None if the lease changed meanwhile
+        self.client.execute('MULTI')
+        for command in commands:
+            self.client.execute(*command)
+        return self.client.execute('EXEC')
+
+    def fenced(self, chat_id, *commands):
+        # Renewing the lease also aborts the transaction; only a lease that
+        # is no longer ours fails the write
+        while self.holds(lease_name(chat_id)):
+            if self.transaction(*commands) is not None:
+                return
+        raise LeaseLost(chat_id)
+
+    def journal(self, chat_id, persist=True):
+        return StoreJournal(self, chat_id, persist)
+
+    def load_game(self, chat_id):
+        blob = self.client.execute('GET', self.key('game', chat_id))
+        if blob is None:
+            return None, []
+        data = loads('game', blob)
+        after_seq = data.get('journal_seq', 0)
+        events = [json.loads(line) for line in self.client.execute('LRANGE', self.key('journal', chat_id), 0, -1)]
+        return data, [event for event in events if event['seq'] > after_seq]
+
+    def save_snapshot(self, chat_id, data):
+        # Only this node appends to the chat's journal, so its first event can't change before EXEC
+        commands = [('SET', self.key('game', chat_id), dumps('game', data))]
+        first = self.client.execute('LINDEX', self.key('journal', chat_id), 0)
+        if first is not None:
+            archive = self.key('journal', chat_id, json.loads(first)['seq'])
+            commands.append(('RENAME', self.key('journal', chat_id), archive))
+        self.fenced(chat_id, *commands)
+
+    def append_events(self, chat_id, events):
+        self.fenced(chat_id, ('RPUSH', self.key('journal', chat_id), *encode_events(events)))
+
+    def set_live(self, chat_id, live):
+        self.client.execute('SADD' if live else 'SREM', self.key('live'), chat_id)
+
+    def live_chats(self):
+        return sorted(int(chat_id) for chat_id in self.client.execute('SMEMBERS', self.key('live')))
+
+    def orphaned_chats(self):
+        chats = self.live_chats()
+        if not chats:
+            return []
+        holders = self.client.execute('MGET', *[self.key('lease', lease_name(chat_id)) for chat_id in chats])
+        return [chat_id for chat_id, holder in zip(chats, holders) if holder is None]
+
+    def acquire_lease(self, name, ttl):
+        key = self.key('lease', name)
+        if self.client.execute('SET', key, self.node, 'NX', 'PX', int(ttl * 1000)) == 'OK':
+            return True
+        # Ours already (a restart with the same node id): renew it
+        return name in self.renew_leases([name], ttl)
+
+    def renew_leases(self, names, ttl):
+        kept = set()
+        for name in names:
+            if self.holds(name) and self.transaction(('PEXPIRE', self.key('lease', name), int(ttl * 1000))) is not None:
+                kept.add(name)
+        return kept
+
+    def release_lease(self, name):
+        if self.holds(name):
+            self.transaction(('DEL', self.key('lease', name)))
+
+    def lease_holder(self, name):
+        holder = self.client.execute('GET', self.key('lease', name))
+        return holder.decode('utf-8') if holder is not None else None
+
+    def heartbeat(self, load, ttl):
+        self.client.execute('SET', self.key('node', self.node), load, 'PX', int(ttl * 1000))
+        self.client.execute('SADD', self.key('nodes'), self.node)
+
+    def nodes(self):
+        names = sorted(name.decode('utf-8') for name in self.client.execute('SMEMBERS', self.key('nodes')))
+        if not names:
+            return {}
+        node_loads = self.client.execute('MGET', *[self.key('node', name) for name in names])
+        return {name: int(load) for name, load in zip(names, node_loads) if load is not None}
+
+    def remove_node(self):
+        self.client.execute('DEL', self.key('node', self.node))
+
+    def push_update(self, node, payload):
+        self.client.execute('RPUSH', self.key('inbox', node), payload)
+
+    def pop_updates(self, timeout):
+        key = self.key('inbox', self.node)
+        reply = self.client.execute('BLPOP', key, timeout)
+        if reply is None:
+            return []
+        payloads = [reply[1]]
+        while len(payloads) < INBOX_BATCH:
+            payload = self.client.execute('LPOP', key)
+            if payload is None:
+                break
+            payloads.append(payload)
+        return [payload.decode('utf-8') for payload in payloads]
+
+    def take_inbox(self, node):
+        # Updates forwarded to a node that died, this node routes them on
+        while self.client.execute('RPOPLPUSH', self.key('inbox', node), self.key('inbox', self.node)) is not None:
+            pass
+        self.client.execute('SREM', self.key('nodes'), node)
+
+    def load_user(self, user_id):
+        fields = self.client.execute('HGETALL', self.key('user', user_id))
+        if not fields:
+            return None
+        profile = dict(zip(fields[::2], fields[1::2]))
+        return {field: int(profile.get(field.encode('utf-8'), 0)) for field in PROFILE_FIELDS}
+
+    def add_game_result(self, user_id, won, reward):
+        # HINCRBY adds atomically whichever node rewards the user
+        key = self.key('user', user_id)
+        replies = self.transaction(
+            ('HINCRBY', key, 'games_played', 1),
+            ('HINCRBY', key, 'games_won', 1 if won else 0),
+            ('HINCRBY', key, 'total_money', reward)
+        )
+        return dict(zip(PROFILE_FIELDS, replies))
+
+    def archive_game(self, chat_id, record):
+        self.client.execute('RPUSH', self.key('history', chat_id), dumps('history', record))
+
+    def reachability(self, user_id):
+        entry = self.client.execute('HGET', self.key('unreachable'), user_id)
+        return json.loads(entry) if entry is not None else None
+
+    def set_reachability(self, user_id, entry):
+        if entry is None:
+            self.client.execute('HDEL', self.key('unreachable'), user_id)
+        else:
+            self.client.execute('HSET', self.key('unreachable'), user_id, json.dumps(entry))
+
+    def unreachable_users(self):
+        fields = self.client.execute('HGETALL', self.key('unreachable'))
+        return {int(user_id): json.loads(entry) for user_id, entry in zip(fields[::2], fields[1::2])}
+
+
+def open_store(url=None, node=None):
+    # MAFIA_STORE: empty for data/, sqlite:///relative/path.db, sqlite:////absolute/path.db or redis://host:port/db
+    url = os.getenv('MAFIA_STORE', '') if url is None else url
+    if not url:
+        return FileStore(node=node)
+    parts = urlsplit(url)
+    if parts.scheme == 'sqlite':
+        return SQLiteStore(parts.path[1:], node)
+    if parts.scheme == 'redis':
+        return RedisStore(parts.hostname or 'localhost', parts.port or 6379, int(parts.path.strip('/') or 0), node)
+    raise ValueError(f"Unknown MAFIA_STORE {url!r}")
@@ -0,0 +1,113 @@
+"""Phase timers of every game in the process, run from one thread.
+
+threading.Timer costs a thread per scheduled phase, so a few hundred
+running games meant a few hundred mostly sleeping threads, plus one more
+started and dropped on every phase change. PhaseScheduler keeps the
+deadlines in a heap and fires them from a single thread. VirtualScheduler
+has no thread and no real time: advance() moves its clock forward and
+runs whatever fell due, which is how the soak test plays hours of games in
+a few minutes (benchmarks/bench_soak.py).
+"""
+import heapq
+import itertools
+import threading
+import time
+
+
+class TimerHandle:
+    __slots__ = ('deadline', 'seq', 'func', 'args', 'cancelled')
+
+    def __init__(self, deadline, seq, func, args):
+        self.deadline = deadline
+        self.seq = seq  # keeps timers with the same deadline in the order they were set
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+
+class PhaseScheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)  # notified when a timer is set
+        self.thread = None
+
+    def call_later(self, delay, func, *args):
+        handle = TimerHandle(self.clock() + delay, next(self.counter), func, args)
+        with self.lock:
+            heapq.heappush(self.heap, handle)
+            self.start_thread()
+            self.wakeup.notify()
+        return handle
+
+    def cancel(self, handle):
+        # Stays in the heap until its deadline and is dropped then; phases
+        # are short, so the heap never holds more than a few minutes of them
+        handle.cancelled = True
+
+    def pending(self):
+        with self.lock:
+            return sum(1 for handle in self.heap if not handle.cancelled)
+
+    def start_thread(self):
+        # Called with the lock held
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='phase-timers', daemon=True)
+            self.thread.start()
+
+    def pop_due(self, until):
+        # Called with the lock held: the next timer due by `until`, None if there is none
+        while self.heap and self.heap[0].cancelled:
+            heapq.heappop(self.heap)
+        if self.heap and self.heap[0].deadline <= until:
+            return heapq.heappop(self.heap)
+        return None
+
+    def fire(self, handle):
+        try:
+            handle.func(*handle.args)
+        except Exception as e:
+            print(f"Error in phase timer: {e}")
+
+    def run(self):
+        while True:
+            with self.lock:
+                handle = self.pop_due(self.clock())
+                while handle is None:
+                    self.wakeup.wait(self.heap[0].deadline - self.clock() if self.heap else None)
+                    handle = self.pop_due(self.clock())
+            # Outside the lock, the timeout may set the next phase's timer
+            self.fire(handle)
+
+
+class VirtualScheduler(PhaseScheduler):
+    # Timers on a clock that only moves when advance() is called (soak test)
+    def __init__(self, start=0.0):
+        self.now = start
+        super().__init__(clock=lambda: self.now)
+
+    def start_thread(self):
+        pass
+
+    def next_deadline(self):
+        with self.lock:
+            while self.heap and self.heap[0].cancelled:
+                heapq.heappop(self.heap)
+            return self.heap[0].deadline if self.heap else None
+
+    def advance(self, seconds):
+        # Runs every timer due within `seconds`, in deadline order, each at its own deadline
+        until = self.now + seconds
+        while True:
+            with self.lock:
+                handle = self.pop_due(until)
+            if handle is None:
+                break
+            self.now = max(self.now, handle.deadline)
+            self.fire(handle)
+        self.now = until
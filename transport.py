@@ -0,0 +1,200 @@
+"""Bot API transport: a larger keep-alive pool, per-method timeouts, bounded
+retries with jitter and a circuit breaker.
+
+python-telegram-bot sends every API call through a Request object;
+ResilientRequest is a drop-in replacement built by create_bot(). While the
+breaker is open, calls fail immediately instead of waiting on a degraded
+API, and outgoing messages are queued and sent once the API recovers.
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+
+from telegram import Bot
+from telegram.error import TelegramError, NetworkError, RetryAfter, BadRequest
+from telegram.utils.request import Request
+
+try:
+    from telegram.vendor.ptb_urllib3.urllib3.util.timeout import Timeout
+    from telegram.vendor.ptb_urllib3.urllib3.exceptions import ConnectTimeoutError, NewConnectionError, MaxRetryError
+except ImportError:  # python-telegram-bot installed against upstream urllib3
+    from urllib3.util.timeout import Timeout
+    from urllib3.exceptions import ConnectTimeoutError, NewConnectionError, MaxRetryError
+
+POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', 32))
+CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', 3.0))
+READ_TIMEOUT = float(os.getenv('TELEGRAM_READ_TIMEOUT', 10.0))
+MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', 2))
+RETRY_BACKOFF = 0.3  # seconds, doubled per attempt, full jitter
+MAX_RETRY_AFTER = 10  # longest flood-wait we sleep through instead of failing
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('TELEGRAM_BREAKER_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('TELEGRAM_BREAKER_RESET', 30.0))
+DEFERRED_QUEUE_SIZE = 1000
+
+# (connect, read) timeouts per Bot API method; anything missing uses the defaults
+METHOD_TIMEOUTS = {
+    'sendMessage': (CONNECT_TIMEOUT, 8.0),
+    'editMessageReplyMarkup': (CONNECT_TIMEOUT, 5.0),
+    'answerCallbackQuery': (CONNECT_TIMEOUT, 3.0),
+    'deleteMessage': (CONNECT_TIMEOUT, 3.0),
+    'getChatMember': (CONNECT_TIMEOUT, 5.0),
+}
+
+# Safe to repeat after a read timeout, the request may already have been applied
+IDEMPOTENT_METHODS = {
+    'getMe', 'getUpdates', 'getChat', 'getChatMember', 'deleteMessage',
+    'editMessageReplyMarkup', 'editMessageText', 'answerCallbackQuery',
+}
+
+# Sent later instead of dropped while the breaker is open
+DEFERRABLE_METHODS = {'sendMessage'}
+
+
+class CircuitOpenError(NetworkError):
+    pass
+
+
+class CircuitBreaker:
+    # closed -> open after `failure_threshold` consecutive failures;
+    # open -> half-open after `reset_timeout`, where one probe call decides
+    # whether to close again or stay open for another period
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            was_closed = self.state == 'closed'
+            self.state = 'closed'
+            self.failures = 0
+            return not was_closed
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class ResilientRequest(Request):
+    __slots__ = ('breaker', 'deferred', 'stats', '_flushing')
+
+    def __init__(self, con_pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 breaker=None, **kwargs):
+        super().__init__(con_pool_size=con_pool_size, connect_timeout=connect_timeout,
+                         read_timeout=read_timeout, **kwargs)
+        self.breaker = breaker or CircuitBreaker()
+        self.deferred = deque(maxlen=DEFERRED_QUEUE_SIZE)
+        self.stats = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0, 'deferred': 0}
+        self._flushing = threading.Lock()
+
+    def _request_wrapper(self, *args, **kwargs):
+        # args are (http_method, url, ...); apply the per-method timeouts unless
+        # the caller asked for a specific read timeout (getUpdates long polling)
+        api_method = str(args[1]).rsplit('/', 1)[-1]
+        connect_timeout, read_timeout = METHOD_TIMEOUTS.get(api_method, (self._connect_timeout, None))
+        if kwargs.get('timeout') is None and read_timeout is not None:
+            kwargs['timeout'] = Timeout(connect=connect_timeout, read=read_timeout)
+        # Retries are ours: urllib3's own would multiply the connect timeout
+        # and hide the connect error behind a MaxRetryError
+        kwargs.setdefault('retries', False)
+        return super()._request_wrapper(*args, **kwargs)
+
+    def post(self, url, data, timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        self.stats['calls'] += 1
+
+        if not self.breaker.allow():
+            if api_method in DEFERRABLE_METHODS:
+                self.deferred.append((url, dict(data or {}), timeout))
+                self.stats['deferred'] += 1
+                return True
+            self.stats['rejected'] += 1
+            raise CircuitOpenError(f"Telegram API unavailable, {api_method} not sent")
+
+        attempt = 0
+        while True:
+            try:
+                result = super().post(url, data, timeout=timeout)
+            except RetryAfter as e:
+                # Flood control is the API working as intended, not an outage
+                self.breaker.record_success()
+                if attempt >= MAX_RETRIES or e.retry_after > MAX_RETRY_AFTER:
+                    raise
+                time.sleep(e.retry_after)
+            except BadRequest:
+                # The API answered, only this request was wrong
+                self.breaker.record_success()
+                raise
+            except NetworkError as e:
+                if attempt >= MAX_RETRIES or not self.is_retryable(api_method, e):
+                    self.stats['failures'] += 1
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+            except TelegramError:
+                # Unauthorized, ChatMigrated, ...: also an answer from a working API
+                self.breaker.record_success()
+                raise
+            else:
+                if self.breaker.record_success() and self.deferred:
+                    # Just recovered, deliver what piled up without blocking this caller
+                    threading.Thread(target=self.flush_deferred, daemon=True).start()
+                return result
+            attempt += 1
+            self.stats['retries'] += 1
+
+    @staticmethod
+    def is_retryable(api_method, error):
+        # A timeout after the request was sent may already have delivered a
+        # message, so those are only retried when repeating them is harmless
+        if api_method in IDEMPOTENT_METHODS:
+            return True
+        cause = error.__cause__
+        if isinstance(cause, MaxRetryError):
+            cause = cause.reason
+        return isinstance(cause, (ConnectTimeoutError, NewConnectionError))
+
+    def flush_deferred(self):
+        if not self._flushing.acquire(blocking=False):
+            return
+        try:
+            while self.deferred and self.breaker.allow():
+                url, data, timeout = self.deferred.popleft()
+                try:
+                    super().post(url, data, timeout=timeout)
+                    self.breaker.record_success()
+                except BadRequest as e:
+                    print(f"Dropping deferred {url.rsplit('/', 1)[-1]}: {e}")
+                except NetworkError as e:
+                    self.breaker.record_failure()
+                    self.deferred.appendleft((url, data, timeout))
+                    print(f"Error flushing deferred {url.rsplit('/', 1)[-1]}: {e}")
+                    break
+                except Exception as e:
+                    print(f"Dropping deferred {url.rsplit('/', 1)[-1]}: {e}")
+        finally:
+            self._flushing.release()
+
+
+def create_bot(token, base_url=None, **request_kwargs):
+    return Bot(token, base_url=base_url, request=ResilientRequest(**request_kwargs))